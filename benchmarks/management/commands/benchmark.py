@@ -0,0 +1,74 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import CommandError, NoArgsCommand
+
+from ...suite import BENCHMARKS, Server, compare, metadata, run_suite
+
+
+class Command(NoArgsCommand):
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('-b', '--benchmark', action='append', dest='names',
+                    choices=[name for name, _ in BENCHMARKS],
+                    help='Run only this benchmark. May be repeated.'),
+        make_option('-c', '--concurrency', type='int', default=50,
+                    help='The number of concurrent clients.'),
+        make_option('-d', '--duration', type='float', default=5,
+                    help='The duration of timed benchmarks in seconds.'),
+        make_option('-s', '--sizes', default='8,16',
+                    help='Comma-separated sizes of Game of Life grids.'),
+        make_option('-n', '--steps', type='int', default=20,
+                    help='The number of Game of Life steps.'),
+        make_option('-u', '--url',
+                    help='Benchmark this server instead of starting one.'),
+        make_option('-o', '--output',
+                    help='Write results to this JSON file.'),
+        make_option('--compare', metavar='BASELINE',
+                    help='Compare results to this JSON file.'),
+        make_option('-t', '--threshold', type='float', default=0.1,
+                    help='Relative change reported as a regression.'),
+    )
+    help = 'Benchmarks the asyncio server with WSGI and WebSocket clients.'
+
+    def handle_noargs(self, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)['results']
+
+        server = None
+        url = options['url']
+        if url is None:
+            server = Server()
+            server.start()
+            url = server.url
+        try:
+            results = run_suite(
+                url, options['names'], options['concurrency'],
+                options['duration'],
+                [int(size) for size in options['sizes'].split(',')],
+                options['steps'], self.stdout)
+        finally:
+            if server is not None:
+                server.stop()
+
+        self.stdout.write("\n")
+        for case, metrics in sorted(results.items()):
+            for metric, value in sorted(metrics.items()):
+                self.stdout.write("{:20} {:>12} {:12.2f}\n".format(
+                    case, metric, value))
+
+        if options['output']:
+            report = {'metadata': metadata(), 'results': results}
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=4, sort_keys=True)
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            for case, metric, reference, value, change in regressions:
+                self.stdout.write(
+                    "Regression: {} {} {:.2f} -> {:.2f} ({:+.0%})\n".format(
+                        case, metric, reference, value, change))
+            if regressions:
+                raise CommandError("{} regressions.".format(len(regressions)))
@@ -0,0 +1,54 @@
+import resource
+from optparse import make_option
+
+import asyncio
+
+from django.core.management.base import CommandError, NoArgsCommand
+
+from ...suite import Server, footprint
+
+# Connections used to estimate the memory of a large server.
+PLAN = 100000
+
+
+class Command(NoArgsCommand):
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('-n', '--connections', default='1000,2000,5000',
+                    help='Comma-separated numbers of idle connections.'),
+        make_option('-c', '--concurrency', type='int', default=100,
+                    help='The number of concurrent handshakes.'),
+        make_option('-u', '--url',
+                    help='Measure this server instead of starting one.'),
+    )
+    help = 'Measures the memory used by idle WebSocket connections.'
+
+    def handle_noargs(self, **options):
+        counts = [int(count) for count in options['connections'].split(',')]
+        # The server process inherits the limit when it's started here.
+        limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if max(counts) + 100 > limit:
+            raise CommandError(
+                "{} connections exceed the limit on open files ({}). "
+                "Raise it with ulimit -n.".format(max(counts), limit))
+
+        server = None
+        url = options['url']
+        if url is None:
+            server = Server()
+            server.start()
+            url = server.url
+        try:
+            rows = asyncio.get_event_loop().run_until_complete(footprint(
+                url, counts, asyncio.get_event_loop(), self.stdout,
+                options['concurrency']))
+        except KeyError:
+            raise CommandError("The server doesn't report its memory.")
+        finally:
+            if server is not None:
+                server.stop()
+
+        # The last measure is the most accurate.
+        per_connection = rows[-1][2]
+        self.stdout.write("{} connections would use about {:.0f} MB.\n".format(
+            PLAN, (rows[0][1] + per_connection * PLAN) / 2 ** 20))
@@ -0,0 +1,296 @@
+import multiprocessing
+import platform
+import signal
+import time
+
+import aiohttp
+import asyncio
+import websockets
+
+import django
+from django.core.servers.basehttp import get_internal_wsgi_application
+
+from c10ktools.loadtest import LoadTest
+from c10ktools.monkey import run
+from c10ktools.stats import Histogram
+from gameoflife import client
+from gameoflife.protocol import SNAPSHOT
+
+
+# Metrics whose name ends with this suffix are rates: higher is better.
+# All other metrics are durations in milliseconds: lower is better.
+RATE = '/s'
+
+
+class Server:
+    """
+    Run the asyncio server in a child process on an ephemeral port.
+
+    Running it in a separate process prevents the benchmark clients from
+    competing with the server for the GIL.
+    """
+
+    def __init__(self, host='127.0.0.1'):
+        self.host = host
+
+    def start(self):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=serve, args=(self.host, writer))
+        self.process.start()
+        writer.close()
+        if not reader.poll(10):
+            self.process.terminate()
+            raise RuntimeError("Server didn't start")
+        self.port = reader.recv()
+        reader.close()
+        self.url = 'http://{}:{}'.format(self.host, self.port)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+
+def serve(host, notify):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stop = asyncio.Future(loop=loop)
+    loop.add_signal_handler(signal.SIGTERM, stop.set_result, None)
+    ready = lambda server: notify.send(server.sockets[0].getsockname()[1])
+    try:
+        run(host, 0, get_internal_wsgi_application(), loop, stop, ready)
+    finally:
+        loop.close()
+
+
+@asyncio.coroutine
+def repeat(operation, concurrency, duration, loop):
+    """
+    Run operation() in concurrency loops during duration seconds.
+
+    Return the number of operations per second and a histogram of their
+    durations.
+    """
+    histogram = Histogram()
+    deadline = loop.time() + duration
+
+    @asyncio.coroutine
+    def worker():
+        while loop.time() < deadline:
+            begin = loop.time()
+            yield from operation()
+            histogram.record(loop.time() - begin)
+
+    begin = loop.time()
+    yield from asyncio.gather(*[worker() for _ in range(concurrency)],
+                              loop=loop)
+    return histogram.count / (loop.time() - begin), histogram
+
+
+def latency(histogram):
+    """Convert a histogram of durations to metrics in milliseconds."""
+    return {
+        'p50 ms': histogram.percentile(50) * 1000,
+        'p95 ms': histogram.percentile(95) * 1000,
+        'p99 ms': histogram.percentile(99) * 1000,
+    }
+
+
+@asyncio.coroutine
+def bench_wsgi(base_url, concurrency, duration, loop, **options):
+    """Plain HTTP requests handled by Django through WSGIServerHttpProtocol."""
+    url = base_url + '/test/wsgi/'
+    connector = aiohttp.TCPConnector(loop=loop)
+
+    @asyncio.coroutine
+    def request():
+        response = yield from aiohttp.request(
+            'GET', url, connector=connector, loop=loop)
+        yield from response.read()
+        assert response.status == 200, response.status
+
+    try:
+        rate, histogram = yield from repeat(request, concurrency, duration, loop)
+    finally:
+        connector.close()
+    return dict(latency(histogram), **{'requests/s': rate})
+
+
+@asyncio.coroutine
+def bench_handshake(base_url, concurrency, duration, loop, **options):
+    """Opening and closing handshakes through WebSocketResponse."""
+    url = base_url.replace('http', 'ws') + '/test/ws/loopback/'
+
+    @asyncio.coroutine
+    def handshake():
+        ws = yield from websockets.connect(url, loop=loop)
+        yield from ws.close()
+
+    rate, histogram = yield from repeat(handshake, concurrency, duration, loop)
+    return dict(latency(histogram), **{'handshakes/s': rate})
+
+
+@asyncio.coroutine
+def bench_echo(base_url, concurrency, duration, loop, messages=1000,
+               **options):
+    """Round trips of small messages through an echo handler."""
+    url = base_url.replace('http', 'ws') + '/test/ws/loopback/'
+    test = LoadTest(url, concurrency, ramp=concurrency * 10,
+                    messages=messages, rate=0, size=16)
+    test.loop = loop
+    begin = loop.time()
+    yield from asyncio.gather(*[test.client(index, begin)
+                                for index in range(concurrency)], loop=loop)
+    if test.errors:
+        raise RuntimeError("Echo errors: {}".format(dict(test.errors)))
+    rate = test.received / (loop.time() - begin)
+    return dict(latency(test.round_trip_latency), **{'messages/s': rate})
+
+
+@asyncio.coroutine
+def bench_gameoflife(base_url, concurrency, duration, loop, size=16,
+                     steps=20, **options):
+    """Steps of a Game of Life played by one client per cell."""
+    client.BASE_URL = base_url.replace('http', 'ws')
+    yield from client.reset(size)
+    # The watcher receives one snapshot per step.
+    watcher = yield from websockets.connect(
+        client.BASE_URL + '/watcher/delta/', loop=loop)
+    workers = [asyncio.async(client.run(row, col, size, True, float('inf'),
+                                        steps), loop=loop)
+               for row in range(size) for col in range(size)]
+    try:
+        # Only measure steps, not startup.
+        times = {}
+        while len(times) <= steps:
+            msg = yield from asyncio.wait_for(watcher.recv(), 60, loop=loop)
+            _, step = SNAPSHOT.unpack_from(msg)
+            times[step] = loop.time()
+        yield from asyncio.wait(workers, loop=loop)
+    finally:
+        for worker in workers:
+            worker.cancel()
+        yield from watcher.close()
+    return {'steps/s': steps / (times[steps] - times[0])}
+
+
+BENCHMARKS = [
+    ('wsgi', bench_wsgi),
+    ('handshake', bench_handshake),
+    ('echo', bench_echo),
+    ('gameoflife', bench_gameoflife),
+]
+
+
+def run_suite(base_url, names=None, concurrency=50, duration=5, sizes=(8, 16),
+              steps=20, stdout=None, loop=None):
+    """Run benchmarks against the server at base_url and return results."""
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    results = {}
+    for name, benchmark in BENCHMARKS:
+        if names is not None and name not in names:
+            continue
+        cases = ([('{}.{}x{}'.format(name, size, size), {'size': size})
+                  for size in sizes] if name == 'gameoflife' else [(name, {})])
+        for case, options in cases:
+            if stdout is not None:
+                stdout.write("Running {}...\n".format(case))
+            results[case] = loop.run_until_complete(benchmark(
+                base_url, concurrency, duration, loop, steps=steps, **options))
+    return results
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compare results to a baseline.
+
+    Return a list of (case, metric, baseline, result, change) tuples, where
+    change is the relative difference in the direction where positive is
+    better, for metrics that got worse by more than threshold.
+    """
+    regressions = []
+    for case, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            reference = baseline.get(case, {}).get(metric)
+            if not reference:
+                continue
+            change = (value - reference) / reference
+            if not metric.endswith(RATE):
+                change = -change
+            if change < -threshold:
+                regressions.append((case, metric, reference, value, change))
+    return regressions
+
+
+@asyncio.coroutine
+def scrape(base_url, loop):
+    """Return the metrics of the server at base_url as a dict."""
+    response = yield from aiohttp.request(
+        'GET', base_url + '/test/metrics/', loop=loop)
+    body = yield from response.text()
+    samples = {}
+    for line in body.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+IDLE = 'c10ktools_websocket_connections{endpoint="c10ktools.views.idle_ws"}'
+RSS = 'process_resident_memory_bytes'
+
+
+@asyncio.coroutine
+def footprint(base_url, counts, loop, stdout=None, concurrency=100):
+    """
+    Measure the memory of the server at base_url with idle WebSockets.
+
+    Open connections until there are as many as each value of ``counts``.
+    Return a list of (connections, resident memory, bytes per connection)
+    tuples, the first one without connections.
+    """
+    url = base_url.replace('http', 'ws') + '/test/ws/idle/'
+    handshakes = asyncio.Semaphore(concurrency, loop=loop)
+    connections = []
+
+    @asyncio.coroutine
+    def connect():
+        with (yield from handshakes):
+            connections.append((yield from websockets.connect(url, loop=loop)))
+
+    @asyncio.coroutine
+    def measure():
+        # Wait until the server has started all the handlers.
+        while True:
+            samples = yield from scrape(base_url, loop)
+            if samples.get(IDLE, 0) >= len(connections):
+                return samples[RSS]
+            yield from asyncio.sleep(0.1, loop=loop)
+
+    base = yield from measure()
+    rows = [(0, base, 0)]
+    try:
+        for count in sorted(counts):
+            yield from asyncio.gather(
+                *[connect() for _ in range(count - len(connections))],
+                loop=loop)
+            rss = yield from measure()
+            rows.append((count, rss, (rss - base) / count))
+            if stdout is not None:
+                stdout.write("{:8} connections: {:8.1f} MB, {:6.0f} bytes "
+                             "per connection\n".format(
+                                 count, rss / 2 ** 20, (rss - base) / count))
+    finally:
+        yield from asyncio.gather(*[ws.close() for ws in connections],
+                                  loop=loop)
+    return rows
+
+
+def metadata():
+    return {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+    }
@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase
+
+from .suite import compare
+
+
+class CompareTests(SimpleTestCase):
+
+    baseline = {
+        'echo': {'messages/s': 1000.0, 'p50 ms': 2.0},
+    }
+
+    def test_no_regression(self):
+        results = {'echo': {'messages/s': 950.0, 'p50 ms': 2.1}}
+        self.assertEqual(compare(results, self.baseline), [])
+
+    def test_rate_regression(self):
+        results = {'echo': {'messages/s': 800.0, 'p50 ms': 2.0}}
+        self.assertEqual(compare(results, self.baseline),
+                         [('echo', 'messages/s', 1000.0, 800.0, -0.2)])
+
+    def test_latency_regression(self):
+        results = {'echo': {'messages/s': 1000.0, 'p50 ms': 3.0}}
+        self.assertEqual(compare(results, self.baseline),
+                         [('echo', 'p50 ms', 2.0, 3.0, -0.5)])
+
+    def test_new_metric(self):
+        results = {'wsgi': {'requests/s': 100.0}}
+        self.assertEqual(compare(results, self.baseline), [])
@@ -12,6 +12,7 @@ DATABASES = {
 DEBUG = True
 
 INSTALLED_APPS = (
+    'benchmarks',
     'c10ktools',
     'gameoflife',
     'django.contrib.staticfiles',
@@ -0,0 +1,102 @@
+import logging
+
+import asyncio
+
+from .bus import (
+    ARRIVAL, ARRIVE, PUBLISH, RELEASE, RETAIN, SUBSCRIBE, UNSUBSCRIBE,
+    encode, read_frame)
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    """Relay messages between BrokerBus clients over a Unix domain socket."""
+
+    def __init__(self, path, loop=None):
+        self.path = path
+        self.loop = loop
+        self.subscribers = {}
+        self.retained = {}
+        # Pending barrier and last released generation by name.
+        self.barriers = {}
+        self.released = {}
+        self.writers = set()
+
+    @asyncio.coroutine
+    def start(self):
+        self.server = yield from asyncio.start_unix_server(
+            self.handle, self.path, loop=self.loop)
+
+    @asyncio.coroutine
+    def stop(self):
+        self.server.close()
+        for writer in self.writers:
+            writer.close()
+        yield from self.server.wait_closed()
+
+    @asyncio.coroutine
+    def handle(self, reader, writer):
+        topics = set()
+        self.writers.add(writer)
+        try:
+            while True:
+                op, flags, topic, payload = yield from read_frame(reader)
+                if op == SUBSCRIBE:
+                    topics.add(topic)
+                    self.subscribers.setdefault(topic, set()).add(writer)
+                    if topic in self.retained:
+                        writer.write(self.retained[topic])
+                elif op == UNSUBSCRIBE:
+                    topics.discard(topic)
+                    self.unsubscribe(topic, writer)
+                elif op == PUBLISH:
+                    self.publish(topic, encode(PUBLISH, topic, payload, flags),
+                                 flags & RETAIN)
+                elif op == ARRIVE:
+                    parties, weight = ARRIVAL.unpack_from(payload)
+                    generation = payload[ARRIVAL.size:].decode('utf-8')
+                    self.arrive(topic, generation, writer, parties, weight)
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception:
+            logger.exception("Closing broker connection after an error")
+        finally:
+            for topic in topics:
+                self.unsubscribe(topic, writer)
+            for barrier in self.barriers.values():
+                barrier[2].discard(writer)
+            self.writers.discard(writer)
+            writer.close()
+
+    def unsubscribe(self, topic, writer):
+        subscribers = self.subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(writer)
+            if not subscribers:
+                del self.subscribers[topic]
+
+    def publish(self, topic, frame, retain):
+        if retain:
+            self.retained[topic] = frame
+        subscribers = self.subscribers.get(topic, set())
+        if topic != '*' and '*' in self.subscribers:
+            subscribers = subscribers | self.subscribers['*']
+        for writer in subscribers:
+            writer.write(frame)
+
+    def arrive(self, name, generation, writer, parties, weight):
+        release = encode(RELEASE, name, generation.encode('utf-8'))
+        if self.released.get(name) == generation:
+            writer.write(release)
+            return
+        barrier = self.barriers.get(name)
+        if barrier is None or barrier[0] != generation:
+            # A new generation replaces the pending one, if any.
+            barrier = self.barriers[name] = [generation, 0, set()]
+        barrier[1] += weight
+        barrier[2].add(writer)
+        if barrier[1] >= parties:
+            del self.barriers[name]
+            self.released[name] = generation
+            for waiter in barrier[2]:
+                waiter.write(release)
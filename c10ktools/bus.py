@@ -0,0 +1,263 @@
+"""
+Publish/subscribe message bus for sharing state between server processes.
+
+Messages are str or bytes, published to topics. Callbacks subscribed to a
+topic receive ``(topic, message)``; callbacks subscribed to ``'*'`` receive
+all messages. The last message published with ``retain=True`` on a topic is
+delivered to new subscribers of that topic.
+
+Barriers let coroutines in several processes wait until the total weight of
+arrivals reaches the number of parties. A barrier is identified by its name
+and its generation, for instance the current game. Arrivals after the release
+return immediately, until a new generation of the barrier starts: then the
+previous one is forgotten, and coroutines still waiting on it are cancelled.
+
+The backend is configured with the ``C10KTOOLS_BUS`` setting, for example::
+
+    C10KTOOLS_BUS = {
+        'BACKEND': 'c10ktools.bus.BrokerBus',
+        'OPTIONS': {'path': '/tmp/c10ktools.sock'},
+    }
+
+LocalBus works within a single process. BrokerBus connects to a broker
+started with ``django-admin.py runbroker`` over a Unix domain socket.
+"""
+
+import logging
+import struct
+
+import asyncio
+
+from django.utils.module_loading import import_by_path
+
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_PATH = '/tmp/c10ktools.sock'
+
+# Frames exchanged with the broker: opcode and flags, topic length, payload
+# length, topic, payload.
+HEADER = struct.Struct('!BHI')
+# The payload of ARRIVE frames is parties and weight, then the generation; the
+# payload of RELEASE frames is the generation.
+ARRIVAL = struct.Struct('!II')
+
+SUBSCRIBE = 0x01
+UNSUBSCRIBE = 0x02
+PUBLISH = 0x03
+ARRIVE = 0x04
+RELEASE = 0x05
+
+BINARY = 0x80
+RETAIN = 0x40
+
+
+def encode(op, topic, payload=b'', flags=0):
+    topic = topic.encode('utf-8')
+    return HEADER.pack(op | flags, len(topic), len(payload)) + topic + payload
+
+
+@asyncio.coroutine
+def read_frame(reader):
+    """Return (op, flags, topic, payload). Raise IncompleteReadError on EOF."""
+    op, topic_length, payload_length = HEADER.unpack(
+        (yield from reader.readexactly(HEADER.size)))
+    topic = (yield from reader.readexactly(topic_length)).decode('utf-8')
+    payload = yield from reader.readexactly(payload_length)
+    return op & 0x0f, op & 0xf0, topic, payload
+
+
+class BaseBus:
+    """
+    Subscriptions and dispatching shared by all buses.
+
+    Subclasses implement:
+
+    - ``publish(topic, message, retain=False)``, which delivers a message to
+      the subscribers of the topic in all processes sharing the bus;
+    - ``barrier(name, parties, weight=1, generation='')``, a coroutine which
+      adds ``weight`` arrivals to the barrier and waits until it's released.
+    """
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.callbacks = {}
+        self.retained = {}
+
+    def subscribe(self, topic, callback):
+        callbacks = self.callbacks.setdefault(topic, [])
+        callbacks.append(callback)
+        if topic in self.retained:
+            callback(topic, self.retained[topic])
+        return len(callbacks) == 1
+
+    def unsubscribe(self, topic, callback):
+        callbacks = self.callbacks.get(topic, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+            if not callbacks:
+                del self.callbacks[topic]
+                return True
+        return False
+
+    def dispatch(self, topic, message):
+        for callback in self.callbacks.get(topic, ()):
+            callback(topic, message)
+        if topic != '*':
+            for callback in self.callbacks.get('*', ()):
+                callback(topic, message)
+
+
+class LocalBus(BaseBus):
+    """Bus for a single process."""
+
+    def __init__(self, loop=None):
+        super().__init__(loop)
+        # Pending barrier and last released generation by name.
+        self.barriers = {}
+        self.released = {}
+
+    def publish(self, topic, message, retain=False):
+        if retain:
+            self.retained[topic] = message
+        self.dispatch(topic, message)
+
+    @asyncio.coroutine
+    def barrier(self, name, parties, weight=1, generation=''):
+        if self.released.get(name) == generation:
+            return
+        barrier = self.barriers.get(name)
+        if barrier is None or barrier[0] != generation:
+            if barrier is not None:
+                barrier[2].cancel()
+            barrier = self.barriers[name] = [
+                generation, 0, asyncio.Future(loop=self.loop)]
+        barrier[1] += weight
+        if barrier[1] >= parties:
+            del self.barriers[name]
+            self.released[name] = generation
+            barrier[2].set_result(None)
+        yield from barrier[2]
+
+
+class BrokerBus(BaseBus):
+    """Bus shared by processes connected to the same broker."""
+
+    def __init__(self, path=DEFAULT_PATH, loop=None):
+        super().__init__(loop)
+        self.path = path
+        self.writer = None
+        self.backlog = []
+        # Generation and waiter of pending barriers by name.
+        self.barriers = {}
+        self.task = None
+
+    def subscribe(self, topic, callback):
+        first = super().subscribe(topic, callback)
+        if first:
+            self.send(encode(SUBSCRIBE, topic))
+        return first
+
+    def unsubscribe(self, topic, callback):
+        last = super().unsubscribe(topic, callback)
+        if last:
+            # The broker sends the retained message on the next subscription.
+            self.retained.pop(topic, None)
+            self.send(encode(UNSUBSCRIBE, topic))
+        return last
+
+    def publish(self, topic, message, retain=False):
+        flags = RETAIN if retain else 0
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        else:
+            flags |= BINARY
+        self.send(encode(PUBLISH, topic, message, flags))
+
+    @asyncio.coroutine
+    def barrier(self, name, parties, weight=1, generation=''):
+        barrier = self.barriers.get(name)
+        if barrier is None or barrier[0] != generation:
+            if barrier is not None:
+                barrier[1].cancel()
+            barrier = self.barriers[name] = [
+                generation, asyncio.Future(loop=self.loop)]
+        self.send(encode(ARRIVE, name, ARRIVAL.pack(parties, weight) +
+                         generation.encode('utf-8')))
+        yield from barrier[1]
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def send(self, frame):
+        if self.writer is not None:
+            self.writer.write(frame)
+            return
+        # Frames are buffered until the connection is established.
+        self.backlog.append(frame)
+        if self.task is None:
+            self.task = asyncio.async(self.run(), loop=self.loop)
+
+    @asyncio.coroutine
+    def run(self):
+        try:
+            reader, writer = yield from asyncio.open_unix_connection(
+                self.path, loop=self.loop)
+        except OSError:
+            logger.exception("Cannot connect to the broker at %s", self.path)
+            self.fail()
+            return
+        for frame in self.backlog:
+            writer.write(frame)
+        self.backlog = []
+        self.writer = writer
+        try:
+            while True:
+                op, flags, topic, payload = yield from read_frame(reader)
+                if op == PUBLISH:
+                    if not flags & BINARY:
+                        payload = payload.decode('utf-8')
+                    if flags & RETAIN and topic in self.callbacks:
+                        self.retained[topic] = payload
+                    try:
+                        self.dispatch(topic, payload)
+                    except Exception:
+                        logger.exception("Error while handling %s", topic)
+                elif op == RELEASE:
+                    barrier = self.barriers.get(topic)
+                    if (barrier is not None and
+                            barrier[0] == payload.decode('utf-8')):
+                        del self.barriers[topic]
+                        if not barrier[1].done():
+                            barrier[1].set_result(None)
+        except asyncio.IncompleteReadError:
+            logger.error("Lost connection to the broker at %s", self.path)
+        finally:
+            writer.close()
+            self.fail()
+
+    def fail(self):
+        # Allow reconnecting later and unblock coroutines waiting on barriers.
+        self.writer = None
+        self.task = None
+        self.backlog = []
+        for _, waiter in self.barriers.values():
+            if not waiter.done():
+                waiter.set_exception(ConnectionError("Lost broker connection"))
+        self.barriers = {}
+
+
+_bus = None
+
+
+def get_bus():
+    """Return the bus for this process, as configured in settings."""
+    global _bus
+    if _bus is None:
+        config = get_setting('BUS')
+        backend = import_by_path(config.get('BACKEND', 'c10ktools.bus.LocalBus'))
+        _bus = backend(**config.get('OPTIONS', {}))
+    return _bus
@@ -0,0 +1,60 @@
+from django.conf import settings
+
+
+# Settings are prefixed with C10KTOOLS_ in the Django settings module.
+DEFAULTS = {
+    # Message bus shared by server processes: see c10ktools.bus.
+    'BUS': {},
+    # Report when the event loop is blocked for longer, in seconds; None
+    # disables the profiler.
+    'PROFILER_THRESHOLD': None,
+    # Size of request bodies kept in memory before spooling them to disk.
+    'BODY_MAX_MEMORY': 2621440,
+    # Size of request bodies buffered for views running in threads, beyond
+    # which the server stops reading from the connection.
+    'BODY_BUFFER': 65536,
+    # Number of threads running ordinary WSGI requests, 0 to run them inline.
+    'WSGI_THREADS': 0,
+    # Number of requests waiting for a thread before rejecting new ones.
+    'WSGI_QUEUE': 100,
+    # Write buffer size of WebSocket connections above which senders wait
+    # until it drops below the low watermark, in bytes.
+    'WEBSOCKET_WRITE_HIGH': 65536,
+    'WEBSOCKET_WRITE_LOW': 16384,
+    # Write buffer size above which a WebSocket connection is closed
+    # according to WEBSOCKET_OVERFLOW, 'abort' or 'close'; None disables it.
+    'WEBSOCKET_MAX_BUFFER': 1048576,
+    'WEBSOCKET_OVERFLOW': 'abort',
+    # Read buffer size of WebSocket connections, in bytes. Reading pauses at
+    # twice this size until the handler catches up.
+    'WEBSOCKET_READ_LIMIT': 16384,
+    # Accept the permessage-deflate extension, for messages of at least
+    # COMPRESS_MIN_SIZE bytes; context takeover costs memory per connection.
+    'WEBSOCKET_COMPRESS': False,
+    'WEBSOCKET_COMPRESS_MIN_SIZE': 64,
+    'WEBSOCKET_CONTEXT_TAKEOVER': False,
+    # Ping WebSocket connections quiet for this long, abort them when the
+    # pong doesn't come back in time, and close those that don't receive
+    # messages for too long, in seconds; None disables each check.
+    'WEBSOCKET_PING_INTERVAL': 20,
+    'WEBSOCKET_PONG_TIMEOUT': 20,
+    'WEBSOCKET_IDLE_TIMEOUT': None,
+    # Record WebSocket traffic to this file for c10ktools.replay; {pid} is
+    # replaced by the process ID. None disables capture.
+    'WEBSOCKET_CAPTURE': None,
+    # Reject WebSocket handshakes with a 503 above this many open connections
+    # per endpoint, or above this many handshakes per second per endpoint,
+    # with bursts of HANDSHAKE_BURST, by default one second's worth; None
+    # disables each limit. Limits apply to each server process.
+    'WEBSOCKET_MAX_CONNECTIONS': None,
+    'WEBSOCKET_HANDSHAKE_RATE': None,
+    'WEBSOCKET_HANDSHAKE_BURST': None,
+    # At shutdown, close WebSocket connections at random times over
+    # DRAIN_SPREAD seconds and abort those still open after DRAIN_TIMEOUT.
+    'DRAIN_TIMEOUT': 5,
+    'DRAIN_SPREAD': 2,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'C10KTOOLS_' + name, DEFAULTS[name])
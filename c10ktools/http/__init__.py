@@ -1 +1,2 @@
-from .websockets import websocket
+from .broadcast import Broadcaster
+from .websockets import encode_frame, websocket
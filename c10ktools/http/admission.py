@@ -0,0 +1,96 @@
+"""
+Admission control for WebSocket handshakes.
+
+A reconnect storm can keep the event loop busy with handshakes and starve
+established connections. Each endpoint may cap its open connections and
+rate-limit its handshakes with a token bucket. Handshakes over the limits get
+an immediate 503 response with a Retry-After header, before any work is done
+on the handshake itself.
+
+Limits apply per server process.
+"""
+
+import math
+import random
+import time
+
+from django.http import HttpResponse
+
+from .. import metrics
+
+
+rejected = metrics.Counter(
+    'c10ktools_websocket_rejected_total',
+    "WebSocket handshakes rejected by admission control.",
+    ('endpoint', 'reason'))
+
+# Clients rejected because the endpoint is full retry after a random delay up
+# to this many seconds, so they don't all come back at the same time.
+RETRY_SPREAD = 5
+
+
+class TokenBucket:
+    """
+    Allow ``rate`` events per second on average, and bursts of ``burst``.
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'time', 'clock')
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.tokens = self.burst
+        self.clock = clock
+        self.time = clock()
+
+    def take(self):
+        """Take a token. Return 0 or, if none is left, the delay until one."""
+        now = self.clock()
+        self.tokens = min(self.tokens + (now - self.time) * self.rate,
+                          self.burst)
+        self.time = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Admission:
+    """
+    Admission control for one endpoint.
+
+    ``connections`` is the gauge of the endpoint's open connections. Either
+    of ``max_connections`` and ``handshake_rate`` may be None to disable that
+    limit.
+    """
+
+    def __init__(self, endpoint, connections, max_connections=None,
+                 handshake_rate=None, handshake_burst=None):
+        self.connections = connections
+        self.max_connections = max_connections
+        self.bucket = None
+        if handshake_rate is not None:
+            self.bucket = TokenBucket(handshake_rate, handshake_burst)
+        self.full = rejected.child(endpoint, 'connections')
+        self.throttled = rejected.child(endpoint, 'rate')
+
+    def check(self):
+        """Return None to accept a handshake or a 503 response to reject it."""
+        if (self.max_connections is not None and
+                self.connections.value >= self.max_connections):
+            self.full.inc()
+            return overloaded("Too many connections.\n",
+                              random.randint(1, RETRY_SPREAD))
+        if self.bucket is not None:
+            delay = self.bucket.take()
+            if delay:
+                self.throttled.inc()
+                return overloaded("Too many handshakes.\n",
+                                  math.ceil(delay))
+        return None
+
+
+def overloaded(message, retry_after):
+    response = HttpResponse(message, content_type='text/plain', status=503)
+    response['Retry-After'] = str(retry_after)
+    return response
@@ -0,0 +1,167 @@
+import io
+import tempfile
+import threading
+
+import asyncio
+
+
+def has_body(environ):
+    return (int(environ.get('CONTENT_LENGTH') or 0) > 0 or
+            'chunked' in environ.get('HTTP_TRANSFER_ENCODING', ''))
+
+
+@asyncio.coroutine
+def spool(payload, max_memory):
+    """
+    Read a request body from an aiohttp stream into a file-like object.
+
+    The body is kept in memory up to max_memory bytes, then in a temporary
+    file.
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    while True:
+        chunk = yield from payload.readany()
+        if not chunk:
+            break
+        body.write(chunk)
+    body.seek(0)
+    return body
+
+
+class SpoolingHandler:
+    """
+    WSGI handler providing a blocking ``wsgi.input`` to an inline handler.
+
+    Since the handler runs on the event loop, the body must be available
+    before it starts. It's read without blocking the loop and spooled to disk
+    beyond ``max_memory`` bytes.
+    """
+
+    def __init__(self, handler, max_memory):
+        self.handler = handler
+        self.max_memory = max_memory
+
+    def __call__(self, environ, start_response):
+        if not has_body(environ):
+            environ['wsgi.input'] = io.BytesIO()
+            return self.handler(environ, start_response)
+        return self.run(environ, start_response)
+
+    @asyncio.coroutine
+    def run(self, environ, start_response):
+        body = yield from spool(environ['wsgi.input'], self.max_memory)
+        environ['wsgi.input'] = body
+        try:
+            return self.handler(environ, start_response)
+        finally:
+            body.close()
+
+
+class BodyPipe:
+    """
+    Blocking ``wsgi.input`` fed from the event loop, for handlers in threads.
+
+    pump() runs on the event loop and stops reading from the connection while
+    ``limit`` bytes are buffered, unless a reader waits for more. Other
+    methods run in the handler's thread.
+    """
+
+    def __init__(self, limit=65536, loop=None):
+        self.limit = limit
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.buffer = bytearray()
+        self.eof = False
+        self.closed = False
+        # Number of bytes the reader is waiting for.
+        self.wanted = 0
+        # Future for pump() waiting until the reader consumes some data.
+        self.space = None
+        self.condition = threading.Condition()
+
+    @asyncio.coroutine
+    def pump(self, payload):
+        """Feed the body from an aiohttp stream, then discard what's left."""
+        try:
+            while True:
+                chunk = yield from payload.readany()
+                if not chunk:
+                    break
+                with self.condition:
+                    if self.closed:
+                        continue
+                    self.buffer.extend(chunk)
+                    self.condition.notify_all()
+                    if len(self.buffer) >= max(self.limit, self.wanted):
+                        self.space = space = asyncio.Future(loop=self.loop)
+                    else:
+                        space = None
+                if space is not None:
+                    yield from space
+        finally:
+            # Also unblock the reader if the connection was lost.
+            with self.condition:
+                self.eof = True
+                self.condition.notify_all()
+
+    def read(self, size=-1):
+        with self.condition:
+            if size is None or size < 0:
+                self.wait(lambda: False)
+                size = len(self.buffer)
+            else:
+                self.wait(lambda: len(self.buffer) >= size, size)
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            self.release()
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0:
+            size = float('inf')
+        chunks = []
+        with self.condition:
+            while size > 0:
+                # Wait for at most limit bytes at a time, so pump() still
+                # pauses on long lines.
+                wanted = min(size, self.limit)
+                self.wait(lambda: (b'\n' in self.buffer or
+                                   len(self.buffer) >= wanted), wanted)
+                newline = self.buffer.find(b'\n') + 1
+                end = min(newline or len(self.buffer), wanted)
+                chunks.append(bytes(self.buffer[:end]))
+                del self.buffer[:end]
+                self.release()
+                if end == 0 or 0 < newline <= end:
+                    break
+                size -= end
+        return b''.join(chunks)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        """Discard the rest of the body, typically after the handler ran."""
+        with self.condition:
+            self.closed = True
+            self.buffer.clear()
+            self.release()
+
+    def wait(self, predicate, wanted=float('inf')):
+        # Must be called with the condition acquired.
+        self.wanted = wanted
+        while not (self.eof or predicate()):
+            self.release()
+            self.condition.wait()
+        self.wanted = 0
+
+    def release(self):
+        # Must be called with the condition acquired.
+        if self.space is not None and (
+                self.closed or len(self.buffer) < max(self.limit, self.wanted)):
+            space, self.space = self.space, None
+            self.loop.call_soon_threadsafe(resume, space)
+
+
+def resume(future):
+    if not future.done():
+        future.set_result(None)
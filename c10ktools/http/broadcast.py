@@ -0,0 +1,145 @@
+import collections
+import weakref
+
+import asyncio
+import websockets
+
+from .. import metrics
+from .websockets import encode_frame
+
+
+DROP = 'drop'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+
+broadcasters = weakref.WeakSet()
+
+metrics.GaugeFunction(
+    'c10ktools_broadcast_queued_frames',
+    "Frames queued by broadcasters for slow subscribers.",
+    lambda: sum(broadcaster.pending() for broadcaster in broadcasters))
+
+
+class Broadcaster:
+    """
+    Send messages to many WebSockets concurrently.
+
+    Messages are encoded once per call to send(); every subscriber receives
+    the same frame. Use send_frame() to share a frame between several calls.
+    Frames are also compressed once per call for all subscribers without
+    context takeover that use the same window size.
+
+    Each subscriber gets a bounded outbound queue drained by its own task, so
+    a slow subscriber only delays itself. When a queue is full, ``policy``
+    decides what happens:
+
+    - DROP discards the new message;
+    - COALESCE keeps the latest message per key: see below;
+    - DISCONNECT closes the connection and forgets the subscriber.
+
+    Messages may be sent with a ``key``, for instance the cell of the grid
+    they update. With COALESCE, a message replaces the pending message with
+    the same key, if there's one, whether the queue is full or not. When the
+    queue is full and no pending message has the key, the oldest pending
+    message is discarded.
+    """
+
+    def __init__(self, max_queue=32, policy=DROP, loop=None):
+        if policy not in (DROP, COALESCE, DISCONNECT):
+            raise ValueError("Unknown policy: {}".format(policy))
+        self.max_queue = max_queue
+        self.policy = policy
+        self.loop = loop
+        self.outboxes = {}
+        broadcasters.add(self)
+
+    def send(self, subscribers, message, key=None):
+        """Queue message for each subscriber. This never blocks."""
+        self.send_frame(subscribers, encode_frame(message), key)
+
+    def send_frame(self, subscribers, frame, key=None):
+        """Queue a frame built by encode_frame() for each subscriber."""
+        deflated = {}
+        for ws in subscribers:
+            outbox = self.outboxes.get(ws)
+            if outbox is None:
+                if not ws.open:
+                    continue
+                outbox = self.outboxes[ws] = Outbox(self, ws)
+            outbox.put(ws.share_frame(frame, deflated), key)
+
+    def discard(self, ws):
+        """Stop sending messages to ws, dropping pending ones."""
+        outbox = self.outboxes.pop(ws, None)
+        if outbox is not None:
+            outbox.stop()
+
+    def pending(self):
+        """Return the total number of queued frames."""
+        return sum(len(outbox.queue) for outbox in self.outboxes.values())
+
+
+class Outbox:
+    """Outbound queue for one subscriber of a Broadcaster."""
+
+    def __init__(self, broadcaster, ws):
+        self.broadcaster = broadcaster
+        self.ws = ws
+        # Pending [frame, key] entries, and entries by key for COALESCE.
+        self.queue = collections.deque()
+        self.keys = {}
+        self.waiter = None
+        self.task = asyncio.async(self.run(), loop=broadcaster.loop)
+
+    def put(self, frame, key=None):
+        policy = self.broadcaster.policy
+        if policy != COALESCE:
+            key = None
+        elif key is not None and key in self.keys:
+            self.keys[key][0] = frame
+            return
+        if len(self.queue) >= self.broadcaster.max_queue:
+            if policy == DROP:
+                return
+            elif policy == COALESCE:
+                self.pop()
+            else:
+                self.broadcaster.discard(self.ws)
+                asyncio.async(self.ws.close(), loop=self.broadcaster.loop)
+                return
+        entry = [frame, key]
+        self.queue.append(entry)
+        if key is not None:
+            self.keys[key] = entry
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def pop(self):
+        """Remove and return the oldest pending frame."""
+        frame, key = self.queue.popleft()
+        if key is not None:
+            del self.keys[key]
+        return frame
+
+    def stop(self):
+        self.queue.clear()
+        self.keys.clear()
+        self.task.cancel()
+
+    @asyncio.coroutine
+    def run(self):
+        try:
+            while True:
+                while not self.queue:
+                    self.waiter = asyncio.Future(loop=self.broadcaster.loop)
+                    yield from self.waiter
+                    self.waiter = None
+                if not self.ws.open:
+                    break
+                yield from self.ws.send_frame(self.pop())
+        except websockets.InvalidState:
+            pass
+        finally:
+            # Forget the subscriber unless it was already replaced.
+            if self.broadcaster.outboxes.get(self.ws) is self:
+                del self.broadcaster.outboxes[self.ws]
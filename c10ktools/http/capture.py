@@ -0,0 +1,142 @@
+"""
+Record the timelines of WebSocket connections to a file.
+
+With the WEBSOCKET_CAPTURE setting, each server process writes records to a
+file as connections open, receive frames, send messages and close. Received
+frames are recorded with their payload, so they can be replayed against a
+server; sent messages are only recorded by size, since broadcasts would make
+the file huge. See c10ktools.replay.
+
+The file starts with MAGIC, followed by records made of a RECORD header and,
+for OPEN and RECEIVED records, ``length`` bytes of payload: the path of the
+connection or the payload of the frame. Times are in seconds since the first
+record of the file.
+"""
+
+import collections
+import os
+import struct
+
+import asyncio
+
+from ..conf import get_setting
+
+
+MAGIC = b'C10KCAP1'
+
+# Connection, time, kind, opcode with the FIN bit, length.
+RECORD = struct.Struct('!IdBBI')
+
+OPEN, RECEIVED, SENT, CLOSED = range(4)
+
+FIN = 0x80
+
+Connection = collections.namedtuple('Connection', 'path time events')
+Event = collections.namedtuple('Event', 'time kind opcode fin data')
+
+
+class Recorder:
+    """Write records to a file, buffered."""
+
+    def __init__(self, path, loop=None):
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.start = None
+        self.connections = 0
+
+    def record(self, connection, kind, opcode=0, fin=True, data=b'',
+               length=None):
+        now = self.loop.time()
+        if self.start is None:
+            self.start = now
+        if length is None:
+            length = len(data)
+        self.file.write(RECORD.pack(connection, now - self.start, kind,
+                                    opcode | (FIN if fin else 0), length))
+        if data:
+            self.file.write(data)
+
+    def timeline(self, path):
+        """Record a new connection and return its Timeline."""
+        self.connections += 1
+        self.record(self.connections, OPEN, data=path.encode('utf-8'))
+        return Timeline(self, self.connections)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class Timeline:
+    """Record the events of one connection."""
+
+    __slots__ = ('recorder', 'connection')
+
+    def __init__(self, recorder, connection):
+        self.recorder = recorder
+        self.connection = connection
+
+    def received(self, frame):
+        self.recorder.record(self.connection, RECEIVED, frame.opcode,
+                             frame.fin, frame.data)
+
+    def sent(self, opcode, length):
+        self.recorder.record(self.connection, SENT, opcode, length=length)
+
+    def closed(self, *args):
+        self.recorder.record(self.connection, CLOSED)
+
+
+recorder = None
+
+
+def open_timeline(path):
+    """Return a Timeline for a new connection, or None if capture is off."""
+    global recorder
+    if recorder is None:
+        capture = get_setting('WEBSOCKET_CAPTURE')
+        if capture is None:
+            return None
+        # Each process of a multi-process server writes its own file.
+        recorder = Recorder(capture.format(pid=os.getpid()))
+    return recorder.timeline(path)
+
+
+def flush():
+    if recorder is not None:
+        recorder.flush()
+
+
+def load(path):
+    """
+    Read a capture file.
+
+    Return a list of Connection tuples in the order they opened. Events of
+    RECEIVED records hold the payload in ``data``; those of SENT records, the
+    length.
+    """
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    if not data.startswith(MAGIC):
+        raise ValueError("Not a capture file: {}".format(path))
+    timelines = collections.OrderedDict()
+    offset = len(MAGIC)
+    while offset + RECORD.size <= len(data):
+        connection, time, kind, opcode, length = RECORD.unpack_from(
+            data, offset)
+        offset += RECORD.size
+        payload = b''
+        if kind in (OPEN, RECEIVED):
+            payload = data[offset:offset + length]
+            offset += length
+        if kind == OPEN:
+            timelines[connection] = Connection(
+                payload.decode('utf-8'), time, [])
+        elif connection in timelines:
+            timelines[connection].events.append(Event(
+                time, kind, opcode & ~FIN, bool(opcode & FIN),
+                payload if kind == RECEIVED else length))
+    return list(timelines.values())
@@ -0,0 +1,192 @@
+"""
+Compression extension for WebSocket, permessage-deflate (RFC 7692).
+
+Compressing a message costs CPU time and, with context takeover, a zlib
+stream per connection and direction: about 256 kB to compress and 40 kB to
+decompress with the default window. Without context takeover, messages are
+compressed independently; a single stream serves all connections and the
+result can be shared between them.
+"""
+
+import time
+import zlib
+
+import websockets
+
+from .. import metrics
+
+
+deflate_seconds = metrics.Counter(
+    'c10ktools_websocket_deflate_seconds_total',
+    "Time spent compressing or decompressing WebSocket messages.",
+    ('direction',))
+deflate_input = metrics.Counter(
+    'c10ktools_websocket_deflate_input_bytes_total',
+    "Bytes of WebSocket messages before compression or decompression.",
+    ('direction',))
+deflate_output = metrics.Counter(
+    'c10ktools_websocket_deflate_output_bytes_total',
+    "Bytes of WebSocket messages after compression or decompression.",
+    ('direction',))
+
+compress_seconds = deflate_seconds.child('compress')
+compress_input = deflate_input.child('compress')
+compress_output = deflate_output.child('compress')
+decompress_seconds = deflate_seconds.child('decompress')
+decompress_input = deflate_input.child('decompress')
+decompress_output = deflate_output.child('decompress')
+
+NAME = 'permessage-deflate'
+
+# Empty stored block ending each compressed message, removed on the wire.
+TAIL = b'\x00\x00\xff\xff'
+
+# Streams without context takeover, shared by all connections, by window.
+shared_compressors = {}
+
+
+def parse_extensions(header):
+    """
+    Parse a Sec-WebSocket-Extensions header.
+
+    Return a list of (name, params) tuples, where params is a list of (name,
+    value) tuples, and value is None for parameters without a value.
+    """
+    extensions = []
+    for extension in header.split(','):
+        items = [item.strip() for item in extension.split(';')]
+        if not items[0]:
+            continue
+        params = []
+        for param in items[1:]:
+            name, equal, value = param.partition('=')
+            params.append((name.strip(),
+                           value.strip().strip('"') if equal else None))
+        extensions.append((items[0], params))
+    return extensions
+
+
+def negotiate(header, context_takeover=True, min_size=0):
+    """
+    Accept the first acceptable permessage-deflate offer in a
+    Sec-WebSocket-Extensions header.
+
+    Return a (response header, PerMessageDeflate) tuple, or None when there's
+    no acceptable offer. Without ``context_takeover``, the server asks for no
+    context takeover in both directions, which saves memory.
+    """
+    for name, params in parse_extensions(header):
+        if name != NAME:
+            continue
+        names = [param for param, _ in params]
+        if len(set(names)) != len(names):
+            continue
+        params = dict(params)
+        if not set(params) <= {
+                'server_no_context_takeover', 'client_no_context_takeover',
+                'server_max_window_bits', 'client_max_window_bits'}:
+            continue
+        if params.get('server_no_context_takeover', None) is not None:
+            continue
+        if params.get('client_no_context_takeover', None) is not None:
+            continue
+
+        server_wbits = 15
+        if 'server_max_window_bits' in params:
+            value = params['server_max_window_bits']
+            # zlib doesn't support 8 bits windows for raw deflate streams.
+            if value is None or not value.isdigit() or not 9 <= int(value) <= 15:
+                continue
+            server_wbits = int(value)
+        if 'client_max_window_bits' in params:
+            value = params['client_max_window_bits']
+            if value is not None and not (
+                    value.isdigit() and 8 <= int(value) <= 15):
+                continue
+
+        server_takeover = (context_takeover and
+                           'server_no_context_takeover' not in params)
+        client_takeover = (context_takeover and
+                           'client_no_context_takeover' not in params)
+        response = [NAME]
+        if not server_takeover:
+            response.append('server_no_context_takeover')
+        if not client_takeover:
+            response.append('client_no_context_takeover')
+        if 'server_max_window_bits' in params:
+            response.append('server_max_window_bits={}'.format(server_wbits))
+        deflate = PerMessageDeflate(
+            server_takeover, client_takeover, server_wbits, min_size)
+        return '; '.join(response), deflate
+    return None
+
+
+class PerMessageDeflate:
+    """
+    State of permessage-deflate for one connection.
+
+    Messages shorter than ``min_size`` bytes are sent uncompressed.
+    """
+
+    __slots__ = ('server_takeover', 'client_takeover', 'server_wbits',
+                 'min_size', 'compressor', 'decompressor')
+
+    def __init__(self, server_takeover=True, client_takeover=True,
+                 server_wbits=15, min_size=0):
+        self.server_takeover = server_takeover
+        self.client_takeover = client_takeover
+        self.server_wbits = server_wbits
+        self.min_size = min_size
+        # Streams are created when they're first needed.
+        self.compressor = None
+        self.decompressor = None
+
+    def compress(self, data):
+        """Compress a message."""
+        begin = time.perf_counter()
+        if self.server_takeover:
+            compressor = self.compressor
+            if compressor is None:
+                compressor = self.compressor = zlib.compressobj(
+                    zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                    -self.server_wbits)
+            flush = zlib.Z_SYNC_FLUSH
+        else:
+            compressor = shared_compressors.get(self.server_wbits)
+            if compressor is None:
+                compressor = shared_compressors[self.server_wbits] = (
+                    zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                     zlib.DEFLATED, -self.server_wbits))
+            # A full flush resets the stream for the next message.
+            flush = zlib.Z_FULL_FLUSH
+        result = compressor.compress(data) + compressor.flush(flush)
+        assert result.endswith(TAIL)
+        result = result[:-len(TAIL)]
+        compress_seconds.value += time.perf_counter() - begin
+        compress_input.value += len(data)
+        compress_output.value += len(result)
+        return result
+
+    def decompress(self, data, fin, max_size=None):
+        """
+        Decompress a frame of a message; ``fin`` tells if it's the last one.
+
+        Raise PayloadTooBig if the result exceeds ``max_size`` bytes.
+        """
+        begin = time.perf_counter()
+        decompressor = self.decompressor
+        if decompressor is None:
+            decompressor = self.decompressor = zlib.decompressobj(-15)
+        if fin:
+            data += TAIL
+        result = decompressor.decompress(data, max_size or 0)
+        if decompressor.unconsumed_tail:
+            raise websockets.PayloadTooBig(
+                "Uncompressed payload exceeds limit ({} bytes)"
+                .format(max_size))
+        if fin and not self.client_takeover:
+            self.decompressor = None
+        decompress_seconds.value += time.perf_counter() - begin
+        decompress_input.value += len(data)
+        decompress_output.value += len(result)
+        return result
@@ -0,0 +1,127 @@
+import concurrent.futures
+import io
+
+import asyncio
+
+from .. import metrics
+from .body import BodyPipe, has_body
+
+
+rejected = metrics.Counter(
+    'c10ktools_wsgi_rejected_total',
+    "WSGI requests rejected because all threads were busy.")
+
+
+class ThreadPoolHandler:
+    """
+    WSGI handler running ordinary requests in a bounded pool of threads.
+
+    Django views are blocking: running them inline on the event loop stalls
+    every WebSocket connection until they return. This handler runs them in
+    ``threads`` threads instead, with at most ``max_queue`` requests waiting
+    for a thread. Further requests get an immediate 503 response.
+
+    WebSocket handshakes stay on the event loop because the handler switches
+    protocols and starts a coroutine when the response is sent.
+
+    The request body is streamed to the thread as the handler reads it, with
+    at most ``body_buffer`` bytes buffered.
+
+    This relies on aiohttp's WSGI server accepting a coroutine in place of
+    the response iterable.
+    """
+
+    def __init__(self, handler, threads, max_queue, loop=None,
+                 body_buffer=65536):
+        self.handler = handler
+        self.threads = threads
+        self.max_queue = max_queue
+        self.body_buffer = body_buffer
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        # Requests submitted to the executor and not completed yet.
+        self.pending = 0
+        self.rejected = 0
+        self.gauges = [
+            metrics.GaugeFunction(
+                'c10ktools_wsgi_active_requests',
+                "WSGI requests running in a thread.", lambda: self.active),
+            metrics.GaugeFunction(
+                'c10ktools_wsgi_queued_requests',
+                "WSGI requests waiting for a thread.", lambda: self.queued),
+        ]
+
+    @property
+    def active(self):
+        """Number of requests running in a thread."""
+        return min(self.pending, self.threads)
+
+    @property
+    def queued(self):
+        """Number of requests waiting for a thread."""
+        return max(self.pending - self.threads, 0)
+
+    def __call__(self, environ, start_response):
+        if environ.get('HTTP_UPGRADE', '').lower() == 'websocket':
+            return self.handler(environ, start_response)
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            rejected.inc()
+            start_response('503 Service Unavailable', [
+                ('Content-Type', 'text/plain'),
+                ('Retry-After', '1'),
+            ])
+            return [b"Server overloaded.\n"]
+
+        environ['wsgi.multithread'] = True
+        return self.run(environ, start_response)
+
+    @asyncio.coroutine
+    def run(self, environ, start_response):
+        pump = None
+        if has_body(environ):
+            payload = environ['wsgi.input']
+            environ['wsgi.input'] = pipe = BodyPipe(self.body_buffer,
+                                                    self.loop)
+            pump = asyncio.async(pipe.pump(payload), loop=self.loop)
+        else:
+            environ['wsgi.input'] = io.BytesIO()
+
+        self.pending += 1
+        try:
+            status, headers, body = yield from self.loop.run_in_executor(
+                self.executor, self.call, environ)
+        finally:
+            self.pending -= 1
+            if pump is not None:
+                # Read the rest of the body to keep the connection alive.
+                pipe.close()
+                yield from pump
+        start_response(status, headers)
+        return body
+
+    def call(self, environ):
+        """Run the handler to completion in a thread."""
+        response = []
+        body = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+            return body.append
+
+        result = self.handler(environ, start_response)
+        try:
+            # Iterating may block too, for instance on streaming responses.
+            body.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response[0], response[1], body
+
+    def close(self):
+        for gauge in self.gauges:
+            metrics.unregister(gauge)
+        self.executor.shutdown(wait=True)
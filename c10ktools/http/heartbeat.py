@@ -0,0 +1,164 @@
+"""
+Detect dead and idle WebSocket connections.
+
+A connection that doesn't receive anything for ``ping_interval`` seconds gets
+a ping. If nothing comes back within ``pong_timeout`` seconds, the peer is
+considered dead and the connection is aborted. A connection that doesn't
+receive any message for ``idle_timeout`` seconds is closed.
+
+Once the connection is lost, recv() returns None and handlers clean up after
+themselves, for instance by unsubscribing.
+
+Connections are checked by a timer wheel: a single timer ticks every
+``resolution`` seconds and checks the connections due in the current slot.
+The cost per tick doesn't depend on the number of connections, only on how
+many are due.
+"""
+
+import math
+
+import asyncio
+
+from .. import metrics
+
+
+pings_sent = metrics.Counter(
+    'c10ktools_websocket_pings_total',
+    "Pings sent by the heartbeat to quiet WebSocket connections.")
+reaped = metrics.Counter(
+    'c10ktools_websocket_reaped_total',
+    "WebSocket connections closed by the heartbeat.", ('reason',))
+
+reaped_dead = reaped.child('pong_timeout')
+reaped_idle = reaped.child('idle_timeout')
+
+# Unmasked ping frame without payload.
+PING = b'\x89\x00'
+
+
+class TimerWheel:
+    """
+    Call expire(item, now) for each item after the delay it was scheduled
+    with, rounded up to ``resolution`` seconds. Delays are capped at ``span``
+    seconds.
+    """
+
+    def __init__(self, resolution, span, expire, loop=None):
+        self.resolution = resolution
+        self.expire = expire
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.slots = [[] for _ in range(math.ceil(span / resolution) + 1)]
+        self.position = 0
+        self.handle = None
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.slots)
+
+    def schedule(self, item, delay):
+        if self.handle is None:
+            self.time = self.loop.time()
+            self.handle = self.loop.call_at(
+                self.time + self.resolution, self.tick)
+        ticks = max(math.ceil(delay / self.resolution), 1)
+        ticks = min(ticks, len(self.slots) - 1)
+        self.slots[(self.position + ticks) % len(self.slots)].append(item)
+
+    def tick(self):
+        now = self.loop.time()
+        # Catch up with slots missed while the event loop was busy.
+        while self.time + self.resolution <= now:
+            self.time += self.resolution
+            self.position = (self.position + 1) % len(self.slots)
+            items = self.slots[self.position]
+            if items:
+                self.slots[self.position] = []
+                for item in items:
+                    self.expire(item, now)
+        if any(self.slots):
+            self.handle = self.loop.call_at(
+                self.time + self.resolution, self.tick)
+        else:
+            self.handle = None
+
+    def stop(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        self.slots = [[] for _ in self.slots]
+
+
+class Heartbeat(TimerWheel):
+    """
+    Ping and reap WebSocket connections.
+
+    Each of ``ping_interval``, ``pong_timeout`` and ``idle_timeout`` may be
+    None to disable the corresponding check; ``pong_timeout`` only applies
+    when pings are enabled.
+    """
+
+    def __init__(self, ping_interval, pong_timeout, idle_timeout,
+                 resolution=1, loop=None):
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.idle_timeout = idle_timeout
+        delays = [delay for delay in (ping_interval, pong_timeout,
+                                      idle_timeout) if delay is not None]
+        span = max(delays) if delays else resolution
+        super().__init__(resolution, span, self.check, loop)
+
+    def add(self, ws):
+        """Start watching ws. It must be open."""
+        self.check(ws, self.loop.time())
+
+    def check(self, ws, now):
+        if not ws.open:
+            return
+
+        deadlines = []
+        if self.idle_timeout is not None:
+            deadline = ws.last_message + self.idle_timeout
+            if deadline <= now:
+                reaped_idle.inc()
+                asyncio.async(ws.close_or_abort(1000, "Idle timeout"),
+                              loop=self.loop)
+                return
+            deadlines.append(deadline)
+
+        if self.ping_interval is not None:
+            if ws.ping_sent is not None and ws.last_seen >= ws.ping_sent:
+                # Anything received after a ping proves the peer is alive.
+                ws.ping_sent = None
+            if ws.ping_sent is not None and self.pong_timeout is not None:
+                deadline = ws.ping_sent + self.pong_timeout
+                if deadline <= now:
+                    reaped_dead.inc()
+                    ws.writer.transport.abort()
+                    return
+            elif ws.last_seen + self.ping_interval <= now:
+                ws.writer.write(PING)
+                ws.ping_sent = now
+                pings_sent.inc()
+                deadline = now + (self.pong_timeout
+                                  if self.pong_timeout is not None
+                                  else self.ping_interval)
+            else:
+                deadline = ws.last_seen + self.ping_interval
+            deadlines.append(deadline)
+
+        if deadlines:
+            self.schedule(ws, min(deadlines) - now)
+
+
+# Heartbeats by (ping_interval, pong_timeout, idle_timeout).
+heartbeats = {}
+
+
+def watch(ws, ping_interval, pong_timeout, idle_timeout):
+    """Watch ws with a heartbeat shared by connections with these settings."""
+    if ping_interval is None and idle_timeout is None:
+        return
+    key = ping_interval, pong_timeout, idle_timeout
+    heartbeat = heartbeats.get(key)
+    if heartbeat is None:
+        heartbeat = heartbeats[key] = Heartbeat(*key)
+    heartbeat.add(ws)
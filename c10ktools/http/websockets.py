@@ -1,17 +1,136 @@
 import asyncio
 import functools
+import random
+import struct
+import time
+import weakref
 
 import websockets
 from websockets import handshake
+from websockets.framing import Frame, check_frame
 
 from django.http import HttpResponse, HttpResponseServerError
 
+from .. import metrics, profiler
+from ..conf import get_setting
+from . import capture, heartbeat
+from .admission import Admission
+from .deflate import negotiate
 
-def websocket(handler):
-    """Decorator for WebSocket handlers."""
+
+handshakes = metrics.Counter(
+    'c10ktools_websocket_handshakes_total',
+    "WebSocket handshakes by response status.", ('endpoint', 'status'))
+connections = metrics.Gauge(
+    'c10ktools_websocket_connections',
+    "Open WebSocket connections.", ('endpoint',))
+handler_duration = metrics.Histogram(
+    'c10ktools_websocket_handler_duration_seconds',
+    "Duration of WebSocket handlers.", ('endpoint',))
+handler_errors = metrics.Counter(
+    'c10ktools_websocket_handler_errors_total',
+    "WebSocket handlers terminated by an exception.", ('endpoint',))
+messages_received = metrics.Counter(
+    'c10ktools_websocket_messages_received_total',
+    "WebSocket messages received.")
+messages_sent = metrics.Counter(
+    'c10ktools_websocket_messages_sent_total',
+    "WebSocket messages sent.")
+bytes_received = metrics.Counter(
+    'c10ktools_websocket_received_bytes_total',
+    "Payload bytes of WebSocket data frames received.")
+bytes_sent = metrics.Counter(
+    'c10ktools_websocket_sent_bytes_total',
+    "Payload bytes of WebSocket data frames sent.")
+overflows = metrics.Counter(
+    'c10ktools_websocket_overflows_total',
+    "WebSocket connections closed because their write buffer was full.")
+drained = metrics.Counter(
+    'c10ktools_websocket_drained_total',
+    "WebSocket connections closed at shutdown, by outcome.", ('outcome',))
+
+# Open connections, for computing gauges when metrics are collected.
+protocols = weakref.WeakSet()
+# Running handlers, for waiting until they terminate at shutdown.
+handlers = set()
+
+metrics.GaugeFunction(
+    'c10ktools_websocket_write_buffer_bytes',
+    "Bytes waiting in the write buffers of WebSocket connections.",
+    lambda: sum(ws.writer.transport.get_write_buffer_size()
+                for ws in protocols if ws.open))
+
+
+# Options of the websocket decorator and the settings providing defaults.
+OPTIONS = {
+    'write_high': 'WEBSOCKET_WRITE_HIGH',
+    'write_low': 'WEBSOCKET_WRITE_LOW',
+    'max_buffer': 'WEBSOCKET_MAX_BUFFER',
+    'overflow': 'WEBSOCKET_OVERFLOW',
+    'read_limit': 'WEBSOCKET_READ_LIMIT',
+    'compress': 'WEBSOCKET_COMPRESS',
+    'compress_min_size': 'WEBSOCKET_COMPRESS_MIN_SIZE',
+    'context_takeover': 'WEBSOCKET_CONTEXT_TAKEOVER',
+    'ping_interval': 'WEBSOCKET_PING_INTERVAL',
+    'pong_timeout': 'WEBSOCKET_PONG_TIMEOUT',
+    'idle_timeout': 'WEBSOCKET_IDLE_TIMEOUT',
+    'max_connections': 'WEBSOCKET_MAX_CONNECTIONS',
+    'handshake_rate': 'WEBSOCKET_HANDSHAKE_RATE',
+    'handshake_burst': 'WEBSOCKET_HANDSHAKE_BURST',
+}
+
+# Options applying to the handshake rather than to the protocol.
+COMPRESSION_OPTIONS = ('compress', 'compress_min_size', 'context_takeover')
+# Options applying to the heartbeat.
+HEARTBEAT_OPTIONS = ('ping_interval', 'pong_timeout', 'idle_timeout')
+# Options applying to admission control.
+ADMISSION_OPTIONS = ('max_connections', 'handshake_rate', 'handshake_burst')
+
+
+def websocket(handler=None, **options):
+    """
+    Decorator for WebSocket handlers.
+
+    It accepts options overriding the settings for flow control, for
+    instance ``@websocket(max_buffer=None)``:
+
+    - ``write_high`` and ``write_low``: watermarks of the write buffer;
+      senders wait while it's above ``write_low`` after exceeding
+      ``write_high``;
+    - ``max_buffer``: size of the write buffer beyond which the connection
+      is closed, or None;
+    - ``overflow``: ``'abort'`` to drop the connection immediately, or
+      ``'close'`` to send a 1008 close frame after the buffered data;
+    - ``read_limit``: size of the read buffer beyond which the connection
+      stops reading until the handler catches up;
+    - ``compress``: accept the permessage-deflate extension when the client
+      offers it;
+    - ``compress_min_size``: size of messages below which they're sent
+      uncompressed;
+    - ``context_takeover``: keep compression streams between messages;
+      this compresses better but costs about 300 kB per connection;
+    - ``ping_interval``, ``pong_timeout`` and ``idle_timeout``: see
+      c10ktools.http.heartbeat; None disables each of them;
+    - ``max_connections``, ``handshake_rate`` and ``handshake_burst``: see
+      c10ktools.http.admission; None disables the first two.
+    """
+    unknown = set(options) - set(OPTIONS)
+    if unknown:
+        raise TypeError("Unknown options: {}".format(', '.join(unknown)))
+    if handler is None:
+        return functools.partial(websocket, **options)
+
+    endpoint = '{}.{}'.format(handler.__module__, handler.__name__)
+    open_connections = connections.child(endpoint)
+    duration = handler_duration.child(endpoint)
+    errors = handler_errors.child(endpoint)
+    profiler.register(handler, endpoint)
+    # Created on the first handshake, once settings are available.
+    admission = None
 
     @functools.wraps(handler)
     def wrapper(request, *args, **kwargs):
+        nonlocal admission
         environ = request.META
         try:
             assert environ['wsgi.async']
@@ -34,38 +153,459 @@ def websocket(handler):
             assert transport._protocol is http_protocol
 
         except (AssertionError, KeyError) as e:             # pragma: no cover
+            handshakes.child(endpoint, '500').inc()
             # When the handshake fails (500), insert a `raise` here.
             return HttpResponseServerError("Unsupported WSGI server: %s." % e)
 
-        @asyncio.coroutine
-        def run_ws_handler(ws):
-            yield from handler(ws, *args, **kwargs)
-            yield from ws.close()
+        ws_options = {name: options.get(name, get_setting(setting))
+                      for name, setting in OPTIONS.items()}
+        compression = {name: ws_options.pop(name)
+                       for name in COMPRESSION_OPTIONS}
+        heartbeat_options = {name: ws_options.pop(name)
+                             for name in HEARTBEAT_OPTIONS}
+        admission_options = {name: ws_options.pop(name)
+                             for name in ADMISSION_OPTIONS}
+        if admission is None:
+            admission = Admission(endpoint, open_connections,
+                                  **admission_options)
+        rejection = admission.check()
+        if rejection is not None:
+            handshakes.child(endpoint, '503').inc()
+            return rejection
 
         def switch_protocols():
             # Switch transport from http_protocol to ws_protocol (YOLO).
-            ws_protocol = websockets.WebSocketCommonProtocol()
+            ws_protocol = WebSocketProtocol(deflate=response.deflate,
+                                            **ws_options)
             transport._protocol = ws_protocol
             ws_protocol.connection_made(transport)
+            heartbeat.watch(ws_protocol, **heartbeat_options)
+            timeline = capture.open_timeline(request.get_full_path())
+            if timeline is not None:
+                ws_protocol.timeline = timeline
+                ws_protocol.worker.add_done_callback(timeline.closed)
 
             # Ensure aiohttp doesn't interfere.
             http_protocol.transport = None
+            release_http_protocol(http_protocol)
 
-            # Fire'n'forget the WebSocket handler.
-            asyncio.async(run_ws_handler(ws_protocol))
+            # Fire'n'forget the WebSocket handler. Bookkeeping happens in a
+            # callback rather than in a wrapper coroutine, which would stay
+            # suspended for the lifetime of the connection.
+            protocols.add(ws_protocol)
+            open_connections.inc()
+            task = asyncio.async(handler(ws_protocol, *args, **kwargs))
+            handlers.add(task)
+            task.add_done_callback(functools.partial(
+                handler_done, ws_protocol, time.monotonic(), duration,
+                errors, open_connections))
 
-        return WebSocketResponse(environ, switch_protocols)
+        response = WebSocketResponse(environ, switch_protocols,
+                                     compression)
+        handshakes.child(endpoint, str(response.status_code)).inc()
+        return response
 
     return wrapper
 
 
+def handler_done(ws, begin, duration, errors, open_connections, task):
+    handlers.discard(task)
+    duration.observe(time.monotonic() - begin)
+    open_connections.dec()
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is None:
+        asyncio.async(ws.close())
+    else:
+        errors.inc()
+        # Retrieving the exception silences asyncio: report it instead.
+        asyncio.get_event_loop().call_exception_handler({
+            'message': "Unhandled exception in WebSocket handler",
+            'exception': exc,
+            'future': task,
+        })
+
+
+@asyncio.coroutine
+def drain(timeout, spread=0, loop=None):
+    """
+    Close open WebSocket connections with the "going away" code, 1001.
+
+    Close frames are sent at random times over ``spread`` seconds, so clients
+    don't all reconnect at once. Connections and handlers still running after
+    ``timeout`` seconds are aborted. Return the number of aborted connections.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    connections = [ws for ws in list(protocols)
+                   if not ws.connection_closed.done()]
+    closing = [asyncio.async(close_later(ws, random.uniform(0, spread)),
+                             loop=loop)
+               for ws in connections]
+    pending = closing + list(handlers)
+    if pending:
+        yield from asyncio.wait(pending, timeout=timeout, loop=loop)
+    aborted = 0
+    for ws in connections:
+        if not ws.connection_closed.done():
+            ws.writer.transport.abort()
+            aborted += 1
+    for task in closing + list(handlers):
+        task.cancel()
+    drained.child('closed').inc(len(connections) - aborted)
+    drained.child('aborted').inc(aborted)
+    return aborted
+
+
+@asyncio.coroutine
+def close_later(ws, delay):
+    yield from asyncio.sleep(delay, loop=ws._loop)
+    yield from ws.close_or_abort(1001, "Going away")
+
+
+def release_http_protocol(http_protocol):
+    """
+    Drop references held by the HTTP protocol once aiohttp is done with it.
+
+    Its reader and writer reference it back: without this, it lingers until
+    the garbage collector breaks the cycle, which is slow with many objects.
+    """
+    # The timers of aiohttp would close the transport, now used by the
+    # WebSocket protocol, or fail since it's gone.
+    for name in ('_timeout_handle', '_keep_alive_handle'):
+        handle = getattr(http_protocol, name, None)
+        if handle is not None:
+            handle.cancel()
+            setattr(http_protocol, name, None)
+
+    def release(task=None):
+        http_protocol.reader = None
+        http_protocol.writer = None
+
+    task = getattr(http_protocol, '_request_handler', None)
+    if task is not None and not task.done():
+        task.add_done_callback(release)
+    else:
+        release()
+
+
+OP_TEXT = 0x01
+OP_BINARY = 0x02
+
+
+def encode_frame(data):
+    """
+    Serialize a message into a complete, unmasked WebSocket frame.
+
+    Server frames aren't masked, so the result can be written as is to any
+    number of connections with WebSocketProtocol.send_frame().
+    """
+    if isinstance(data, str):
+        opcode = OP_TEXT
+        data = data.encode('utf-8')
+    elif isinstance(data, bytes):
+        opcode = OP_BINARY
+    else:
+        raise TypeError("data must be bytes or str")
+    return build_frame(opcode, data)
+
+
+def build_frame(opcode, data, rsv1=False):
+    head1 = 0x80 | 0x40 * rsv1 | opcode
+    length = len(data)
+    if length < 126:
+        header = struct.pack('!BB', head1, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', head1, 126, length)
+    else:
+        header = struct.pack('!BBQ', head1, 127, length)
+    return header + data
+
+
+def header_length(frame):
+    length = frame[1] & 0x7f
+    return 2 if length < 126 else 4 if length == 126 else 10
+
+
+@asyncio.coroutine
+def read_frame(reader, mask, max_size=None):
+    """
+    Read a frame like websockets.framing.read_frame(), but accept the RSV1
+    bit of permessage-deflate. Return a (frame, rsv1) tuple.
+    """
+    data = yield from reader(2)
+    head1, head2 = struct.unpack('!BB', data)
+    fin = bool(head1 & 0x80)
+    rsv1 = bool(head1 & 0x40)
+    if head1 & 0x30:
+        raise websockets.WebSocketProtocolError("Reserved bits must be 0")
+    opcode = head1 & 0x0f
+    if bool(head2 & 0x80) != mask:
+        raise websockets.WebSocketProtocolError("Incorrect masking")
+    length = head2 & 0x7f
+    if length == 126:
+        data = yield from reader(2)
+        length, = struct.unpack('!H', data)
+    elif length == 127:
+        data = yield from reader(8)
+        length, = struct.unpack('!Q', data)
+    if max_size is not None and length > max_size:
+        raise websockets.PayloadTooBig("Payload exceeds limit "
+                                       "({} > {} bytes)".format(
+                                           length, max_size))
+    if mask:
+        mask_bits = yield from reader(4)
+
+    data = yield from reader(length)
+    if mask:
+        # Unmask with one large XOR rather than byte by byte.
+        mask_bits = mask_bits * (length // 4 + 1)
+        data = (int.from_bytes(data, 'big') ^
+                int.from_bytes(mask_bits[:length], 'big')
+                ).to_bytes(length, 'big')
+
+    frame = Frame(fin, opcode, data)
+    check_frame(frame)
+    return frame, rsv1
+
+
+ABORT = 'abort'
+CLOSE = 'close'
+
+
+class WebSocketProtocol(websockets.WebSocketCommonProtocol):
+    """Server-side WebSocket protocol with a few extensions."""
+
+    # Timeline recording the connection when capture is enabled. A class
+    # attribute costs nothing per connection otherwise.
+    timeline = None
+
+    def __init__(self, *, write_high=None, write_low=None, max_buffer=None,
+                 overflow=ABORT, read_limit=None, deflate=None, **kwargs):
+        if overflow not in (ABORT, CLOSE):
+            raise ValueError("Unknown overflow policy: {}".format(overflow))
+        self.write_high = write_high
+        self.write_low = write_low
+        self.max_buffer = max_buffer
+        self.overflow = overflow
+        self.overflowed = False
+        # PerMessageDeflate instance when the extension was negotiated.
+        self.deflate = deflate
+        # True while receiving a compressed message.
+        self.inflating = False
+        # Times when anything and when a message was last received, and when
+        # the heartbeat sent a ping without getting anything back yet.
+        self.last_seen = None
+        self.last_message = None
+        self.ping_sent = None
+        super().__init__(**kwargs)
+        if read_limit is not None:
+            # The transport pauses reading at twice this limit (private API!)
+            self._stream_reader._limit = read_limit
+        # Replace the asyncio queue, much larger, and its task in recv().
+        self.messages = MessageQueue()
+
+    def client_connected(self, reader, writer):
+        super().client_connected(reader, writer)
+        self.worker.add_done_callback(self.messages.close)
+
+    @asyncio.coroutine
+    def recv(self):
+        """
+        Receive the next message, or None once the connection is closed.
+
+        Unlike the original, this doesn't create a task and a future each
+        time it waits, which is most of the time for idle connections.
+        """
+        messages = self.messages
+        while not messages and not messages.closed:
+            messages.waiter = asyncio.Future(loop=self._loop)
+            try:
+                yield from messages.waiter
+            finally:
+                messages.waiter = None
+        if messages:
+            return messages.pop(0)
+
+    def connection_made(self, transport):
+        # Above write_high, the transport pauses the protocol and drain()
+        # waits until the buffer drops below write_low.
+        if self.write_high is not None:
+            transport.set_write_buffer_limits(self.write_high, self.write_low)
+        self.last_seen = self.last_message = self._loop.time()
+        super().connection_made(transport)
+
+    @asyncio.coroutine
+    def _drain_helper(self):
+        # Let several coroutines wait for the buffer to drain, for instance
+        # the handler and the outbox of a broadcaster. asyncio only supports
+        # one at a time (private API!)
+        if self._connection_lost:
+            raise ConnectionResetError('Connection lost')
+        if not self._paused:
+            return
+        waiter = self._drain_waiter
+        if waiter is None or waiter.cancelled():
+            waiter = self._drain_waiter = asyncio.Future(loop=self._loop)
+        yield from asyncio.shield(waiter, loop=self._loop)
+
+    def check_buffer(self):
+        """Enforce max_buffer before writing a data frame."""
+        if self.overflowed:
+            raise websockets.InvalidState("Write buffer overflow")
+        if self.max_buffer is None:
+            return
+        transport = self.writer.transport
+        if transport.get_write_buffer_size() <= self.max_buffer:
+            return
+        self.overflowed = True
+        overflows.inc()
+        if self.overflow == ABORT:
+            transport.abort()
+        else:
+            asyncio.async(self.close_or_abort(1008, "Write buffer overflow"),
+                          loop=self._loop)
+        raise websockets.InvalidState("Write buffer overflow")
+
+    @asyncio.coroutine
+    def close_or_abort(self, code, reason):
+        """Close the connection, or abort it if that takes too long."""
+        # The close frame goes after the buffered data. If the client doesn't
+        # read it in time, it won't read anything else either.
+        try:
+            yield from asyncio.wait_for(
+                self.close(code, reason), self.timeout, loop=self._loop)
+        except asyncio.TimeoutError:
+            pass
+        if not self.connection_closed.done():
+            self.writer.transport.abort()
+
+    @asyncio.coroutine
+    def send_frame(self, frame):
+        """Send a frame built by encode_frame() without copying it."""
+        if not self.open:
+            raise websockets.InvalidState("Cannot write to a WebSocket "
+                                          "in the {} state".format(
+                                              self.state_name))
+        self.check_buffer()
+        if self.compressible(frame):
+            frame = self.deflate_frame(frame)
+        self.writer.write(frame)
+        messages_sent.value += 1
+        bytes_sent.value += len(frame) - header_length(frame)
+        if self.timeline is not None:
+            self.timeline.sent(frame[0] & 0x0f,
+                               len(frame) - header_length(frame))
+        try:
+            yield from self.writer.drain()
+        except ConnectionResetError:
+            # The worker notices the connection loss and closes it.
+            pass
+
+    def compressible(self, frame):
+        """Tell whether a frame built by encode_frame() must be compressed."""
+        return (self.deflate is not None and not frame[0] & 0x40 and
+                len(frame) - header_length(frame) >= self.deflate.min_size)
+
+    def deflate_frame(self, frame):
+        """Compress a frame built by encode_frame()."""
+        data = self.deflate.compress(memoryview(frame)[header_length(frame):])
+        return build_frame(frame[0] & 0x0f, data, rsv1=True)
+
+    def share_frame(self, frame, deflated):
+        """
+        Prepare a frame built by encode_frame() for broadcasting.
+
+        Without context takeover, the compressed frame only depends on the
+        window size: compress it now and keep it in ``deflated``, a dict of
+        compressed frames by window size, for other connections. Otherwise,
+        return the frame; send_frame() compresses it if needed.
+        """
+        if not self.compressible(frame) or self.deflate.server_takeover:
+            return frame
+        wbits = self.deflate.server_wbits
+        result = deflated.get(wbits)
+        if result is None:
+            result = deflated[wbits] = self.deflate_frame(frame)
+        return result
+
+    @asyncio.coroutine
+    def read_frame(self, max_size):
+        # Don't call super().read_frame(), its frame would stay suspended
+        # while the connection is idle.
+        frame, rsv1 = yield from read_frame(
+            self.reader.readexactly, not self.is_client, max_size=max_size)
+        self.last_seen = self._loop.time()
+        if rsv1:
+            if self.deflate is None or frame.opcode not in (
+                    OP_TEXT, OP_BINARY) or self.inflating:
+                raise websockets.WebSocketProtocolError(
+                    "Reserved bits must be 0")
+            self.inflating = True
+        if frame.opcode <= OP_BINARY:
+            self.last_message = self.last_seen
+            if frame.fin:
+                messages_received.value += 1
+            bytes_received.value += len(frame.data)
+            if self.inflating:
+                self.inflating = not frame.fin
+                frame = frame._replace(data=self.deflate.decompress(
+                    frame.data, frame.fin, max_size))
+            if self.timeline is not None:
+                self.timeline.received(frame)
+        return frame
+
+    @asyncio.coroutine
+    def write_frame(self, opcode, data=b''):
+        if opcode <= OP_BINARY and self.deflate is not None and (
+                len(data) >= self.deflate.min_size):
+            frame = build_frame(opcode, self.deflate.compress(data), True)
+            yield from self.send_frame(frame)
+            return
+        if opcode <= OP_BINARY and self.open:
+            self.check_buffer()
+        yield from super().write_frame(opcode, data)
+        if opcode <= OP_BINARY:
+            messages_sent.value += 1
+            bytes_sent.value += len(data)
+            if self.timeline is not None:
+                self.timeline.sent(opcode, len(data))
+
+
+class MessageQueue(list):
+    """
+    Received messages, in the subset of the asyncio.Queue API used by
+    websockets, plus a future for recv().
+    """
+
+    __slots__ = ('waiter', 'closed')
+
+    def __init__(self):
+        self.waiter = None
+        self.closed = False
+
+    def put_nowait(self, message):
+        self.append(message)
+        self.wake()
+
+    def close(self, worker=None):
+        self.closed = True
+        self.wake()
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+
 class WebSocketResponse(HttpResponse):
     """Upgrade from a WSGI connection with the WebSocket handshake."""
 
     status_code = 101
 
-    def __init__(self, environ, switch_protocols):
+    def __init__(self, environ, switch_protocols, compression=None):
         super().__init__()
+        self.deflate = None
 
         http_1_1 = environ['SERVER_PROTOCOL'] == 'HTTP/1.1'
         get_header = lambda k: environ['HTTP_' + k.upper().replace('-', '_')]
@@ -79,5 +619,13 @@ class WebSocketResponse(HttpResponse):
             set_header = self.__setitem__
             handshake.build_response(set_header, key)
 
+            offer = environ.get('HTTP_SEC_WEBSOCKET_EXTENSIONS')
+            if compression and compression['compress'] and offer:
+                accepted = negotiate(offer, compression['context_takeover'],
+                                     compression['compress_min_size'])
+                if accepted is not None:
+                    set_header('Sec-WebSocket-Extensions', accepted[0])
+                    self.deflate = accepted[1]
+
             # Here be dragons.
             self.close = switch_protocols
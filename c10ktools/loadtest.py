@@ -0,0 +1,191 @@
+import collections
+import multiprocessing
+import time
+
+import asyncio
+import websockets
+
+from .stats import Histogram
+
+
+class LoadTest:
+    """
+    Open WebSocket connections to an echo endpoint and measure latency.
+
+    Client ``i`` connects ``i / ramp`` seconds after the start. Then it sends
+    ``messages`` messages of ``size`` bytes, paced at ``rate`` messages per
+    second, or as fast as possible if ``rate`` is 0, and checks that each
+    message is echoed back.
+
+    With ``hold``, clients don't send messages until all clients have tried
+    to connect, so they're all connected at the same time.
+    """
+
+    def __init__(self, url, clients, ramp, messages, rate, size, stdout=None,
+                 hold=False):
+        self.url = url
+        self.clients = clients
+        self.ramp = ramp
+        self.messages = messages
+        self.rate = rate
+        self.size = size
+        self.stdout = stdout
+        self.hold = hold
+
+        self.connect_latency = Histogram()
+        self.round_trip_latency = Histogram()
+        self.errors = collections.Counter()
+        self.connected = 0
+        self.peak = 0
+        self.sent = 0
+        self.received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def run(self, share=0, shares=1, loop=None):
+        """Run the clients whose index is share modulo shares."""
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        start = loop.time()
+        clients = [self.client(index, start)
+                   for index in range(share, self.clients, shares)]
+        # Clients that haven't tried to connect yet, for hold.
+        self.connecting = len(clients)
+        self.all_connected = asyncio.Future(loop=loop)
+        if clients:
+            loop.run_until_complete(asyncio.wait(clients, loop=loop))
+        return self.result(loop.time() - start)
+
+    @asyncio.coroutine
+    def client(self, index, start):
+        loop = self.loop
+
+        # Distribute the connections evenly.
+        delay = start + index / self.ramp - loop.time()
+        if delay > 0:
+            yield from asyncio.sleep(delay, loop=loop)
+
+        begin = loop.time()
+        try:
+            ws = yield from websockets.connect(self.url, loop=loop)
+        except Exception as exc:
+            self.errors['connect: {}'.format(type(exc).__name__)] += 1
+            self.connect_done()
+            return
+        self.connect_latency.record(loop.time() - begin)
+        self.open_connection()
+        self.connect_done()
+
+        try:
+            if self.hold:
+                yield from self.all_connected
+            begin = loop.time()
+            for sequence in range(self.messages):
+                # Send on a fixed schedule, regardless of latency.
+                if self.rate:
+                    delay = begin + sequence / self.rate - loop.time()
+                    if delay > 0:
+                        yield from asyncio.sleep(delay, loop=loop)
+                message = '{}:{}:'.format(index, sequence).ljust(self.size, '.')
+                sent = loop.time()
+                yield from ws.send(message)
+                self.sent += 1
+                self.bytes_sent += len(message)
+                reply = yield from ws.recv()
+                if reply is None:
+                    self.errors['closed'] += 1
+                    break
+                self.round_trip_latency.record(loop.time() - sent)
+                self.received += 1
+                self.bytes_received += len(reply)
+                if reply != message:
+                    self.errors['mismatch'] += 1
+            yield from ws.close()
+        except Exception as exc:
+            self.errors[type(exc).__name__] += 1
+        finally:
+            self.close_connection()
+
+    def connect_done(self):
+        self.connecting -= 1
+        if self.connecting == 0:
+            self.all_connected.set_result(None)
+
+    def open_connection(self):
+        self.connected += 1
+        self.peak = max(self.peak, self.connected)
+        if self.stdout is None:
+            return
+        if self.connected % max(self.clients // 20, 1) == 0:
+            self.stdout.write("> {:5} connections\n".format(self.connected))
+        if self.connected == self.clients:
+            self.stdout.write("\n{} clients are connected!\n\n".format(self.connected))
+
+    def close_connection(self):
+        self.connected -= 1
+        if self.stdout is None:
+            return
+        if self.connected % max(self.clients // 20, 1) == 0:
+            self.stdout.write("< {:5} connections\n".format(self.connected))
+
+    def result(self, duration):
+        return {
+            'duration': duration,
+            'peak_connections': self.peak,
+            'messages_sent': self.sent,
+            'messages_received': self.received,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'errors': dict(self.errors),
+            'connect_latency': self.connect_latency.to_dict(),
+            'round_trip_latency': self.round_trip_latency.to_dict(),
+        }
+
+
+def run_share(options, share, shares):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return LoadTest(**options).run(share, shares, loop)
+    finally:
+        loop.close()
+
+
+def run(url, clients, ramp, messages, rate, size, processes=1, stdout=None):
+    """Run a load test, possibly in several processes, and return a report."""
+    options = {
+        'url': url,
+        'clients': clients,
+        'ramp': ramp,
+        'messages': messages,
+        'rate': rate,
+        'size': size,
+    }
+    begin = time.time()
+    if processes == 1:
+        results = [LoadTest(stdout=stdout, **options).run()]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(
+                run_share, [(options, share, processes)
+                            for share in range(processes)])
+    duration = time.time() - begin
+
+    report = dict(options, processes=processes, duration=duration)
+    # Peaks in different processes may not coincide: this is an upper bound.
+    report['peak_connections'] = sum(r['peak_connections'] for r in results)
+    for key in ['messages_sent', 'messages_received',
+                'bytes_sent', 'bytes_received']:
+        report[key] = sum(r[key] for r in results)
+    report['throughput'] = report['messages_received'] / duration
+    errors = collections.Counter()
+    for result in results:
+        errors.update(result['errors'])
+    report['errors'] = dict(errors)
+    for key in ['connect_latency', 'round_trip_latency']:
+        histogram = Histogram()
+        for result in results:
+            histogram.merge(Histogram.from_dict(result[key]))
+        report[key] = histogram.summary()
+    return report
@@ -0,0 +1,52 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...replay import run
+
+
+class Command(BaseCommand):
+
+    BASE_URL = 'ws://localhost:8000'
+
+    args = '<capture file>'
+    option_list = BaseCommand.option_list + (
+        make_option('-s', '--speed', type='float', default=1,
+                    help='Replay speed relative to the recording, '
+                         'or 0 to replay as fast as possible.'),
+        make_option('-c', '--concurrency', type='int', default=100,
+                    help='The number of concurrent handshakes.'),
+        make_option('-w', '--linger', type='float', default=1,
+                    help='Seconds each connection waits for replies after '
+                         'its last message.'),
+        make_option('-u', '--url', default=BASE_URL,
+                    help='The base URL of the server.'),
+        make_option('-o', '--output',
+                    help='Write a JSON report to this file.'),
+    )
+    help = 'Replays WebSocket traffic recorded with C10KTOOLS_WEBSOCKET_CAPTURE.'
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Usage: replay {}".format(self.args))
+        try:
+            report = run(options['url'], args[0],
+                         options['speed'], options['concurrency'],
+                         options['linger'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+
+        self.stdout.write("Duration:    {:10.3f} s\n".format(report['duration']))
+        self.stdout.write("Connections: {:10}\n".format(report['connections']))
+        self.stdout.write("Messages:    {:10} sent, {} received of {} "
+                          "expected\n".format(report['messages_sent'],
+                                              report['messages_received'],
+                                              report['messages_expected']))
+        self.stdout.write("Throughput:  {:10.1f} messages/s\n".format(report['throughput']))
+        for error, count in sorted(report['errors'].items()):
+            self.stdout.write("Error:       {:10} {}\n".format(count, error))
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=4, sort_keys=True)
@@ -0,0 +1,32 @@
+import os
+
+import asyncio
+
+from django.core.management.base import NoArgsCommand
+
+from ...broker import Broker
+from ...bus import DEFAULT_PATH
+from ...conf import get_setting
+
+
+class Command(NoArgsCommand):
+
+    help = 'Runs the message broker shared by server processes.'
+
+    def handle_noargs(self, **options):
+        config = get_setting('BUS')
+        path = config.get('OPTIONS', {}).get('path', DEFAULT_PATH)
+        if os.path.exists(path):
+            os.unlink(path)
+
+        loop = asyncio.get_event_loop()
+        broker = Broker(path, loop)
+        loop.run_until_complete(broker.start())
+        self.stdout.write("Broker listening on {}\n".format(path))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(broker.stop())
+            os.unlink(path)
@@ -1,58 +1,61 @@
-import random
-
-import asyncio
-import websockets
+import json
+from optparse import make_option
 
 from django.core.management.base import NoArgsCommand
 
+from ...loadtest import run
+
 
 class Command(NoArgsCommand):
 
     CLIENTS = 10000
     DELAY = 60
-    ECHO_URL = 'ws://localhost:8000/test/ws/'
+    ECHO_URL = 'ws://localhost:8000/test/ws/loopback/'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('-c', '--clients', type='int', default=CLIENTS,
+                    help='The number of clients.'),
+        make_option('-r', '--ramp', type='float', default=CLIENTS / DELAY / 2,
+                    help='The number of new connections per second.'),
+        make_option('-m', '--messages', type='int', default=3,
+                    help='The number of messages sent by each client.'),
+        make_option('-l', '--rate', type='float', default=1 / DELAY,
+                    help='The number of messages per second sent by each '
+                         'client, or 0 to send as fast as possible.'),
+        make_option('-s', '--size', type='int', default=16,
+                    help='The size of messages in bytes.'),
+        make_option('-p', '--processes', type='int', default=1,
+                    help='The number of client processes.'),
+        make_option('-u', '--url', default=ECHO_URL,
+                    help='The URL of the echo endpoint.'),
+        make_option('-o', '--output',
+                    help='Write a JSON report to this file.'),
+    )
+    help = 'Runs a load test against a WebSocket echo endpoint.'
 
     def handle_noargs(self, **options):
-        self.count = 0
-        connections = [self.test_echo() for _ in range(self.CLIENTS)]
-        asyncio.get_event_loop().run_until_complete(asyncio.wait(connections))
-        assert self.count == 0
-
-    @asyncio.coroutine
-    def test_echo(self):
-
-        # Distribute the connections a bit
-        yield from asyncio.sleep(2 * self.DELAY * random.random())
-        ws = yield from websockets.connect(self.ECHO_URL)
-
-        self.count += 1
-        if self.count % (self.CLIENTS * 3 // self.DELAY) == 0:
-            self.stdout.write("> {:5} connections\n".format(self.count))
-        if self.count == self.CLIENTS:
-            self.stdout.write("\n{} clients are connected!\n\n".format(self.count))
-
-        messages = []
-        messages.append((yield from ws.recv()))
-        yield from asyncio.sleep(self.DELAY)
-        yield from ws.send('Spam?')
-        messages.append((yield from ws.recv()))
-        yield from asyncio.sleep(self.DELAY)
-        yield from ws.send('Eggs!')
-        messages.append((yield from ws.recv()))
-        yield from asyncio.sleep(self.DELAY)
-        yield from ws.send('Python.')
-        messages.append((yield from ws.recv()))
-        messages.append((yield from ws.recv()))
-        assert messages == [
-            "Hello!",
-            "1. Spam?",
-            "2. Eggs!",
-            "3. Python.",
-            "Goodbye!",
-        ]
-
-        yield from ws.close()
-
-        self.count -= 1
-        if self.count % (self.CLIENTS * 3 // self.DELAY) == 0:
-            self.stdout.write("< {:5} connections\n".format(self.count))
+        report = run(
+            options['url'], options['clients'], options['ramp'],
+            options['messages'], options['rate'], options['size'],
+            options['processes'], self.stdout)
+
+        self.stdout.write("\n")
+        self.stdout.write("Duration:    {:10.3f} s\n".format(report['duration']))
+        self.stdout.write("Peak:        {:10} connections\n".format(report['peak_connections']))
+        self.stdout.write("Messages:    {:10} sent, {} received\n".format(
+            report['messages_sent'], report['messages_received']))
+        self.stdout.write("Throughput:  {:10.1f} messages/s\n".format(report['throughput']))
+        for key, label in [('connect_latency', "Connect:"),
+                           ('round_trip_latency', "Round trip:")]:
+            summary = report[key]
+            if summary['count']:
+                self.stdout.write(
+                    "{:12} p50 {:8.2f} ms  p95 {:8.2f} ms  p99 {:8.2f} ms\n".format(
+                        label, summary['p50'] * 1000, summary['p95'] * 1000,
+                        summary['p99'] * 1000))
+        for error, count in sorted(report['errors'].items()):
+            self.stdout.write("Error:       {:10} {}\n".format(count, error))
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=4, sort_keys=True)
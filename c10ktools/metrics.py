@@ -0,0 +1,181 @@
+"""
+Process-wide metrics in the Prometheus text exposition format.
+
+Updating a metric is an attribute increment or a bisection, which keeps the
+cost on hot paths negligible. Labeled metrics return a child per combination
+of label values; callers on hot paths should look it up once and keep it.
+
+Each server process has its own metrics. With several workers, a scrape only
+sees the process that handled it.
+"""
+
+import bisect
+import os
+
+
+class Metric:
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.children = {}
+        if not labels:
+            self.children[()] = self
+        register(self)
+
+    def child(self, *values):
+        """Return the metric for these label values."""
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self.new_child()
+        return child
+
+    def collect(self):
+        """Yield (suffix, labels, value) tuples."""
+        for values, child in sorted(self.children.items()):
+            labels = list(zip(self.labels, values))
+            for suffix, extra, value in child.samples():
+                yield suffix, labels + extra, value
+
+
+class Counter(Metric):
+
+    type = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        self.value = 0
+        super().__init__(*args, **kwargs)
+
+    def new_child(self):
+        child = Counter.__new__(Counter)
+        child.value = 0
+        return child
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield '', [], self.value
+
+
+class Gauge(Counter):
+
+    type = 'gauge'
+
+    def new_child(self):
+        child = Gauge.__new__(Gauge)
+        child.value = 0
+        return child
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class GaugeFunction(Metric):
+    """Gauge whose value is computed by a function when it's collected."""
+
+    type = 'gauge'
+
+    def __init__(self, name, help, function):
+        self.function = function
+        super().__init__(name, help)
+
+    def samples(self):
+        yield '', [], self.function()
+
+
+INF = float('inf')
+
+# Bounds in seconds, suitable for durations from a millisecond to an hour.
+DURATIONS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5,
+             1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class Histogram(Metric):
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DURATIONS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        super().__init__(name, help, labels)
+
+    def new_child(self):
+        child = Histogram.__new__(Histogram)
+        child.buckets = self.buckets
+        child.counts = [0] * (len(self.buckets) + 1)
+        child.sum = 0
+        return child
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        count = 0
+        for bound, bucket_count in zip(self.buckets + (INF,),
+                                       self.counts):
+            count += bucket_count
+            yield '_bucket', [('le', format_value(bound))], count
+        yield '_sum', [], self.sum
+        yield '_count', [], count
+
+
+registry = {}
+
+
+def register(metric):
+    # Registering a metric with the same name replaces the previous one.
+    registry[metric.name] = metric
+
+
+def unregister(metric):
+    if registry.get(metric.name) is metric:
+        del registry[metric.name]
+
+
+def format_value(value):
+    if value == INF:
+        return '+Inf'
+    return repr(float(value))
+
+
+def escape(value):
+    return (str(value).replace('\\', r'\\').replace('\n', r'\n')
+            .replace('"', r'\"'))
+
+
+def render():
+    """Return all metrics in the Prometheus text format."""
+    lines = []
+    for name, metric in sorted(registry.items()):
+        lines.append('# HELP {} {}'.format(name, metric.help))
+        lines.append('# TYPE {} {}'.format(name, metric.type))
+        for suffix, labels, value in metric.collect():
+            if labels:
+                labels = '{' + ','.join('{}="{}"'.format(key, escape(label))
+                                        for key, label in labels) + '}'
+            else:
+                labels = ''
+            lines.append('{}{}{} {}'.format(
+                name, suffix, labels, format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def resident_memory():
+    """Return the resident set size of this process in bytes, on Linux."""
+    with open('/proc/self/statm') as handle:
+        return int(handle.read().split()[1]) * PAGE_SIZE
+
+
+if os.path.exists('/proc/self/statm'):
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+    GaugeFunction('process_resident_memory_bytes',
+                  "Resident memory size in bytes.", resident_memory)
@@ -1,31 +1,196 @@
+import functools
+import os
+import signal
+import socket
+import subprocess
+import sys
+from optparse import make_option
+
 import asyncio
 
 from aiohttp.wsgi import WSGIServerHttpProtocol
 
+from django.core.management.base import CommandError
+
+from .conf import get_setting
+from .http.body import SpoolingHandler
+from .http.executor import ThreadPoolHandler
+from .http import capture
+from .http.websockets import drain
+from .profiler import Profiler
+from .supervisor import Supervisor, create_socket
+
+# Listening sockets passed to a new server process, as comma-separated
+# fd:family pairs.
+LISTEN_FDS = 'C10KTOOLS_LISTEN_FDS'
+
 
-def run(addr, port, wsgi_handler, loop=None, stop=None, **options):
+def run(addr, port, wsgi_handler, loop=None, stop=None, ready=None,
+        workers=1, reuse_port=False, threads=None, drain_timeout=None,
+        drain_spread=None, **options):
     """
     Alternate version of django.core.servers.basehttp.run running on asyncio.
+
+    With ``workers`` > 1, run that many worker processes, each with its own
+    event loop, listening on the same port with SO_REUSEPORT.
+
+    With ``threads`` > 0, run ordinary requests in that many threads in each
+    process. WebSocket handshakes always run on the event loop.
+
+    On exit, the server stops accepting connections and drains WebSocket
+    connections over ``drain_spread`` seconds, waiting for handlers for up to
+    ``drain_timeout`` seconds. Without ``stop``, SIGTERM exits gracefully and
+    SIGUSR2 starts a new server process on the same listening sockets before
+    exiting, which restarts the server without refusing connections.
     """
+    if threads is None:
+        threads = get_setting('WSGI_THREADS')
+    if drain_timeout is None:
+        drain_timeout = get_setting('DRAIN_TIMEOUT')
+    if drain_spread is None:
+        drain_spread = get_setting('DRAIN_SPREAD')
+
+    if workers > 1:
+        target = functools.partial(run_worker, addr, port, wsgi_handler,
+                                   threads=threads,
+                                   drain_timeout=drain_timeout,
+                                   drain_spread=drain_spread, **options)
+        # Leave workers time to drain before killing them.
+        Supervisor(target, workers, max(10, drain_timeout + 5)).run()
+        return
+
     if loop is None:
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
     # The code that reads environ['wsgi.input'] is deep inside Django and hard
-    # to make asynchronous. Pre-loading the payload is the simplest option.
+    # to make asynchronous. Stream the payload to handlers running in threads
+    # and spool it for handlers running on the event loop.
+    if threads:
+        wsgi_handler = ThreadPoolHandler(
+            wsgi_handler, threads, get_setting('WSGI_QUEUE'), loop,
+            get_setting('BODY_BUFFER'))
+    else:
+        wsgi_handler = SpoolingHandler(
+            wsgi_handler, get_setting('BODY_MAX_MEMORY'))
     protocol_factory = lambda: WSGIServerHttpProtocol(
-            wsgi_handler, readpayload=True)
-    server = loop.run_until_complete(
-            loop.create_server(protocol_factory, addr, port))
+            wsgi_handler, readpayload=False)
+    if reuse_port:
+        sockets = [create_socket(addr, port, options.get('ipv6', False), True)]
+    else:
+        sockets = inherited_sockets()
+    if sockets:
+        servers = [loop.run_until_complete(
+                loop.create_server(protocol_factory, sock=sock))
+                for sock in sockets]
+    else:
+        servers = [loop.run_until_complete(
+                loop.create_server(protocol_factory, addr, port))]
+    if stop is None:
+        stop = asyncio.Future(loop=loop)
+        handle_signals(loop, stop, servers)
+    profiler = None
+    if get_setting('PROFILER_THRESHOLD') is not None:
+        profiler = Profiler(loop, get_setting('PROFILER_THRESHOLD'))
+        profiler.start()
+    if ready is not None:
+        ready(servers[0])
     try:
-        if stop is None:
-            loop.run_forever()
-        else:
-            loop.run_until_complete(stop)
+        loop.run_until_complete(stop)
     finally:
-        server.close()
-        loop.run_until_complete(server.wait_closed())
+        for server in servers:
+            server.close()
+        loop.run_until_complete(drain(drain_timeout, drain_spread, loop))
+        for server in servers:
+            loop.run_until_complete(server.wait_closed())
+        capture.flush()
+        if threads:
+            wsgi_handler.close()
+        if profiler is not None:
+            profiler.stop()
+
+
+def handle_signals(loop, stop, servers):
+    """Exit on SIGTERM; hand the listening sockets over on SIGUSR2."""
+
+    def on_sigterm():
+        if not stop.done():
+            stop.set_result(None)
+
+    def on_sigusr2():
+        if not stop.done():
+            hand_off([sock for server in servers for sock in server.sockets])
+            stop.set_result(None)
+
+    try:
+        loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+        loop.add_signal_handler(signal.SIGUSR2, on_sigusr2)
+    except RuntimeError:
+        # Signals are only delivered to the main thread. Django's autoreloader
+        # runs the server in another thread: use --noreload.
+        pass
+
+
+def hand_off(sockets):
+    """Start a new server process listening on the same sockets."""
+    env = dict(os.environ)
+    env[LISTEN_FDS] = ','.join('{}:{}'.format(sock.fileno(), int(sock.family))
+                               for sock in sockets)
+    return subprocess.Popen([sys.executable] + sys.argv, env=env,
+                            pass_fds=[sock.fileno() for sock in sockets])
+
+
+def inherited_sockets():
+    """Return the listening sockets passed by hand_off(), if any."""
+    sockets = []
+    for item in os.environ.pop(LISTEN_FDS, '').split(','):
+        if not item:
+            continue
+        fd, family = item.split(':')
+        sock = socket.socket(int(family), socket.SOCK_STREAM, fileno=int(fd))
+        sock.setblocking(False)
+        sockets.append(sock)
+    return sockets
+
+
+def run_worker(addr, port, wsgi_handler, notify, **options):
+    """Run one worker process of a multi-process server until SIGTERM."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stop = asyncio.Future(loop=loop)
+
+    def on_sigterm():
+        if not stop.done():
+            stop.set_result(None)
+
+    loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+    try:
+        run(addr, port, wsgi_handler, loop, stop, lambda server: notify(),
+            reuse_port=True, **options)
+    finally:
+        loop.close()
 
 
 def patch():
     from django.core.management.commands import runserver
+
     runserver.run = run
+    runserver.Command.option_list += (
+        make_option('--workers', type='int', default=1,
+                    help='The number of server processes.'),
+        make_option('--threads', type='int', default=None,
+                    help='The number of threads running ordinary requests '
+                         'in each server process.'),
+    )
+
+    handle = runserver.Command.handle
+
+    @functools.wraps(handle)
+    def handle_with_workers(self, *args, **options):
+        workers = options.get('workers') or 1
+        if workers > 1 and options.get('use_reloader'):
+            raise CommandError("--workers requires --noreload.")
+        runserver.run = functools.partial(run, workers=workers,
+                                          threads=options.get('threads'))
+        return handle(self, *args, **options)
+
+    runserver.Command.handle = handle_with_workers
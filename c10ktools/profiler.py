@@ -0,0 +1,126 @@
+"""
+Detect when something blocks the event loop and report what it was.
+
+A callback scheduled on the event loop at regular intervals measures how late
+it runs: that's the loop lag. A watchdog thread checks that the callback ran
+recently. When it didn't, the loop is blocked: the watchdog captures the stack
+of the loop's thread, and looks for a WebSocket handler registered by the
+websocket decorator to tell which view is responsible.
+
+This costs one callback per interval and one thread. When the profiler isn't
+started, it costs nothing.
+"""
+
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+loop_lag = metrics.Histogram(
+    'c10ktools_loop_lag_seconds',
+    "Delay of callbacks scheduled on the event loop.")
+loop_stalls = metrics.Counter(
+    'c10ktools_loop_stalls_total',
+    "Times the event loop was blocked for longer than the threshold.",
+    ('endpoint',))
+
+# Code objects of WebSocket handlers, mapped to the names of their views.
+endpoints = {}
+
+
+def register(handler, endpoint):
+    endpoints[handler.__code__] = endpoint
+
+
+def find_endpoint(frame):
+    """Return the name of the innermost registered handler in a stack."""
+    while frame is not None:
+        endpoint = endpoints.get(frame.f_code)
+        if endpoint is not None:
+            return endpoint
+        frame = frame.f_back
+    return 'unknown'
+
+
+Stall = collections.namedtuple('Stall', 'endpoint stack duration')
+
+
+class Profiler:
+    """
+    Sample the lag of ``loop`` and report when it blocks for ``threshold``
+    seconds or more.
+
+    The ``history`` last stalls are kept in ``stalls``.
+    """
+
+    def __init__(self, loop, threshold=0.1, history=100):
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = threshold / 2
+        self.stalls = collections.deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.handle = None
+        self.watchdog = None
+
+    def start(self):
+        # This must run in the thread of the event loop.
+        self.thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.expected = self.heartbeat + self.interval
+        self.pending = None
+        self.handle = self.loop.call_later(self.interval, self.tick)
+        self.watchdog = threading.Thread(target=self.watch, daemon=True,
+                                         name='c10ktools profiler')
+        self.watchdog.start()
+
+    def stop(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if self.watchdog is not None:
+            self.stopped.set()
+            self.watchdog.join()
+            self.watchdog = None
+
+    def tick(self):
+        # Runs in the event loop.
+        now = time.monotonic()
+        loop_lag.observe(max(now - self.expected, 0))
+        with self.lock:
+            pending, self.pending = self.pending, None
+            duration = now - self.heartbeat - self.interval
+            self.heartbeat = now
+        if pending is not None:
+            self.report(Stall(pending.endpoint, pending.stack, duration))
+        self.expected = now + self.interval
+        self.handle = self.loop.call_later(self.interval, self.tick)
+
+    def watch(self):
+        # Runs in the watchdog thread.
+        while not self.stopped.wait(self.interval / 2):
+            with self.lock:
+                if self.pending is not None:
+                    continue
+                blocked = time.monotonic() - self.heartbeat - self.interval
+                if blocked < self.threshold:
+                    continue
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is None:
+                    continue
+                self.pending = Stall(
+                    find_endpoint(frame), traceback.format_stack(frame), None)
+                del frame
+
+    def report(self, stall):
+        self.stalls.append(stall)
+        loop_stalls.child(stall.endpoint).inc()
+        logger.warning("Event loop blocked for %.3fs in %s\n%s",
+                       stall.duration, stall.endpoint, ''.join(stall.stack))
@@ -0,0 +1,134 @@
+"""
+Replay WebSocket traffic recorded by c10ktools.http.capture.
+
+Each recorded connection is opened again on the same path and sends the
+frames it received, at the recorded times divided by ``speed``, or as fast as
+possible if ``speed`` is 0. Then it waits for as many messages as the server
+sent in the recording. Since no client logic runs, the load is repeatable and
+the replay measures the message path of the server.
+"""
+
+import collections
+
+import asyncio
+import websockets
+from websockets.framing import OP_TEXT
+
+from .http.capture import CLOSED, RECEIVED, SENT, load
+
+
+class Replay:
+    """
+    Replay ``connections``, a list returned by capture.load(), against the
+    server at ``url``, with at most ``concurrency`` concurrent handshakes.
+
+    After sending its last message, each connection waits up to ``linger``
+    seconds for the server's replies.
+    """
+
+    def __init__(self, url, connections, speed=1, concurrency=100, linger=1):
+        self.url = url.rstrip('/')
+        self.connections = connections
+        self.speed = speed
+        self.concurrency = concurrency
+        self.linger = linger
+
+        self.errors = collections.Counter()
+        self.sent = 0
+        self.expected = 0
+        self.received = 0
+        self.bytes_received = 0
+
+    def run(self, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        self.handshakes = asyncio.Semaphore(self.concurrency, loop=loop)
+        start = loop.time()
+        # Time of the first connection in the recording.
+        origin = (min(c.time for c in self.connections)
+                  if self.connections else 0)
+        clients = [self.client(connection, start, origin)
+                   for connection in self.connections]
+        if clients:
+            loop.run_until_complete(asyncio.wait(clients, loop=loop))
+        return self.result(loop.time() - start)
+
+    @asyncio.coroutine
+    def wait_until(self, start, time):
+        if self.speed:
+            delay = start + time / self.speed - self.loop.time()
+            if delay > 0:
+                yield from asyncio.sleep(delay, loop=self.loop)
+
+    @asyncio.coroutine
+    def client(self, connection, start, origin):
+        loop = self.loop
+        start -= origin / self.speed if self.speed else 0
+        yield from self.wait_until(start, connection.time)
+
+        expected = sum(1 for event in connection.events if event.kind == SENT)
+        self.expected += expected
+        try:
+            with (yield from self.handshakes):
+                ws = yield from websockets.connect(
+                    self.url + connection.path, loop=loop)
+        except Exception as exc:
+            self.errors['connect: {}'.format(type(exc).__name__)] += 1
+            return
+
+        replies = asyncio.async(self.read(ws, expected), loop=loop)
+        try:
+            fragments = []
+            for event in connection.events:
+                if event.kind == CLOSED:
+                    # Give the server as much time as in the recording.
+                    yield from self.wait_until(start, event.time)
+                    break
+                if event.kind != RECEIVED:
+                    continue
+                yield from self.wait_until(start, event.time)
+                fragments.append(event.data)
+                if event.opcode:
+                    opcode = event.opcode
+                if not event.fin:
+                    continue
+                message = b''.join(fragments)
+                fragments = []
+                if opcode == OP_TEXT:
+                    message = message.decode('utf-8')
+                yield from ws.send(message)
+                self.sent += 1
+            yield from asyncio.wait([replies], timeout=self.linger, loop=loop)
+            yield from ws.close()
+        except Exception as exc:
+            self.errors[type(exc).__name__] += 1
+        finally:
+            replies.cancel()
+
+    @asyncio.coroutine
+    def read(self, ws, expected):
+        """Receive ``expected`` messages, or until the connection closes."""
+        for _ in range(expected):
+            message = yield from ws.recv()
+            if message is None:
+                break
+            self.received += 1
+            self.bytes_received += len(message)
+
+    def result(self, duration):
+        return {
+            'duration': duration,
+            'connections': len(self.connections),
+            'messages_sent': self.sent,
+            'messages_expected': self.expected,
+            'messages_received': self.received,
+            'bytes_received': self.bytes_received,
+            'throughput': self.received / duration if duration else 0,
+            'errors': dict(self.errors),
+        }
+
+
+def run(url, path, speed=1, concurrency=100, linger=1):
+    """Replay a capture file and return a report."""
+    return Replay(url, load(path), speed, concurrency, linger).run()
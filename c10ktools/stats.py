@@ -0,0 +1,92 @@
+import collections
+import math
+
+
+class Histogram:
+    """
+    Histogram of positive values, typically durations in seconds.
+
+    Buckets grow geometrically by ``growth``, so percentiles are accurate
+    within ``growth - 1`` relative error regardless of the range of values,
+    and memory is bounded by the number of distinct buckets.
+    """
+
+    def __init__(self, growth=1.02):
+        self.growth = growth
+        self.log_growth = math.log(growth)
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        self.buckets[self.bucket(value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def bucket(self, value):
+        # Values at or below 1µs end up in the same bucket.
+        return math.floor(math.log(max(value, 1e-6)) / self.log_growth)
+
+    def upper_bound(self, bucket):
+        return math.exp((bucket + 1) * self.log_growth)
+
+    def percentile(self, percent):
+        """Return an upper bound of the given percentile."""
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.upper_bound(bucket), self.max)
+
+    def merge(self, other):
+        assert other.growth == self.growth
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                if self.min is None or value < self.min:
+                    self.min = value
+                if self.max is None or value > self.max:
+                    self.max = value
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'min': self.min,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+    def to_dict(self):
+        """Return a JSON-serializable representation."""
+        return {
+            'growth': self.growth,
+            'buckets': {str(k): v for k, v in self.buckets.items()},
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['growth'])
+        histogram.buckets.update({int(k): v for k, v in data['buckets'].items()})
+        histogram.count = data['count']
+        histogram.sum = data['sum']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
@@ -0,0 +1,131 @@
+import os
+import select
+import signal
+import socket
+import sys
+import traceback
+
+
+def create_socket(addr, port, ipv6=False, reuse_port=False, backlog=100):
+    """Create a listening socket, optionally shared with SO_REUSEPORT."""
+    family = socket.AF_INET6 if ipv6 else socket.AF_INET
+    infos = socket.getaddrinfo(addr, port, family, socket.SOCK_STREAM, 0,
+                               socket.AI_PASSIVE)
+    family, socktype, proto, _, address = infos[0]
+    sock = socket.socket(family, socktype, proto)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                raise RuntimeError("SO_REUSEPORT isn't supported on this system.")
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+        sock.listen(backlog)
+    except Exception:
+        sock.close()
+        raise
+    sock.setblocking(False)
+    return sock
+
+
+class Supervisor:
+    """
+    Run a server in several worker processes.
+
+    ``target(notify)`` runs in each worker. It must call ``notify()`` once
+    it's ready to accept connections and return when it receives SIGTERM.
+
+    Workers are started one at a time and each must report ready before the
+    next one starts. Workers that exit unexpectedly are restarted. SIGINT and
+    SIGTERM stop all workers; those that don't exit within ``timeout`` seconds
+    are killed.
+    """
+
+    def __init__(self, target, workers, timeout=10):
+        self.target = target
+        self.workers = workers
+        self.timeout = timeout
+        self.pids = set()
+        self.stopping = False
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGALRM, self.kill)
+        try:
+            for _ in range(self.workers):
+                if not self.stopping:
+                    self.spawn()
+        except BaseException:
+            self.stop()
+            raise
+        finally:
+            self.wait()
+            signal.alarm(0)
+
+    def wait(self):
+        while self.pids:
+            try:
+                pid, _ = os.wait()
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+            self.pids.discard(pid)
+            if not self.stopping:
+                sys.stderr.write("Worker {} exited, restarting.\n".format(pid))
+                try:
+                    self.spawn()
+                except RuntimeError:
+                    traceback.print_exc()
+                    self.stop()
+
+    def spawn(self):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:                                        # pragma: no cover
+            os.close(read_fd)
+            # The parent coordinates shutdown: ignore ^C in the terminal.
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+            code = 0
+            try:
+                self.target(lambda: os.write(write_fd, b'.'))
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+
+        os.close(write_fd)
+        self.pids.add(pid)
+        try:
+            while True:
+                try:
+                    ready, _, _ = select.select([read_fd], [], [], self.timeout)
+                except InterruptedError:
+                    if self.stopping:
+                        return
+                    continue
+                if not ready or not os.read(read_fd, 1):
+                    raise RuntimeError("Worker {} failed to start.".format(pid))
+                return
+        finally:
+            os.close(read_fd)
+
+    def stop(self, *args):
+        self.stopping = True
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        signal.alarm(self.timeout)
+
+    def kill(self, *args):
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
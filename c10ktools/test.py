@@ -1,26 +1,40 @@
+import os
+import resource
 import threading
+import unittest
 
 import asyncio
 
-from selenium.webdriver import Firefox
-
 from django.contrib.staticfiles.handlers import StaticFilesHandler
 from django.core.servers.basehttp import get_internal_wsgi_application
 from django.test import TestCase
 
+from .loadtest import LoadTest
 from .monkey import run
+from .stats import Histogram
 
+# Time budgets depend on the speed of the machine running the tests. They're
+# only checked when this environment variable is set, for instance on a
+# machine dedicated to benchmarks.
+CHECK_BUDGETS = 'C10KTOOLS_CHECK_BUDGETS'
 
 # Since it's hard to subclass LiveServerTestCase to run on top of asyncio, and
 # since we don't need to share a database connection between the live server
 # and the tests, we use a simple ServerTestCase instead of LiveServerTestCase.
 
 class ServerTestCase(TestCase):
+    """
+    Run the asyncio server in a thread, on an ephemeral port.
+
+    The URL of the server is in ``live_server_url``.
+    """
+
+    host = '127.0.0.1'
 
     @classmethod
     def setUpClass(cls):
         super(ServerTestCase, cls).setUpClass()
-        cls.start_server('localhost', 8999)
+        cls.start_server(cls.host, 0)
 
     @classmethod
     def tearDownClass(cls):
@@ -29,10 +43,13 @@ class ServerTestCase(TestCase):
 
     @classmethod
     def start_server(cls, host, port):
-        cls.live_server_url = 'http://{}:{}'.format(host, port)
+        cls.server_ready = threading.Event()
         cls.server_thread = threading.Thread(target=cls.run_server,
                                              args=(host, port))
         cls.server_thread.start()
+        if not cls.server_ready.wait(10):
+            raise RuntimeError("Server didn't start")
+        cls.live_server_url = 'http://{}:{}'.format(host, cls.server_port)
 
     @classmethod
     def run_server(cls, host, port):
@@ -42,20 +59,95 @@ class ServerTestCase(TestCase):
         cls.server_thread_loop = asyncio.new_event_loop()
         asyncio.set_event_loop(cls.server_thread_loop)
         cls.server_stop = asyncio.Future()
-        run(host, port, handler, cls.server_thread_loop, cls.server_stop)
+        run(host, port, handler, cls.server_thread_loop, cls.server_stop,
+            cls.server_started)
         cls.server_thread_loop.close()
 
+    @classmethod
+    def server_started(cls, server):
+        cls.server_port = server.sockets[0].getsockname()[1]
+        cls.server_ready.set()
+
     @classmethod
     def stop_server(cls):
         cls.server_thread_loop.call_soon_threadsafe(cls.server_stop.set_result, None)
         cls.server_thread.join()
 
 
+class WebSocketTestCase(ServerTestCase):
+    """
+    Drive many WebSocket clients against the server and check budgets.
+
+    Clients are coroutines on an event loop in the test thread, so thousands
+    of them are cheap and no browser is needed.
+    """
+
+    @classmethod
+    def require_file_descriptors(cls, count):
+        """
+        Raise the soft limit on open files to ``count`` if it's lower.
+
+        Each client uses two file descriptors, one in the client and one in
+        the server. Skip the tests if the hard limit is too low.
+        """
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft == resource.RLIM_INFINITY or soft >= count:
+            return
+        if hard != resource.RLIM_INFINITY and hard < count:
+            raise unittest.SkipTest(
+                "Needs {} file descriptors, the limit is {}".format(
+                    count, hard))
+        resource.setrlimit(resource.RLIMIT_NOFILE, (count, hard))
+
+    def load_test(self, path, clients, messages=1, rate=0, size=16,
+                  ramp=None, hold=False):
+        """
+        Run a load test against the echo endpoint at ``path``: see LoadTest.
+
+        By default, clients connect within a tenth of a second. Return the
+        report of LoadTest.run().
+        """
+        url = self.live_server_url.replace('http', 'ws') + path
+        if ramp is None:
+            ramp = clients * 10
+        loop = asyncio.new_event_loop()
+        try:
+            return LoadTest(url, clients, ramp, messages, rate, size,
+                            hold=hold).run(loop=loop)
+        finally:
+            loop.close()
+
+    def assertWithinBudget(self, report, duration=None, throughput=None,
+                           p99=None):
+        """
+        Check that a load test had no errors, took at most ``duration``
+        seconds, echoed at least ``throughput`` messages per second, and
+        that 99% of round trips took at most ``p99`` seconds.
+
+        Time budgets are only checked when C10KTOOLS_CHECK_BUDGETS is set in
+        the environment.
+        """
+        self.assertEqual(report['errors'], {})
+        self.assertEqual(report['messages_received'], report['messages_sent'])
+        if not os.environ.get(CHECK_BUDGETS):
+            return
+        if duration is not None:
+            self.assertLessEqual(report['duration'], duration)
+        if throughput is not None:
+            self.assertGreaterEqual(
+                report['messages_received'] / report['duration'], throughput)
+        if p99 is not None:
+            latency = Histogram.from_dict(report['round_trip_latency'])
+            self.assertLessEqual(latency.percentile(99), p99)
+
+
 class SeleniumTestCase(ServerTestCase):
 
     @classmethod
     def setUpClass(cls):
         super(SeleniumTestCase, cls).setUpClass()
+        # Import Selenium here, tests that don't use it don't require it.
+        from selenium.webdriver import Firefox
         cls.selenium = Firefox()
 
     @classmethod
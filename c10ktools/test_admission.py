@@ -0,0 +1,82 @@
+from django.test import SimpleTestCase
+
+from . import metrics
+from .http.admission import Admission, TokenBucket
+
+
+class Clock:
+
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_burst(self):
+        bucket = TokenBucket(10, 3, clock=self.clock)
+        self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(), 0.1)
+
+    def test_refill(self):
+        bucket = TokenBucket(10, 1, clock=self.clock)
+        self.assertEqual(bucket.take(), 0)
+        self.clock.time += 0.05
+        self.assertAlmostEqual(bucket.take(), 0.05)
+        self.clock.time += 0.05
+        self.assertEqual(bucket.take(), 0)
+
+    def test_refill_capped(self):
+        bucket = TokenBucket(10, 2, clock=self.clock)
+        self.clock.time += 60
+        self.assertEqual([bucket.take() for _ in range(2)], [0, 0])
+        self.assertGreater(bucket.take(), 0)
+
+    def test_default_burst(self):
+        self.assertEqual(TokenBucket(50).burst, 50)
+        self.assertEqual(TokenBucket(0.5).burst, 1)
+
+
+class AdmissionTests(SimpleTestCase):
+
+    def setUp(self):
+        connections = metrics.Gauge('test_connections', "Test.", ('endpoint',))
+        self.addCleanup(metrics.unregister, connections)
+        self.gauge = connections.child('test')
+
+    def test_no_limits(self):
+        admission = Admission(self.id(), self.gauge)
+        self.gauge.set(10 ** 6)
+        self.assertIsNone(admission.check())
+
+    def test_max_connections(self):
+        admission = Admission(self.id(), self.gauge, max_connections=2)
+        self.gauge.set(1)
+        self.assertIsNone(admission.check())
+        self.gauge.set(2)
+        response = admission.check()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(int(response['Retry-After']), range(1, 6))
+        self.assertEqual(admission.full.value, 1)
+
+    def test_handshake_rate(self):
+        admission = Admission(self.id(), self.gauge, handshake_rate=0.1,
+                              handshake_burst=2)
+        self.assertIsNone(admission.check())
+        self.assertIsNone(admission.check())
+        response = admission.check()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(admission.throttled.value, 1)
+
+    def test_full_doesnt_take_tokens(self):
+        admission = Admission(self.id(), self.gauge, max_connections=0,
+                              handshake_rate=0.1, handshake_burst=1)
+        self.assertEqual(admission.check().status_code, 503)
+        admission.max_connections = None
+        self.assertIsNone(admission.check())
@@ -0,0 +1,154 @@
+import threading
+
+import asyncio
+
+from django.test import SimpleTestCase
+
+from .http.body import BodyPipe, SpoolingHandler, spool
+
+
+class FakePayload:
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.consumed = 0
+
+    @asyncio.coroutine
+    def readany(self):
+        if not self.chunks:
+            return b''
+        self.consumed += 1
+        return self.chunks.pop(0)
+
+
+class SpoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_spool_in_memory(self):
+        payload = FakePayload([b'foo', b'bar'])
+        body = self.loop.run_until_complete(spool(payload, 10))
+        self.assertFalse(body._rolled)
+        self.assertEqual(body.read(), b'foobar')
+
+    def test_spool_to_disk(self):
+        payload = FakePayload([b'foo', b'bar'])
+        body = self.loop.run_until_complete(spool(payload, 4))
+        self.assertTrue(body._rolled)
+        self.assertEqual(body.read(), b'foobar')
+
+    def test_handler(self):
+        def app(environ, start_response):
+            return [environ['wsgi.input'].read()]
+        handler = SpoolingHandler(app, 4)
+        environ = {'CONTENT_LENGTH': '6',
+                   'wsgi.input': FakePayload([b'foo', b'bar'])}
+        result = handler(environ, None)
+        self.assertEqual(self.loop.run_until_complete(result), [b'foobar'])
+
+    def test_handler_without_body(self):
+        def app(environ, start_response):
+            return [environ['wsgi.input'].read()]
+        handler = SpoolingHandler(app, 4)
+        self.assertEqual(handler({}, None), [b''])
+
+
+class BodyPipeTests(SimpleTestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.pipe = BodyPipe(limit=4, loop=self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_briefly(self):
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+
+    def read_in_thread(self, method, *args):
+        return self.loop.run_in_executor(None, method, *args)
+
+    def test_read(self):
+        payload = FakePayload([b'foo', b'bar', b'baz'])
+        asyncio.async(self.pipe.pump(payload), loop=self.loop)
+        data = self.loop.run_until_complete(
+            self.read_in_thread(self.pipe.read))
+        self.assertEqual(data, b'foobarbaz')
+
+    def test_read_size(self):
+        payload = FakePayload([b'foo', b'bar', b'baz'])
+        asyncio.async(self.pipe.pump(payload), loop=self.loop)
+        data = self.loop.run_until_complete(
+            self.read_in_thread(self.pipe.read, 7))
+        self.assertEqual(data, b'foobarb')
+        data = self.loop.run_until_complete(
+            self.read_in_thread(self.pipe.read, 7))
+        self.assertEqual(data, b'az')
+
+    def test_readline(self):
+        payload = FakePayload([b'fo', b'o\nb', b'ar'])
+        asyncio.async(self.pipe.pump(payload), loop=self.loop)
+        lines = self.loop.run_until_complete(
+            self.read_in_thread(list, self.pipe))
+        self.assertEqual(lines, [b'foo\n', b'bar'])
+
+    def test_readline_size(self):
+        payload = FakePayload([b'foobarbaz\n'])
+        asyncio.async(self.pipe.pump(payload), loop=self.loop)
+        data = self.loop.run_until_complete(
+            self.read_in_thread(self.pipe.readline, 7))
+        self.assertEqual(data, b'foobarb')
+
+    def test_readline_flow_control(self):
+        payload = FakePayload([b'ab'] * 8 + [b'\n'])
+        buffered = []
+        readany = payload.readany
+
+        @asyncio.coroutine
+        def record_and_readany():
+            buffered.append(len(self.pipe.buffer))
+            return (yield from readany())
+
+        payload.readany = record_and_readany
+        asyncio.async(self.pipe.pump(payload), loop=self.loop)
+        line = self.loop.run_until_complete(
+            self.read_in_thread(self.pipe.readline))
+        self.assertEqual(line, b'ab' * 8 + b'\n')
+        # Waiting for the end of a long line doesn't buffer all of it.
+        self.assertLessEqual(max(buffered), 4)
+
+    def test_flow_control(self):
+        payload = FakePayload([b'foo', b'bar', b'baz'])
+        pump = asyncio.async(self.pipe.pump(payload), loop=self.loop)
+        self.run_briefly()
+        # The pump stops once the limit is reached.
+        self.assertEqual(payload.consumed, 2)
+        self.assertEqual(self.loop.run_until_complete(
+            self.read_in_thread(self.pipe.read, 3)), b'foo')
+        self.run_briefly()
+        self.assertEqual(payload.consumed, 3)
+        self.pipe.close()
+        self.loop.run_until_complete(pump)
+
+    def test_close_discards_body(self):
+        payload = FakePayload([b'foo', b'bar', b'baz'])
+        pump = asyncio.async(self.pipe.pump(payload), loop=self.loop)
+        self.run_briefly()
+        self.pipe.close()
+        self.loop.run_until_complete(pump)
+        self.assertEqual(payload.consumed, 3)
+        self.assertEqual(self.pipe.buffer, b'')
+
+    def test_connection_lost(self):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self.pipe.read()))
+        thread.start()
+        pump = asyncio.async(self.pipe.pump(None), loop=self.loop)
+        with self.assertRaises(AttributeError):
+            self.loop.run_until_complete(pump)
+        thread.join()
+        self.assertEqual(result, [b''])
@@ -0,0 +1,144 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from .http.broadcast import Broadcaster, COALESCE, DISCONNECT, DROP
+from .http.websockets import encode_frame
+
+
+class FakeWebSocket:
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.open = True
+        self.frames = []
+        self.messages = []
+        # Sends block until the test releases them.
+        self.gate = asyncio.Future(loop=loop)
+
+    @asyncio.coroutine
+    def send_frame(self, frame):
+        yield from self.gate
+        self.frames.append(frame)
+        self.messages.append(frame[2:].decode('utf-8'))
+
+    def share_frame(self, frame, deflated):
+        return frame
+
+    @asyncio.coroutine
+    def close(self):
+        self.open = False
+
+
+class BroadcasterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_briefly(self):
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+
+    def test_slow_subscriber_does_not_block_others(self):
+        broadcaster = Broadcaster(loop=self.loop)
+        fast, slow = FakeWebSocket(self.loop), FakeWebSocket(self.loop)
+        fast.gate.set_result(None)
+
+        broadcaster.send([fast, slow], 'spam')
+        broadcaster.send([fast, slow], 'eggs')
+        self.run_briefly()
+        self.assertEqual(fast.messages, ['spam', 'eggs'])
+        self.assertEqual(slow.messages, [])
+
+        slow.gate.set_result(None)
+        self.run_briefly()
+        self.assertEqual(slow.messages, ['spam', 'eggs'])
+
+    def test_frame_is_encoded_once(self):
+        broadcaster = Broadcaster(loop=self.loop)
+        ws1, ws2 = FakeWebSocket(self.loop), FakeWebSocket(self.loop)
+        ws1.gate.set_result(None)
+        ws2.gate.set_result(None)
+
+        broadcaster.send([ws1, ws2], 'spam')
+        self.run_briefly()
+        self.assertEqual(ws1.frames, [b'\x81\x04spam'])
+        self.assertIs(ws1.frames[0], ws2.frames[0])
+
+    def check_policy(self, policy):
+        broadcaster = Broadcaster(max_queue=2, policy=policy, loop=self.loop)
+        ws = FakeWebSocket(self.loop)
+        broadcaster.send([ws], 'a')
+        self.run_briefly()
+        for message in ['b', 'c', 'd']:
+            broadcaster.send([ws], message)
+        # The gate is cancelled along with the sender task on disconnect.
+        if not ws.gate.done():
+            ws.gate.set_result(None)
+        self.run_briefly()
+        return ws
+
+    def test_drop(self):
+        # 'a' is being sent; 'b' and 'c' are queued; 'd' is dropped.
+        ws = self.check_policy(DROP)
+        self.assertEqual(ws.messages, ['a', 'b', 'c'])
+
+    def test_coalesce(self):
+        # 'a' is being sent; without keys, the oldest one, 'b', is dropped.
+        ws = self.check_policy(COALESCE)
+        self.assertEqual(ws.messages, ['a', 'c', 'd'])
+
+    def test_coalesce_by_key(self):
+        broadcaster = Broadcaster(max_queue=2, policy=COALESCE, loop=self.loop)
+        ws = FakeWebSocket(self.loop)
+        broadcaster.send([ws], 'a', key=1)
+        self.run_briefly()
+        # 'a' is being sent; 'b' and 'c' are queued; 'd' replaces 'b' in
+        # place, then 'e' has a new key and drops the oldest one, 'd'.
+        for message, key in [('b', 1), ('c', 2), ('d', 1), ('e', 3)]:
+            broadcaster.send([ws], message, key=key)
+        self.assertEqual(broadcaster.pending(), 2)
+        ws.gate.set_result(None)
+        self.run_briefly()
+        self.assertEqual(ws.messages, ['a', 'c', 'e'])
+        self.assertEqual(broadcaster.outboxes[ws].keys, {})
+
+    def test_disconnect(self):
+        ws = self.check_policy(DISCONNECT)
+        self.assertFalse(ws.open)
+        self.assertEqual(ws.messages, [])
+
+    def test_discard(self):
+        broadcaster = Broadcaster(loop=self.loop)
+        ws = FakeWebSocket(self.loop)
+        broadcaster.send([ws], 'spam')
+        broadcaster.discard(ws)
+        ws.gate.set_result(None)
+        self.run_briefly()
+        self.assertEqual(ws.messages, [])
+        self.assertEqual(broadcaster.outboxes, {})
+
+
+class EncodeFrameTests(SimpleTestCase):
+
+    def test_text(self):
+        self.assertEqual(encode_frame('café'), b'\x81\x05caf\xc3\xa9')
+
+    def test_binary(self):
+        self.assertEqual(encode_frame(b'\x00\xff'), b'\x82\x02\x00\xff')
+
+    def test_medium_length(self):
+        frame = encode_frame(b'x' * 126)
+        self.assertEqual(frame[:4], b'\x82\x7e\x00\x7e')
+        self.assertEqual(len(frame), 4 + 126)
+
+    def test_long_length(self):
+        frame = encode_frame(b'x' * 65536)
+        self.assertEqual(frame[:10], b'\x82\x7f\x00\x00\x00\x00\x00\x01\x00\x00')
+        self.assertEqual(len(frame), 10 + 65536)
+
+    def test_invalid_type(self):
+        with self.assertRaises(TypeError):
+            encode_frame(42)
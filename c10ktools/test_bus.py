@@ -0,0 +1,128 @@
+import os
+import tempfile
+
+import asyncio
+
+from django.test import SimpleTestCase
+
+from .broker import Broker
+from .bus import BrokerBus, LocalBus
+
+
+class BusTestsMixin:
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.received = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    def callback(self, topic, message):
+        self.received.append((topic, message))
+
+    def run_briefly(self):
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))
+
+    def test_publish(self):
+        bus = self.make_bus()
+        bus.subscribe('spam', self.callback)
+        bus.publish('spam', 'eggs')
+        bus.publish('spam', b'\x00')
+        bus.publish('ham', 'eggs')
+        self.run_briefly()
+        self.assertEqual(self.received, [('spam', 'eggs'), ('spam', b'\x00')])
+
+    def test_wildcard(self):
+        bus = self.make_bus()
+        bus.subscribe('*', self.callback)
+        bus.publish('spam', 'eggs')
+        bus.publish('ham', 'eggs')
+        self.run_briefly()
+        self.assertEqual(self.received, [('spam', 'eggs'), ('ham', 'eggs')])
+
+    def test_unsubscribe(self):
+        bus = self.make_bus()
+        bus.subscribe('spam', self.callback)
+        bus.unsubscribe('spam', self.callback)
+        bus.publish('spam', 'eggs')
+        self.run_briefly()
+        self.assertEqual(self.received, [])
+
+    def test_retain(self):
+        bus = self.make_bus()
+        bus.publish('spam', 'eggs', retain=True)
+        self.run_briefly()
+        bus.subscribe('spam', self.callback)
+        self.run_briefly()
+        self.assertEqual(self.received, [('spam', 'eggs')])
+
+    def test_barrier(self):
+        bus1, bus2 = self.make_bus(), self.make_bus()
+        tasks = [asyncio.async(bus.barrier('ready', 4), loop=self.loop)
+                 for bus in (bus1, bus2, bus2)]
+        self.run_briefly()
+        self.assertFalse(any(task.done() for task in tasks))
+        self.loop.run_until_complete(bus1.barrier('ready', 4))
+        self.run_briefly()
+        self.assertTrue(all(task.done() for task in tasks))
+        # Late arrivals don't wait.
+        self.loop.run_until_complete(bus2.barrier('ready', 4))
+
+    def test_barrier_generations(self):
+        bus1, bus2 = self.make_bus(), self.make_bus()
+        self.loop.run_until_complete(bus1.barrier('ready', 1, generation='1'))
+        stale = asyncio.async(bus2.barrier('ready', 2, generation='2'),
+                              loop=self.loop)
+        self.run_briefly()
+        # A new generation cancels the waiters of the previous one.
+        task = asyncio.async(bus2.barrier('ready', 1, generation='3'),
+                             loop=self.loop)
+        self.run_briefly()
+        self.assertTrue(stale.cancelled())
+        self.assertTrue(task.done())
+        # Only the last released generation of each barrier is remembered.
+        self.assertEqual(self.released(), {'ready': '3'})
+
+
+class LocalBusTests(BusTestsMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.bus = LocalBus(self.loop)
+
+    def make_bus(self):
+        # All users of a LocalBus share the same instance.
+        return self.bus
+
+    def released(self):
+        return self.bus.released
+
+
+class BrokerBusTests(BusTestsMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'broker.sock')
+        self.buses = []
+        self.broker = Broker(self.path, self.loop)
+        self.loop.run_until_complete(self.broker.start())
+
+    def tearDown(self):
+        for bus in self.buses:
+            bus.close()
+        self.loop.run_until_complete(self.broker.stop())
+        self.run_briefly()
+        os.unlink(self.path)
+        os.rmdir(self.tmpdir)
+        super().tearDown()
+
+    def make_bus(self):
+        # Each process has its own BrokerBus.
+        bus = BrokerBus(self.path, self.loop)
+        self.buses.append(bus)
+        return bus
+
+    def released(self):
+        return self.broker.released
@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+from websockets.framing import OP_BINARY, OP_TEXT, Frame, write_frame
+
+from django.test import SimpleTestCase
+
+from .http.capture import CLOSED, RECEIVED, SENT, Recorder, load
+from .http.websockets import encode_frame
+from .test_websockets import ConnectionMixin
+
+
+class CaptureMixin:
+
+    def setUp(self):
+        super().setUp()
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.path)
+
+
+class RecorderTests(CaptureMixin, SimpleTestCase):
+
+    def test_load(self):
+        recorder = Recorder(self.path)
+        first = recorder.timeline('/first/')
+        second = recorder.timeline('/second/?a=b')
+        first.received(Frame(False, OP_BINARY, b'\x00\x01'))
+        first.received(Frame(True, 0, b'\x02'))
+        second.sent(OP_TEXT, 42)
+        first.closed()
+        recorder.close()
+
+        (path1, _, events1), (path2, _, events2) = load(self.path)
+        self.assertEqual(path1, '/first/')
+        self.assertEqual(path2, '/second/?a=b')
+        self.assertEqual(
+            [(e.kind, e.opcode, e.fin, e.data) for e in events1],
+            [(RECEIVED, OP_BINARY, False, b'\x00\x01'),
+             (RECEIVED, 0, True, b'\x02'),
+             (CLOSED, 0, True, 0)])
+        self.assertEqual(
+            [(e.kind, e.opcode, e.data) for e in events2],
+            [(SENT, OP_TEXT, 42)])
+        times = [e.time for e in events1]
+        self.assertEqual(times, sorted(times))
+
+    def test_not_a_capture(self):
+        with open(self.path, 'wb') as handle:
+            handle.write(b'GIF89a')
+        with self.assertRaises(ValueError):
+            load(self.path)
+
+
+class ProtocolTests(CaptureMixin, ConnectionMixin, SimpleTestCase):
+
+    def test_capture(self):
+        self.connect()
+        recorder = Recorder(self.path, self.loop)
+        self.ws.timeline = recorder.timeline('/echo/')
+        write_frame(Frame(True, OP_TEXT, b'Hello!'), self.client_sock.send,
+                    True)
+        self.assertEqual(self.loop.run_until_complete(self.ws.recv()),
+                         'Hello!')
+        self.loop.run_until_complete(self.ws.send('Hello!'))
+        self.loop.run_until_complete(self.ws.send_frame(encode_frame(b'x')))
+        recorder.close()
+
+        (path, _, events), = load(self.path)
+        self.assertEqual(path, '/echo/')
+        self.assertEqual(
+            [(e.kind, e.opcode, e.data) for e in events],
+            [(RECEIVED, OP_TEXT, b'Hello!'),
+             (SENT, OP_TEXT, 6),
+             (SENT, OP_BINARY, 1)])
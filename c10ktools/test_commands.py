@@ -1,19 +1,30 @@
+import json
+import os
+import tempfile
 from io import StringIO
 
 from django.core.management import call_command
 from django.core.urlresolvers import reverse
 
-from .management.commands.testecho import Command as TestEchoCommand
 from .test import ServerTestCase
 
 
 class CommandsTests(ServerTestCase):
 
     def test_testecho(self):
-        # Tweak a few parameters to make the test run faster.
-        TestEchoCommand.CLIENTS = 12
-        TestEchoCommand.DELAY = 0.1
-        TestEchoCommand.ECHO_URL = (self.live_server_url.replace('http', 'ws')
-                                    + reverse('c10ktools.views.echo_ws'))
+        url = (self.live_server_url.replace('http', 'ws')
+               + reverse('c10ktools.views.loopback_ws'))
+        handle, output = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        try:
+            # Few clients and messages, so the test runs quickly.
+            call_command('testecho', clients=12, ramp=120, messages=3,
+                         rate=30, url=url, output=output, stdout=StringIO())
+            with open(output) as handle:
+                report = json.load(handle)
+        finally:
+            os.unlink(output)
 
-        call_command('testecho', stdout=StringIO())
+        self.assertEqual(report['errors'], {})
+        self.assertEqual(report['messages_received'], 36)
+        self.assertEqual(report['round_trip_latency']['count'], 36)
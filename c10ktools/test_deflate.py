@@ -0,0 +1,109 @@
+import zlib
+
+import websockets
+
+from django.test import SimpleTestCase
+
+from .http.deflate import PerMessageDeflate, TAIL, negotiate, parse_extensions
+
+
+class NegotiateTests(SimpleTestCase):
+
+    def test_parse_extensions(self):
+        self.assertEqual(parse_extensions(
+            'permessage-deflate; client_max_window_bits, '
+            'permessage-deflate; server_max_window_bits="10", foo'), [
+            ('permessage-deflate', [('client_max_window_bits', None)]),
+            ('permessage-deflate', [('server_max_window_bits', '10')]),
+            ('foo', []),
+        ])
+
+    def test_accept(self):
+        response, deflate = negotiate('permessage-deflate')
+        self.assertEqual(response, 'permessage-deflate')
+        self.assertTrue(deflate.server_takeover)
+        self.assertTrue(deflate.client_takeover)
+
+    def test_no_context_takeover(self):
+        response, deflate = negotiate('permessage-deflate',
+                                      context_takeover=False)
+        self.assertEqual(response, 'permessage-deflate; '
+                         'server_no_context_takeover; '
+                         'client_no_context_takeover')
+        self.assertFalse(deflate.server_takeover)
+        self.assertFalse(deflate.client_takeover)
+
+    def test_client_requests_no_context_takeover(self):
+        response, deflate = negotiate(
+            'permessage-deflate; server_no_context_takeover')
+        self.assertEqual(
+            response, 'permessage-deflate; server_no_context_takeover')
+        self.assertFalse(deflate.server_takeover)
+        self.assertTrue(deflate.client_takeover)
+
+    def test_server_max_window_bits(self):
+        response, deflate = negotiate(
+            'permessage-deflate; server_max_window_bits=10')
+        self.assertEqual(
+            response, 'permessage-deflate; server_max_window_bits=10')
+        self.assertEqual(deflate.server_wbits, 10)
+
+    def test_first_acceptable_offer(self):
+        response, _ = negotiate(
+            'x-webkit-deflate-frame, '
+            'permessage-deflate; server_max_window_bits=8, '
+            'permessage-deflate; client_max_window_bits')
+        self.assertEqual(response, 'permessage-deflate')
+
+    def test_reject(self):
+        for header in [
+            'x-webkit-deflate-frame',
+            'permessage-deflate; foo',
+            'permessage-deflate; server_no_context_takeover=1',
+            'permessage-deflate; server_max_window_bits',
+            'permessage-deflate; client_max_window_bits=16',
+            'permessage-deflate; client_max_window_bits; '
+            'client_max_window_bits',
+        ]:
+            self.assertIsNone(negotiate(header), header)
+
+
+class PerMessageDeflateTests(SimpleTestCase):
+
+    message = b'Hello, world! ' * 100
+
+    def inflate(self, data, decompressor=None):
+        if decompressor is None:
+            decompressor = zlib.decompressobj(-15)
+        return decompressor.decompress(data + TAIL)
+
+    def test_compress_with_context_takeover(self):
+        deflate = PerMessageDeflate()
+        decompressor = zlib.decompressobj(-15)
+        first = deflate.compress(self.message)
+        second = deflate.compress(self.message)
+        self.assertLess(len(first), len(self.message) // 10)
+        self.assertLess(len(second), len(first))
+        self.assertEqual(self.inflate(first, decompressor), self.message)
+        self.assertEqual(self.inflate(second, decompressor), self.message)
+
+    def test_compress_without_context_takeover(self):
+        deflate = PerMessageDeflate(server_takeover=False)
+        first = deflate.compress(self.message)
+        second = deflate.compress(self.message)
+        self.assertEqual(first, second)
+        self.assertEqual(self.inflate(second), self.message)
+        self.assertIsNone(deflate.compressor)
+
+    def test_decompress_fragments(self):
+        data = PerMessageDeflate().compress(self.message)
+        deflate = PerMessageDeflate(client_takeover=False)
+        result = (deflate.decompress(data[:10], False) +
+                  deflate.decompress(data[10:], True))
+        self.assertEqual(result, self.message)
+        self.assertIsNone(deflate.decompressor)
+
+    def test_decompress_too_big(self):
+        data = PerMessageDeflate().compress(self.message)
+        with self.assertRaises(websockets.PayloadTooBig):
+            PerMessageDeflate().decompress(data, True, max_size=100)
@@ -0,0 +1,81 @@
+import threading
+
+import asyncio
+
+from django.test import SimpleTestCase
+
+from . import metrics
+from .http.executor import ThreadPoolHandler
+
+
+class ThreadPoolHandlerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.gate = threading.Event()
+        self.threads = []
+        self.handler = ThreadPoolHandler(self.app, 2, 1, self.loop)
+
+    def tearDown(self):
+        self.gate.set()
+        self.handler.close()
+        self.loop.close()
+
+    def app(self, environ, start_response):
+        self.threads.append(threading.current_thread())
+        if environ.get('block'):
+            self.gate.wait()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'Hello', b'!']
+
+    def request(self, **environ):
+        response = []
+        start_response = lambda status, headers: response.extend(
+            [status, headers])
+        result = self.handler(environ, start_response)
+        return response, result
+
+    def test_request_runs_in_thread(self):
+        response, result = self.request()
+        body = self.loop.run_until_complete(result)
+        self.assertEqual(response[0], '200 OK')
+        self.assertEqual(body, [b'Hello', b'!'])
+        self.assertIsNot(self.threads[0], threading.current_thread())
+
+    def test_websocket_runs_inline(self):
+        response, result = self.request(HTTP_UPGRADE='WebSocket')
+        self.assertEqual(response[0], '200 OK')
+        self.assertEqual(result, [b'Hello', b'!'])
+        self.assertIs(self.threads[0], threading.current_thread())
+
+    def test_loop_isnt_blocked(self):
+        _, result = self.request(block=True)
+        task = asyncio.async(result, loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertFalse(task.done())
+        self.assertEqual(self.handler.active, 1)
+        self.gate.set()
+        self.loop.run_until_complete(task)
+        self.assertEqual(self.handler.active, 0)
+
+    def test_saturation(self):
+        tasks = [asyncio.async(self.request(block=True)[1], loop=self.loop)
+                 for _ in range(3)]
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertEqual(self.handler.active, 2)
+        self.assertEqual(self.handler.queued, 1)
+
+        response, result = self.request()
+        self.assertEqual(response[0], '503 Service Unavailable')
+        self.assertIn(('Retry-After', '1'), response[1])
+        self.assertEqual(self.handler.rejected, 1)
+
+        self.gate.set()
+        self.loop.run_until_complete(asyncio.wait(tasks, loop=self.loop))
+        self.assertEqual(self.handler.queued, 0)
+
+    def test_close_unregisters_gauges(self):
+        self.assertIn('c10ktools_wsgi_active_requests', metrics.registry)
+        self.handler.close()
+        self.assertNotIn('c10ktools_wsgi_active_requests', metrics.registry)
+        self.assertNotIn('c10ktools_wsgi_queued_requests', metrics.registry)
@@ -0,0 +1,144 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from .http.heartbeat import PING, Heartbeat, TimerWheel
+
+
+class Recorder(TimerWheel):
+
+    def __init__(self, resolution, span, loop):
+        super().__init__(resolution, span, self.record, loop)
+        self.expired = []
+
+    def record(self, item, now):
+        self.expired.append(item)
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+
+class FakeWriter:
+
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+
+class FakeWebSocket:
+
+    def __init__(self, loop):
+        self.open = True
+        self.writer = FakeWriter()
+        self.last_seen = self.last_message = loop.time()
+        self.ping_sent = None
+        self.closed = None
+
+    @asyncio.coroutine
+    def close_or_abort(self, code, reason):
+        self.closed = code, reason
+        self.open = False
+
+
+class HeartbeatMixin:
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def sleep(self, delay):
+        self.loop.run_until_complete(asyncio.sleep(delay, loop=self.loop))
+
+
+class TimerWheelTests(HeartbeatMixin, SimpleTestCase):
+
+    def test_expire(self):
+        wheel = Recorder(0.01, 0.1, loop=self.loop)
+        wheel.schedule('a', 0.01)
+        wheel.schedule('b', 0.05)
+        self.assertEqual(len(wheel), 2)
+        self.sleep(0.03)
+        self.assertEqual(wheel.expired, ['a'])
+        self.sleep(0.05)
+        self.assertEqual(wheel.expired, ['a', 'b'])
+        self.assertEqual(len(wheel), 0)
+        self.assertIsNone(wheel.handle)
+
+    def test_delay_capped(self):
+        wheel = Recorder(0.01, 0.02, loop=self.loop)
+        wheel.schedule('a', 10)
+        self.sleep(0.05)
+        self.assertEqual(wheel.expired, ['a'])
+
+    def test_stop(self):
+        wheel = Recorder(0.01, 0.1, loop=self.loop)
+        wheel.schedule('a', 0.01)
+        wheel.stop()
+        self.sleep(0.03)
+        self.assertEqual(wheel.expired, [])
+        self.assertEqual(len(wheel), 0)
+
+
+class HeartbeatTests(HeartbeatMixin, SimpleTestCase):
+
+    def test_ping(self):
+        heartbeat = Heartbeat(0.02, 1, None, resolution=0.01, loop=self.loop)
+        ws = FakeWebSocket(self.loop)
+        heartbeat.add(ws)
+        self.assertEqual(ws.writer.data, b'')
+        self.sleep(0.05)
+        self.assertEqual(ws.writer.data, PING)
+        self.assertIsNotNone(ws.ping_sent)
+        heartbeat.stop()
+
+    def test_pong_keeps_connection(self):
+        heartbeat = Heartbeat(0.02, 0.04, None, resolution=0.01,
+                              loop=self.loop)
+        ws = FakeWebSocket(self.loop)
+        heartbeat.add(ws)
+        for _ in range(10):
+            self.sleep(0.01)
+            ws.last_seen = self.loop.time()
+        self.assertFalse(ws.writer.transport.aborted)
+        heartbeat.stop()
+
+    def test_pong_timeout(self):
+        heartbeat = Heartbeat(0.02, 0.02, None, resolution=0.01,
+                              loop=self.loop)
+        ws = FakeWebSocket(self.loop)
+        heartbeat.add(ws)
+        self.sleep(0.1)
+        self.assertEqual(ws.writer.data, PING)
+        self.assertTrue(ws.writer.transport.aborted)
+
+    def test_idle_timeout(self):
+        heartbeat = Heartbeat(None, None, 0.03, resolution=0.01,
+                              loop=self.loop)
+        ws = FakeWebSocket(self.loop)
+        heartbeat.add(ws)
+        self.sleep(0.06)
+        self.assertEqual(ws.closed, (1000, "Idle timeout"))
+        self.assertEqual(ws.writer.data, b'')
+        self.assertEqual(len(heartbeat), 0)
+
+    def test_closed_connection_dropped(self):
+        heartbeat = Heartbeat(0.02, 0.02, None, resolution=0.01,
+                              loop=self.loop)
+        ws = FakeWebSocket(self.loop)
+        heartbeat.add(ws)
+        ws.open = False
+        self.sleep(0.05)
+        self.assertEqual(ws.writer.data, b'')
+        self.assertEqual(len(heartbeat), 0)
+        self.assertIsNone(heartbeat.handle)
@@ -0,0 +1,94 @@
+import os
+import unittest
+
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase
+
+from . import metrics
+from .http.websockets import handshakes
+
+
+class MetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.metrics = []
+
+    def tearDown(self):
+        for metric in self.metrics:
+            metrics.unregister(metric)
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def assertRendered(self, lines):
+        rendered = metrics.render().split('\n')
+        for line in lines:
+            self.assertIn(line, rendered)
+
+    def test_counter(self):
+        counter = self.add(metrics.Counter('test_total', "Test counter."))
+        counter.inc()
+        counter.inc(2)
+        self.assertRendered([
+            '# HELP test_total Test counter.',
+            '# TYPE test_total counter',
+            'test_total 3.0',
+        ])
+
+    def test_labels(self):
+        counter = self.add(metrics.Counter(
+            'test_total', "Test counter.", ('method', 'path')))
+        counter.child('GET', '/"quoted"').inc()
+        counter.child('POST', '/').inc(5)
+        self.assertRendered([
+            'test_total{method="GET",path="/\\"quoted\\""} 1.0',
+            'test_total{method="POST",path="/"} 5.0',
+        ])
+
+    def test_gauge(self):
+        gauge = self.add(metrics.Gauge('test', "Test gauge."))
+        gauge.inc(3)
+        gauge.dec()
+        self.assertRendered(['# TYPE test gauge', 'test 2.0'])
+        gauge.set(7)
+        self.assertRendered(['test 7.0'])
+
+    def test_gauge_function(self):
+        values = [1, 2]
+        self.add(metrics.GaugeFunction('test', "Test gauge.", values.pop))
+        self.assertRendered(['test 2.0'])
+        self.assertRendered(['test 1.0'])
+
+    @unittest.skipUnless(os.path.exists('/proc/self/statm'), "Linux only")
+    def test_resident_memory(self):
+        self.assertGreater(metrics.resident_memory(), 0)
+
+    def test_histogram(self):
+        histogram = self.add(metrics.Histogram(
+            'test_seconds', "Test histogram.", buckets=(0.1, 1)))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        self.assertRendered([
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 2.0',
+            'test_seconds_bucket{le="1.0"} 3.0',
+            'test_seconds_bucket{le="+Inf"} 4.0',
+            'test_seconds_sum 5.65',
+            'test_seconds_count 4.0',
+        ])
+
+    def test_view(self):
+        # The test client doesn't support the WebSocket handshake.
+        handshake = handshakes.child('c10ktools.views.loopback_ws', '500')
+        failures = handshake.value
+        self.client.get(reverse('c10ktools.views.loopback_ws'))
+        self.assertEqual(handshake.value, failures + 1)
+
+        response = self.client.get(reverse('c10ktools.views.metrics'))
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn(
+            'c10ktools_websocket_handshakes_total{'
+            'endpoint="c10ktools.views.loopback_ws",status="500"} ',
+            response.content.decode())
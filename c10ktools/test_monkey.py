@@ -0,0 +1,48 @@
+import os
+import socket
+
+import asyncio
+
+from django.test import SimpleTestCase
+
+from .monkey import LISTEN_FDS, inherited_sockets, run
+from .supervisor import create_socket
+
+
+class InheritedSocketsTests(SimpleTestCase):
+
+    def test_no_sockets(self):
+        self.assertEqual(inherited_sockets(), [])
+
+    def test_sockets(self):
+        sock = create_socket('localhost', 0)
+        self.addCleanup(sock.close)
+        fd = os.dup(sock.fileno())
+        os.environ[LISTEN_FDS] = '{}:{}'.format(fd, int(sock.family))
+        inherited, = inherited_sockets()
+        self.addCleanup(inherited.close)
+        self.assertEqual(inherited.fileno(), fd)
+        self.assertEqual(inherited.getsockname(), sock.getsockname())
+        # The variable is consumed, so it doesn't leak into later restarts.
+        self.assertNotIn(LISTEN_FDS, os.environ)
+
+
+class RunTests(SimpleTestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def test_stop(self):
+        stop = asyncio.Future(loop=self.loop)
+        addresses = []
+
+        def ready(server):
+            addresses.append(server.sockets[0].getsockname())
+            stop.set_result(None)
+
+        run('localhost', 0, None, self.loop, stop, ready,
+            drain_timeout=0.1, drain_spread=0)
+        host, port = addresses[0][:2]
+        with self.assertRaises(ConnectionRefusedError):
+            socket.create_connection((host, port))
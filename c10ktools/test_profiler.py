@@ -0,0 +1,51 @@
+import time
+
+import asyncio
+
+from django.test import SimpleTestCase
+
+from . import profiler
+from .profiler import Profiler
+
+
+def blocking_handler():
+    time.sleep(0.1)
+
+
+class ProfilerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.profiler = Profiler(self.loop, threshold=0.02)
+        self.profiler.start()
+        profiler.register(blocking_handler, 'test.blocking_handler')
+
+    def tearDown(self):
+        del profiler.endpoints[blocking_handler.__code__]
+        self.profiler.stop()
+        self.loop.close()
+
+    def run_briefly(self, delay=0.05):
+        self.loop.run_until_complete(asyncio.sleep(delay, loop=self.loop))
+
+    def test_no_stall(self):
+        self.run_briefly(0.1)
+        self.assertEqual(len(self.profiler.stalls), 0)
+
+    def test_stall(self):
+        self.loop.call_soon(blocking_handler)
+        with self.assertLogs('c10ktools.profiler', 'WARNING') as logs:
+            self.run_briefly()
+        self.assertIn('test.blocking_handler', logs.output[0])
+        self.assertEqual(len(self.profiler.stalls), 1)
+        stall = self.profiler.stalls[0]
+        self.assertEqual(stall.endpoint, 'test.blocking_handler')
+        self.assertIn('time.sleep(0.1)', stall.stack[-1])
+        self.assertGreater(stall.duration, 0.05)
+
+    def test_unknown_endpoint(self):
+        self.loop.call_soon(time.sleep, 0.1)
+        with self.assertLogs('c10ktools.profiler', 'WARNING'):
+            self.run_briefly()
+        self.assertEqual(len(self.profiler.stalls), 1)
+        self.assertEqual(self.profiler.stalls[0].endpoint, 'unknown')
@@ -0,0 +1,66 @@
+import asyncio
+import websockets
+from websockets.framing import OP_BINARY, OP_TEXT
+
+from django.test import SimpleTestCase
+
+from .http.capture import CLOSED, RECEIVED, SENT, Connection, Event
+from .replay import Replay
+
+
+@asyncio.coroutine
+def echo(ws, path):
+    while True:
+        message = yield from ws.recv()
+        if message is None:
+            break
+        yield from ws.send(message)
+
+
+class ReplayTests(SimpleTestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            websockets.serve(echo, '127.0.0.1', 0, loop=self.loop))
+        port = self.server.server.sockets[0].getsockname()[1]
+        self.url = 'ws://127.0.0.1:{}'.format(port)
+
+    def tearDown(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    def connection(self, time=0):
+        return Connection('/echo/', time, [
+            Event(time + 0.01, RECEIVED, OP_TEXT, True, b'Hello!'),
+            Event(time + 0.01, SENT, OP_TEXT, True, 6),
+            Event(time + 0.02, RECEIVED, OP_BINARY, False, b'\x00'),
+            Event(time + 0.02, RECEIVED, 0, True, b'\x01'),
+            Event(time + 0.02, SENT, OP_BINARY, True, 2),
+            Event(time + 0.03, CLOSED, 0, True, 0),
+        ])
+
+    def test_replay(self):
+        replay = Replay(self.url, [self.connection(), self.connection(0.05)],
+                        linger=0.1)
+        result = replay.run(self.loop)
+        self.assertEqual(result['errors'], {})
+        self.assertEqual(result['messages_sent'], 4)
+        self.assertEqual(result['messages_expected'], 4)
+        self.assertEqual(result['messages_received'], 4)
+        self.assertEqual(result['bytes_received'], 16)
+        self.assertGreaterEqual(result['duration'], 0.08)
+
+    def test_max_speed(self):
+        replay = Replay(self.url, [self.connection(10)], speed=0, linger=0.1)
+        result = replay.run(self.loop)
+        self.assertEqual(result['messages_received'], 2)
+        self.assertLess(result['duration'], 1)
+
+    def test_connection_refused(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        result = Replay(self.url, [self.connection()]).run(self.loop)
+        self.assertEqual(result['messages_sent'], 0)
+        self.assertEqual(sum(result['errors'].values()), 1)
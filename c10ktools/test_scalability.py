@@ -0,0 +1,25 @@
+from django.core.urlresolvers import reverse
+
+from .test import WebSocketTestCase
+
+
+class EchoScalabilityTests(WebSocketTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 1000 clients and the server share this process.
+        cls.require_file_descriptors(2 * 1000 + 100)
+        super().setUpClass()
+
+    def setUp(self):
+        self.path = reverse('c10ktools.views.loopback_ws')
+
+    def test_1000_sessions(self):
+        # Keep all sessions open until the last one connects.
+        report = self.load_test(self.path, 1000, messages=3, hold=True)
+        self.assertEqual(report['peak_connections'], 1000)
+        self.assertWithinBudget(report, duration=10, p99=2)
+
+    def test_throughput(self):
+        report = self.load_test(self.path, 10, messages=1000)
+        self.assertWithinBudget(report, duration=10, throughput=1000)
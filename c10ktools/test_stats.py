@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase
+
+from .stats import Histogram
+
+
+class HistogramTests(SimpleTestCase):
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value / 1000)
+        self.assertAlmostEqual(histogram.percentile(50), 0.5, delta=0.01)
+        self.assertAlmostEqual(histogram.percentile(99), 0.99, delta=0.02)
+        self.assertEqual(histogram.percentile(100), 1.0)
+        self.assertEqual(histogram.summary()['count'], 1000)
+
+    def test_empty(self):
+        self.assertIsNone(Histogram().percentile(50))
+
+    def test_merge_round_trip(self):
+        histogram1, histogram2 = Histogram(), Histogram()
+        histogram1.record(0.001)
+        histogram2.record(0.1)
+        histogram1.merge(Histogram.from_dict(histogram2.to_dict()))
+        self.assertEqual(histogram1.count, 2)
+        self.assertEqual(histogram1.min, 0.001)
+        self.assertEqual(histogram1.max, 0.1)
@@ -0,0 +1,247 @@
+import socket
+import zlib
+
+import asyncio
+import websockets
+from websockets.framing import OP_TEXT, Frame, write_frame
+
+from django.test import SimpleTestCase
+
+from .http.deflate import TAIL, PerMessageDeflate
+from .http.websockets import (
+    WebSocketProtocol, build_frame, drain, encode_frame, header_length,
+    protocols, websocket)
+
+
+class ConnectionMixin:
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server_sock, self.client_sock = socket.socketpair()
+        # Keep kernel buffers small so the write buffer fills quickly.
+        self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.client_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.client_sock.setblocking(False)
+
+    def tearDown(self):
+        self.ws.writer.transport.abort()
+        self.run_briefly()
+        self.client_sock.close()
+        self.loop.close()
+
+    def connect(self, **options):
+        options.setdefault('write_high', 1024)
+        options.setdefault('write_low', 256)
+        self.ws = WebSocketProtocol(loop=self.loop, **options)
+        self.loop.run_until_complete(self.loop.create_connection(
+            lambda: self.ws, sock=self.server_sock))
+
+    def run_briefly(self):
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+
+    def read_all(self):
+        while True:
+            try:
+                if not self.client_sock.recv(65536):
+                    break
+            except BlockingIOError:
+                break
+
+    def buffered(self):
+        return self.ws.writer.transport.get_write_buffer_size()
+
+
+class FlowControlTests(ConnectionMixin, SimpleTestCase):
+
+    def test_senders_wait_for_drain(self):
+        self.connect(max_buffer=None)
+        frame = encode_frame(b'x' * 1000)
+        senders = [asyncio.async(self.ws.send_frame(frame), loop=self.loop)
+                   for _ in range(64)]
+        senders.append(asyncio.async(self.ws.send(b'y'), loop=self.loop))
+        self.run_briefly()
+        self.assertTrue(any(not sender.done() for sender in senders))
+        while not all(sender.done() for sender in senders):
+            self.read_all()
+            self.run_briefly()
+        for sender in senders:
+            sender.result()
+
+    def overflow(self):
+        # Concurrent senders write without waiting for each other: the
+        # buffer exceeds max_buffer after 16 frames.
+        frame = encode_frame(b'x' * 1000)
+        senders = [self.ws.send_frame(frame) for _ in range(64)]
+        results = self.loop.run_until_complete(asyncio.gather(
+            *senders, loop=self.loop, return_exceptions=True))
+        errors = [result for result in results
+                  if isinstance(result, websockets.InvalidState)]
+        self.assertTrue(self.ws.overflowed)
+        self.assertGreater(len(errors), 0)
+        self.assertLess(len(errors), 64)
+        with self.assertRaises(websockets.InvalidState):
+            self.loop.run_until_complete(self.ws.send(b'y'))
+
+    def test_abort_on_overflow(self):
+        self.connect(max_buffer=16384)
+        self.overflow()
+        self.run_briefly()
+        self.assertEqual(self.buffered(), 0)
+        self.assertFalse(self.ws.open)
+
+    def test_close_on_overflow(self):
+        self.connect(max_buffer=16384, overflow='close', timeout=0.1)
+        self.overflow()
+        # The client doesn't read the close frame: the connection is dropped.
+        self.run_briefly()
+        self.assertEqual(self.buffered(), 0)
+        self.assertFalse(self.ws.open)
+
+
+class OptionsTests(SimpleTestCase):
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            WebSocketProtocol(overflow='ignore')
+
+    def test_options(self):
+        @websocket(max_buffer=None)
+        def handler(ws):
+            yield from ws.recv()
+        self.assertEqual(handler.__name__, 'handler')
+
+    def test_unknown_option(self):
+        with self.assertRaises(TypeError):
+            websocket(max_queue=16)
+
+
+class ReceiveTests(ConnectionMixin, SimpleTestCase):
+
+    def send(self, message):
+        frame = Frame(True, OP_TEXT, message.encode('utf-8'))
+        write_frame(frame, self.client_sock.send, True)
+
+    def test_recv(self):
+        self.connect()
+        self.send('Hello!')
+        self.send('Goodbye!')
+        self.assertEqual(self.loop.run_until_complete(self.ws.recv()),
+                         'Hello!')
+        self.assertEqual(self.loop.run_until_complete(self.ws.recv()),
+                         'Goodbye!')
+
+    def test_recv_waits(self):
+        self.connect()
+        receiver = asyncio.async(self.ws.recv(), loop=self.loop)
+        self.run_briefly()
+        self.assertFalse(receiver.done())
+        self.send('Hello!')
+        self.assertEqual(self.loop.run_until_complete(receiver), 'Hello!')
+
+    def test_recv_after_close(self):
+        self.connect()
+        self.send('Hello!')
+        self.client_sock.shutdown(socket.SHUT_WR)
+        self.assertEqual(self.loop.run_until_complete(self.ws.recv()),
+                         'Hello!')
+        self.assertIsNone(self.loop.run_until_complete(self.ws.recv()))
+
+    def test_recv_cancelled(self):
+        self.connect()
+        receiver = asyncio.async(self.ws.recv(), loop=self.loop)
+        self.run_briefly()
+        receiver.cancel()
+        self.run_briefly()
+        self.send('Hello!')
+        self.assertEqual(self.loop.run_until_complete(self.ws.recv()),
+                         'Hello!')
+
+
+class CompressionTests(ConnectionMixin, SimpleTestCase):
+
+    message = 'Hello, world! ' * 100
+
+    def send(self, data, rsv1=False):
+        # Client frames are masked.
+        mask = b'\x01\x02\x03\x04'
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+        frame = build_frame(OP_TEXT, masked, rsv1)
+        offset = header_length(frame)
+        self.client_sock.send(bytes([frame[0], frame[1] | 0x80]) +
+                              frame[2:offset] + mask + masked)
+
+    def receive(self):
+        self.run_briefly()
+        return self.client_sock.recv(65536)
+
+    def test_recv_compressed(self):
+        self.connect(deflate=PerMessageDeflate())
+        self.send(PerMessageDeflate().compress(self.message.encode()), True)
+        self.assertEqual(self.loop.run_until_complete(self.ws.recv()),
+                         self.message)
+
+    def test_send_compressed(self):
+        self.connect(deflate=PerMessageDeflate(min_size=64))
+        self.loop.run_until_complete(self.ws.send(self.message))
+        frame = self.receive()
+        self.assertEqual(frame[0], 0xc1)
+        self.assertEqual(zlib.decompressobj(-15).decompress(frame[2:] + TAIL),
+                         self.message.encode())
+
+    def test_send_small_uncompressed(self):
+        self.connect(deflate=PerMessageDeflate(min_size=64))
+        self.loop.run_until_complete(self.ws.send('Hello!'))
+        self.assertEqual(self.receive(), encode_frame('Hello!'))
+
+    def test_share_frame(self):
+        self.connect(deflate=PerMessageDeflate(server_takeover=False))
+        frame = encode_frame(self.message)
+        deflated = {}
+        shared = self.ws.share_frame(frame, deflated)
+        self.assertEqual(shared[0], 0xc1)
+        self.assertEqual(deflated, {15: shared})
+        self.assertIs(self.ws.share_frame(frame, deflated), shared)
+        # Compressed frames are sent as is.
+        self.loop.run_until_complete(self.ws.send_frame(shared))
+        self.assertEqual(self.receive(), shared)
+
+    def test_share_frame_context_takeover(self):
+        self.connect(deflate=PerMessageDeflate())
+        frame = encode_frame(self.message)
+        deflated = {}
+        self.assertIs(self.ws.share_frame(frame, deflated), frame)
+        self.assertEqual(deflated, {})
+
+    def test_rsv1_without_extension(self):
+        self.connect()
+        self.send(PerMessageDeflate().compress(self.message.encode()), True)
+        self.assertIsNone(self.loop.run_until_complete(self.ws.recv()))
+
+
+class DrainTests(ConnectionMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.connect(timeout=1)
+        protocols.add(self.ws)
+
+    def drain(self, timeout):
+        return asyncio.async(drain(timeout, loop=self.loop), loop=self.loop)
+
+    def test_close_going_away(self):
+        drainer = self.drain(1)
+        self.run_briefly()
+        # Close frame with code 1001.
+        self.assertEqual(self.client_sock.recv(65536)[:4], b'\x88\x0c\x03\xe9')
+        self.send_close()
+        self.assertEqual(self.loop.run_until_complete(drainer), 0)
+        self.assertFalse(self.ws.open)
+
+    def test_abort_after_timeout(self):
+        self.assertEqual(self.loop.run_until_complete(self.drain(0.05)), 1)
+        self.run_briefly()
+        self.assertTrue(self.ws.connection_closed.done())
+
+    def send_close(self):
+        mask = b'\x00\x00\x00\x00'
+        self.client_sock.send(b'\x88\x82' + mask + b'\x03\xe9')
@@ -4,5 +4,8 @@ from django.conf.urls import patterns, url
 urlpatterns = patterns('c10ktools.views',
     url(r'^$', 'echo'),
     url(r'^ws/$', 'echo_ws'),
+    url(r'^ws/loopback/$', 'loopback_ws'),
+    url(r'^ws/idle/$', 'idle_ws'),
+    url(r'^metrics/$', 'metrics'),
     url(r'^wsgi/$', 'basic'),
 )
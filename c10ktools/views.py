@@ -1,6 +1,8 @@
+from django.http import HttpResponse
 from django.shortcuts import render
 
 from c10ktools.http import websocket
+from c10ktools.metrics import render as render_metrics
 
 
 def basic(request):
@@ -18,3 +20,25 @@ def echo_ws(ws):
         message = yield from ws.recv()
         yield from ws.send('{}. {}'.format(i + 1, message))
     yield from ws.send('Goodbye!')
+
+
+@websocket
+def loopback_ws(ws):
+    while True:
+        message = yield from ws.recv()
+        if message is None:
+            break
+        yield from ws.send(message)
+
+
+@websocket
+def idle_ws(ws):
+    # Keep the connection open without doing anything, for measuring the
+    # footprint of idle connections.
+    while (yield from ws.recv()) is not None:
+        pass
+
+
+def metrics(request):
+    return HttpResponse(render_metrics(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
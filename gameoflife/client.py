@@ -1,10 +1,20 @@
+import collections
+import json
 import random
 
 import asyncio
 import websockets
 
+from .protocol import decode_update, encode_update
+
 BASE_URL = 'ws://localhost:8000'
 
+# Opening handshakes in progress at any time. Beyond this, connections wait
+# for a slot rather than overflowing the server's listen backlog.
+MAX_HANDSHAKES = 100
+
+handshakes = None
+
 @asyncio.coroutine
 def reset(size):
     ws = yield from websockets.connect(BASE_URL + '/reset/')
@@ -13,65 +23,236 @@ def reset(size):
 
 
 @asyncio.coroutine
-def run(row, col, size, wrap, speed, steps=None, state=None):
+def run(row, col, size, wrap, speed, steps=None, state=None, fmt='text'):
+    """Run the worker for one cell over its own connection."""
+    return (yield from run_many([(row, col)], size, wrap, speed, steps,
+                                {(row, col): state}, fmt))
 
-    if state is None:
-        state = random.choice((True, False, False, False))
 
-    neighbors = get_neighbors(row, col, size, wrap)
-    neighbors = {n: i for i, n in enumerate(neighbors)}
-    n = len(neighbors)
+@asyncio.coroutine
+def run_many(cells, size, wrap, speed, steps=None, states=None, fmt='text'):
+    """
+    Run the workers for several cells over a single connection.
 
-    # Throttle at 100 connections / second on average
-    yield from asyncio.sleep(size * size / 100 * random.random())
-    ws = yield from websockets.connect(BASE_URL + '/worker/')
+    ``cells`` is a list of (row, col) tuples. ``states`` maps cells to their
+    initial state; missing cells get a random state.
 
-    # Wait until all clients are connected.
-    msg = yield from ws.recv()
-    if msg != 'sub':
-        raise Exception("Unexpected message: {}".format(msg))
+    Updates between cells handled by this connection don't go through the
+    server. Other updates are tagged with the coordinates of the cell, which
+    the server uses for routing.
+
+    ``speed`` is a number of steps per second, paced by a Scheduler; 0 runs
+    as fast as possible. Return a dict with the number of steps completed by
+    all cells and their duration in seconds.
+    """
+    loop = asyncio.get_event_loop()
+    if states is None:
+        states = {}
+
+    local = {}
+    for row, col in cells:
+        state = states.get((row, col))
+        if state is None:
+            state = random.choice((True, False, False, False))
+        local[row, col] = Cell(row, col, state,
+                               get_neighbors(row, col, size, wrap))
+
+    # Map each cell to the local cells interested in its updates.
+    watchers = collections.defaultdict(list)
+    for cell in local.values():
+        for neighbor in cell.neighbors:
+            watchers[neighbor].append(cell)
+
+    ws = yield from connect(BASE_URL + '/worker/{}/'.format(fmt))
 
-    # Subscribe to updates sent by neighbors.
-    for neighbor in neighbors:
-        yield from ws.send('{} {}'.format(*neighbor))
-    yield from ws.send('sub')
+    # Announce our cells. The server subscribes us to their neighbors.
+    yield from ws.send(json.dumps({
+        'cells': [row * size + col for row, col in local],
+        'wrap': wrap,
+    }))
 
     # Wait until all clients are subscribed.
     msg = yield from ws.recv()
     if msg != 'run':
         raise Exception("Unexpected message: {}".format(msg))
+    scheduler = Scheduler(speed, len(local), size * size, loop)
 
-    yield from ws.send('{} {} {} {}'.format(0, row, col, int(state)))
+    # Updates ready to be sent and routed to local cells.
+    ready = collections.deque()
+    outgoing = asyncio.Queue()
+    remaining = len(local)
 
-    # This is the step for which we last sent our state, and for which we're
-    # collecting the states of our neighbors.
-    step = 0
-    # Once we know all our neighbors' states at step N - 1, we compute and
-    # send our state at step N. At this point, our neighbors can send their
-    # states at steps N and N + 1, but not N + 2, since that requires our
-    # state at step N + 1. We only need to keep track of two sets of states.
-    states = [[None] * n, [None] * n]
+    def flush():
+        nonlocal remaining
+        while ready:
+            cell, step, state = ready.popleft()
+            scheduler.sent()
+            outgoing.put_nowait(
+                encode_update(step, cell.row, cell.col, state, fmt))
+            if step == steps:
+                remaining -= 1
+                if not remaining:
+                    outgoing.put_nowait(None)
+            route(step, cell.row, cell.col, state)
+
+    def route(step, row, col, state):
+        for cell in watchers.get((row, col), ()):
+            if steps is not None and cell.step >= steps:
+                continue
+            if cell.receive(step, row, col, state):
+                schedule(cell, cell.step, cell.state)
+
+    def schedule(cell, step, state):
+        delay = scheduler.delay(cell.row * size + cell.col, step)
+        if delay > 0:
+            loop.call_later(delay, resume, cell, step, state)
+        else:
+            ready.append((cell, step, state))
+
+    def resume(cell, step, state):
+        ready.append((cell, step, state))
+        flush()
+
+    @asyncio.coroutine
+    def send():
+        while True:
+            msg = yield from outgoing.get()
+            if msg is None:
+                break
+            yield from ws.send(msg)
+        yield from ws.close()
+
+    sender = asyncio.async(send())
+    for cell in local.values():
+        schedule(cell, 0, cell.state)
+    flush()
 
     # Gather state updates from neighbors and send our own state updates.
-    while (steps is None or step < steps):
+    while True:
         msg = yield from ws.recv()
         if msg is None:
             break
-        _step, _row, _col, _state = (int(x) for x in msg.split())
-        target = _step % 2
-        states[target][neighbors[(_row, _col)]] = bool(_state)
-        # Compute next state
-        if None not in states[target]:
-            assert _step == step
-            step += 1
-            alive = states[target].count(True)
-            state = alive == 3 or (state and alive == 2)
-            states[target] = [None] * n
-            yield from ws.send('{} {} {} {}'.format(step, row, col, int(state)))
-            # Throttle, speed is a number of steps per second
-            yield from asyncio.sleep(1 / speed)
+        route(*decode_update(msg))
+        flush()
+
+    if not sender.done():
+        sender.cancel()
+        yield from ws.close()
+
+    return {'steps': scheduler.steps, 'duration': scheduler.duration}
+
+
+class Scheduler:
+    """
+    Pace the updates of ``cells`` cells of a grid of ``total`` cells on a
+    deadline clock.
 
+    The update of cell ``index`` for step N is due ``(N + index / total) /
+    speed`` seconds after the start, no matter how long earlier steps took,
+    so the pace doesn't drift. The offsets spread the updates of each step
+    over the interval instead of sending them all at once. Late updates are
+    sent immediately.
+
+    With ``speed`` 0 or infinite, updates are sent as soon as they're ready.
+
+    Each cell sends its initial state, then one update per step. ``steps``
+    counts the steps completed by all cells and ``duration`` the time from
+    the initial states to the last update, giving the achieved speed.
+    """
+
+    def __init__(self, speed, cells, total, loop):
+        self.interval = 1 / speed if speed else 0
+        self.cells = cells
+        self.total = total
+        self.loop = loop
+        self.start = loop.time()
+        self.updates = 0
+        self.begin = None
+        self.end = None
+
+    def delay(self, index, step):
+        """Return how long to wait before sending an update."""
+        if not self.interval:
+            return 0
+        due = self.start + (step + index / self.total) * self.interval
+        return due - self.loop.time()
+
+    def sent(self):
+        self.updates += 1
+        self.end = self.loop.time()
+        if self.updates == self.cells:
+            self.begin = self.end
+
+    @property
+    def steps(self):
+        return max(self.updates // self.cells - 1, 0)
+
+    @property
+    def duration(self):
+        return 0 if self.begin is None else self.end - self.begin
+
+
+class Cell:
+    """State of the worker for one cell."""
+
+    __slots__ = ('row', 'col', 'state', 'step', 'neighbors', 'states')
+
+    def __init__(self, row, col, state, neighbors):
+        self.row = row
+        self.col = col
+        self.state = state
+        # This is the step for which we last computed our state, and for
+        # which we're collecting the states of our neighbors.
+        self.step = 0
+        self.neighbors = {n: i for i, n in enumerate(neighbors)}
+        # Once we know all our neighbors' states at step N - 1, we compute
+        # and send our state at step N. At this point, our neighbors can send
+        # their states at steps N and N + 1, but not N + 2, since that
+        # requires our state at step N + 1. We only need to keep track of two
+        # sets of states.
+        n = len(self.neighbors)
+        self.states = [[None] * n, [None] * n]
+
+    def receive(self, step, row, col, state):
+        """Record the state of a neighbor. Return True when we can step."""
+        target = step % 2
+        states = self.states[target]
+        states[self.neighbors[(row, col)]] = bool(state)
+        if None in states:
+            return False
+        assert step == self.step
+        self.step += 1
+        alive = states.count(True)
+        self.state = alive == 3 or (self.state and alive == 2)
+        self.states[target] = [None] * len(states)
+        return True
+
+
+@asyncio.coroutine
+def run_engine(size, wrap, speed, steps=None, bitmap=None):
+    """Let the server compute the game. Return its statistics."""
+    ws = yield from websockets.connect(BASE_URL + '/engine/')
+    yield from ws.send(json.dumps({
+        'size': size,
+        'wrap': wrap,
+        'speed': speed,
+        'steps': steps,
+        'pattern': bitmap is not None,
+    }))
+    if bitmap is not None:
+        yield from ws.send(bitmap)
+    msg = yield from ws.recv()
     yield from ws.close()
+    return None if msg is None else json.loads(msg)
+
+
+@asyncio.coroutine
+def connect(uri):
+    global handshakes
+    if handshakes is None:
+        handshakes = asyncio.Semaphore(MAX_HANDSHAKES)
+    with (yield from handshakes):
+        return (yield from websockets.connect(uri))
 
 
 def get_neighbors(row, col, size, wrap):
@@ -4,12 +4,22 @@ import asyncio
 
 from django.core.management.base import CommandError, NoArgsCommand
 
-from ...client import reset, run
+from ...client import reset, run_engine, run_many
+from ...engine import encode_states
 
 
 class Command(NoArgsCommand):
 
     option_list = NoArgsCommand.option_list + (
+        make_option('-b', '--binary', default='text',
+                    action='store_const', const='binary', dest='fmt',
+                    help='Exchange binary state updates with the server.'),
+        make_option('-c', '--connections', type='int', default=None,
+                    help='The number of connections, shared by the workers. '
+                         'Defaults to one for each cell.'),
+        make_option('-e', '--engine', default=False, action='store_true',
+                    help='Compute the game on the server instead of running '
+                         'one worker for each cell.'),
         make_option('-C', '--no-center', default=True,
                     action='store_false', dest='center',
                     help='Do not center the pattern in the grid.'),
@@ -18,7 +28,8 @@ class Command(NoArgsCommand):
         make_option('-s', '--size', type='int', default=32,
                     help='The size of the grid.'),
         make_option('-l', '--speed', type='float', default=1.0,
-                    help='The maximum number of steps per second.'),
+                    help='The maximum number of steps per second, or 0 to '
+                         'run as fast as possible.'),
         make_option('-n', '--steps', type='int', default=None,
                     help='The number of steps.'),
         make_option('-W', '--no-wrap', default=True,
@@ -29,25 +40,67 @@ class Command(NoArgsCommand):
 
     def handle_noargs(self, **options):
         center = options['center']
+        connections = options['connections']
+        engine = options['engine']
+        fmt = options['fmt']
         pattern = options['pattern']
         size = options['size']
         speed = options['speed']
         steps = options['steps']
         wrap = options['wrap']
 
+        if engine:
+            bitmap = None
+            if pattern is not None:
+                bitmap = encode_states(self.parse_pattern(pattern, size, center))
+            try:
+                result = asyncio.get_event_loop().run_until_complete(
+                    run_engine(size, wrap, speed, steps, bitmap))
+            except KeyboardInterrupt:
+                return
+            if result is not None:
+                self.report(result)
+            return
+
         if pattern is None:
-            states = [[None] * size] * size
+            states = {}
         else:
-            states = self.parse_pattern(pattern, size, center)
+            rows = self.parse_pattern(pattern, size, center)
+            states = {(row, col): rows[row][col]
+                      for row in range(size) for col in range(size)}
 
-        clients = [run(row, col, size, wrap, speed, steps, states[row][col])
-                   for row in range(size) for col in range(size)]
+        # Give each connection a contiguous block of cells, in row-major
+        # order, to keep most neighbors on the same connection.
+        cells = [(row, col) for row in range(size) for col in range(size)]
+        if connections is None:
+            connections = len(cells)
+        if not 1 <= connections <= len(cells):
+            raise CommandError(
+                "The number of connections must be between 1 and {}."
+                .format(len(cells)))
+        bounds = [len(cells) * i // connections
+                  for i in range(connections + 1)]
+        clients = [run_many(cells[start:end], size, wrap, speed, steps,
+                            states, fmt)
+                   for start, end in zip(bounds, bounds[1:])]
 
         try:
             asyncio.get_event_loop().run_until_complete(reset(size))
-            asyncio.get_event_loop().run_until_complete(asyncio.wait(clients))
+            results = asyncio.get_event_loop().run_until_complete(
+                asyncio.gather(*clients))
         except KeyboardInterrupt:
-            pass
+            return
+        # A step is complete once all connections sent it.
+        self.report({
+            'steps': min(result['steps'] for result in results),
+            'duration': max(result['duration'] for result in results),
+        })
+
+    def report(self, result):
+        if result['duration']:
+            self.stdout.write("{} steps in {:.3f}s: {:.1f} steps/s\n".format(
+                result['steps'], result['duration'],
+                result['steps'] / result['duration']))
 
     def parse_pattern(self, pattern, size, center):
         with open(pattern) as handle:
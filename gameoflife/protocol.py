@@ -0,0 +1,71 @@
+"""
+Wire formats for state updates exchanged by workers, the server and watchers.
+
+Workers start by announcing the cells they run, and whether the grid wraps
+around, in a JSON object: {"cells": [<index>, ...], "wrap": <bool>}. Cells
+are identified by their index in row-major order.
+
+An update is a (step, row, col, state) tuple. The text format is a space-
+separated string. The binary format is a fixed-width struct, sent in binary
+WebSocket frames: it's shorter and cheaper to parse.
+
+Watchers can also receive one snapshot of the grid per step, always in binary
+format: a header with the kind of snapshot and the step, followed by either a
+bitmap of the grid or the indices of the cells that changed.
+"""
+
+import json
+import struct
+
+FORMATS = ('text', 'binary')
+
+UPDATE = struct.Struct('!IHHB')
+
+SNAPSHOT = struct.Struct('!BI')
+BITMAP = 0
+DELTA = 1
+
+
+def encode_update(step, row, col, state, fmt='text'):
+    if fmt == 'binary':
+        return UPDATE.pack(step, row, col, state)
+    return '{} {} {} {}'.format(step, row, col, int(state))
+
+
+def decode_update(msg):
+    if isinstance(msg, bytes):
+        return UPDATE.unpack(msg)
+    step, row, col, state = msg.split()
+    return int(step), int(row), int(col), int(state)
+
+
+def decode_hello(msg, size):
+    """
+    Return the cells and the wrap flag announced by a worker.
+
+    Raise ValueError if they aren't valid for a grid of ``size`` x ``size``.
+    """
+    hello = json.loads(msg)
+    if not isinstance(hello, dict):
+        raise ValueError("Expected an object")
+    cells, wrap = hello.get('cells'), hello.get('wrap')
+    if not isinstance(cells, list) or not cells:
+        raise ValueError("Expected a non-empty list of cells")
+    for cell in cells:
+        # bool is a subclass of int.
+        if type(cell) is not int or not 0 <= cell < size * size:
+            raise ValueError("Invalid cell: {!r}".format(cell))
+    if len(set(cells)) != len(cells):
+        raise ValueError("Duplicate cells")
+    if not isinstance(wrap, bool):
+        raise ValueError("Expected a boolean wrap flag")
+    return cells, wrap
+
+
+def encode_bitmap(step, bitmap):
+    return SNAPSHOT.pack(BITMAP, step) + bitmap
+
+
+def encode_delta(step, changes):
+    return SNAPSHOT.pack(DELTA, step) + struct.pack(
+        '!{}I'.format(len(changes)), *changes)
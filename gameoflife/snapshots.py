@@ -0,0 +1,55 @@
+class Snapshots:
+    """
+    Collect the states of all cells into one snapshot per step.
+
+    A snapshot is a bitmap of the grid, with one bit per cell in row-major
+    order, and the list of indices of cells that changed since the previous
+    snapshot. Steps complete in order since each worker sends its updates in
+    order and can't run ahead of its neighbors.
+
+    Changes are computed against the last complete snapshot, initially an
+    empty grid, so that a watcher that starts from ``bitmap`` and applies
+    every delta afterwards always has the right state.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.cells = size * size
+        self.pending = {}
+        # Last complete snapshot, for watchers that join during a game.
+        self.step = 0
+        self.bitmap = bytes((self.cells + 7) // 8)
+
+    def update(self, step, row, col, state):
+        """
+        Record the state of a cell at a step.
+
+        Return a (step, bitmap, changes) tuple when this completes the step.
+        """
+        index = row * self.size + col
+        pending = self.pending.get(step)
+        if pending is None:
+            pending = self.pending[step] = [
+                bytearray((self.cells + 7) // 8), self.cells]
+        bitmap = pending[0]
+        if state:
+            bitmap[index >> 3] |= 0x80 >> (index & 7)
+        pending[1] -= 1
+        if pending[1] == 0:
+            # Steps that started before collecting began can't complete.
+            for old_step in [s for s in self.pending if s <= step]:
+                del self.pending[old_step]
+            changes = diff(self.bitmap, bitmap)
+            self.step, self.bitmap = step, bytes(bitmap)
+            return step, self.bitmap, changes
+
+
+def diff(old, new):
+    """Return the indices of the bits that differ between two bitmaps."""
+    changes = []
+    for offset, (old_byte, new_byte) in enumerate(zip(old, new)):
+        changed = old_byte ^ new_byte
+        if changed:
+            changes.extend(offset * 8 + bit for bit in range(8)
+                           if changed & (0x80 >> bit))
+    return changes
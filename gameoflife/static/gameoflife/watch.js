@@ -1,13 +1,128 @@
 window.onload = function () {
-    var ws = new WebSocket("ws://" + window.location.host + window.location.pathname + "watcher/");
+    // Pick a mode with ?mode=cells|bitmap|delta. Batched modes receive one
+    // snapshot per step instead of one update per cell.
+    var mode = (/[?&]mode=(\w+)/.exec(window.location.search) || [null, "delta"])[1],
+        path = mode === "cells" ? "watcher/binary/" : "watcher/" + mode + "/",
+        ws = new WebSocket("ws://" + window.location.host + window.location.pathname + path),
+        // Large grids are drawn on a canvas, with one pixel per cell.
+        canvas = document.getElementsByTagName("canvas")[0],
+        context = canvas ? canvas.getContext("2d") : null,
+        rows = document.getElementsByTagName("tr"),
+        size = canvas ? canvas.width : rows.length,
+        squares = [],
+        states = new Uint8Array(size * size),
+        dirty = [],
+        step = 0,
+        scheduled = false;
+
+    for (var row = 0; row < rows.length; row++) {
+        var cells = rows[row].getElementsByTagName("td");
+        for (var col = 0; col < size; col++) {
+            squares.push(cells[col]);
+        }
+    }
+
+    function color(step, state) {
+        var hue = step * 20 % 256,
+            lum = state ? 25 : 95;
+        return 'hsl(' + hue + ', 100%, ' + lum + '%)';
+    }
+
+    function paint() {
+        var alive = color(step, 1),
+            dead = color(step, 0),
+            i, index;
+        if (context) {
+            // Minimize changes of fillStyle, which are expensive.
+            for (var state = 0; state < 2; state++) {
+                context.fillStyle = state ? alive : dead;
+                for (i = 0; i < dirty.length; i++) {
+                    index = dirty[i];
+                    if (states[index] === state) {
+                        context.fillRect(index % size, (index / size) | 0, 1, 1);
+                    }
+                }
+            }
+        } else {
+            for (i = 0; i < dirty.length; i++) {
+                index = dirty[i];
+                squares[index].style.backgroundColor = states[index] ? alive : dead;
+            }
+        }
+        dirty = [];
+        scheduled = false;
+    }
+
+    function schedule() {
+        if (!scheduled) {
+            scheduled = true;
+            window.requestAnimationFrame(paint);
+        }
+    }
+
+    function update(data) {
+        var row, col, state;
+        if (typeof data === "string") {
+            var bits = data.split(' ');
+            step = parseInt(bits[0], 10);
+            row = parseInt(bits[1], 10);
+            col = parseInt(bits[2], 10);
+            state = parseInt(bits[3], 2);
+        } else {
+            // Binary updates are packed as step (uint32), row (uint16),
+            // col (uint16) and state (uint8), in network byte order.
+            var view = new DataView(data);
+            step = view.getUint32(0);
+            row = view.getUint16(4);
+            col = view.getUint16(6);
+            state = view.getUint8(8);
+        }
+        var index = row * size + col;
+        states[index] = state;
+        dirty.push(index);
+        schedule();
+    }
+
+    function snapshot(data) {
+        // Snapshots start with kind (uint8) and step (uint32).
+        var view = new DataView(data),
+            kind = view.getUint8(0),
+            index, i;
+        step = view.getUint32(1);
+        if (kind === 0) {
+            // Bitmap: one bit per cell, in row-major order. It replaces the
+            // whole grid, for instance after a reset.
+            var bytes = new Uint8Array(data, 5);
+            if (bytes.length !== (states.length + 7) >> 3) {
+                // The grid was reset to another size: redraw the page.
+                ws.onmessage = null;
+                window.location.reload();
+                return;
+            }
+            for (index = 0; index < states.length; index++) {
+                var state = (bytes[index >> 3] >> (7 - (index & 7))) & 1;
+                if (state !== states[index]) {
+                    states[index] = state;
+                    dirty.push(index);
+                }
+            }
+        } else {
+            // Delta: indices of cells that changed (uint32).
+            for (i = 5; i < data.byteLength; i += 4) {
+                index = view.getUint32(i);
+                states[index] ^= 1;
+                dirty.push(index);
+            }
+        }
+        schedule();
+    }
+
+    ws.binaryType = "arraybuffer";
     ws.onmessage = function(e) {
-        var bits = e.data.split(' '),
-            step = parseInt(bits[0], 10),
-            square = document.getElementById(bits[1] + '-' + bits[2]),
-            state = parseInt(bits[3], 2),
-            hue = step * 20 % 256,
-            lum = state ? 25 : 95,
-            color = 'hsl(' + hue + ', 100%, ' + lum + '%)';
-        square.style.backgroundColor = color;
+        if (mode === "cells") {
+            update(e.data);
+        } else {
+            snapshot(e.data);
+        }
     };
 };
@@ -0,0 +1,102 @@
+import array
+import itertools
+
+
+class Connection:
+    """Connection of a worker to the server."""
+
+    __slots__ = ('id', 'ws', 'fmt', 'cells')
+
+    def __init__(self, id, ws, fmt):
+        self.id = id
+        self.ws = ws
+        self.fmt = fmt
+        self.cells = set()
+
+
+class SubscriptionIndex:
+    """
+    Map each cell of the grid to the connections subscribed to its updates.
+
+    Subscriptions are stored as integer connection ids in a flat array with
+    ``width`` slots per cell, keyed by ``row * size + col``. Slots are filled
+    from the start and ``0`` marks the end. Cells with more subscribers than
+    slots spill into a dict; that doesn't happen with eight neighbors.
+    """
+
+    def __init__(self, size, width=8):
+        self.size = size
+        self.width = width
+        self.ids = itertools.count(1)
+        self.clear()
+
+    def clear(self):
+        """Drop all connections and subscriptions at once."""
+        self.connections = {}
+        self.slots = array.array('i', [0]) * (self.size * self.size * self.width)
+        self.overflow = {}
+
+    def connect(self, ws, fmt='text'):
+        connection = Connection(next(self.ids), ws, fmt)
+        self.connections[connection.id] = connection
+        return connection
+
+    def disconnect(self, connection):
+        for index in connection.cells:
+            self._remove(index, connection.id)
+        connection.cells = set()
+        self.connections.pop(connection.id, None)
+
+    def subscribe(self, connection, row, col):
+        index = row * self.size + col
+        if index in connection.cells:
+            return
+        start = index * self.width
+        for slot in range(start, start + self.width):
+            if not self.slots[slot]:
+                self.slots[slot] = connection.id
+                break
+        else:
+            self.overflow.setdefault(index, []).append(connection.id)
+        connection.cells.add(index)
+
+    def unsubscribe(self, connection, row, col):
+        index = row * self.size + col
+        if index in connection.cells:
+            self._remove(index, connection.id)
+            connection.cells.remove(index)
+
+    def subscribers(self, row, col):
+        """Iterate over connections subscribed to updates of a cell."""
+        index = row * self.size + col
+        start = index * self.width
+        connections = self.connections
+        for id in self.slots[start:start + self.width]:
+            if not id:
+                return
+            yield connections[id]
+        for id in self.overflow.get(index, ()):
+            yield connections[id]
+
+    def _remove(self, index, id):
+        overflow = self.overflow.get(index)
+        if overflow is not None and id in overflow:
+            overflow.remove(id)
+            if not overflow:
+                del self.overflow[index]
+            return
+        start = index * self.width
+        slot = last = start
+        while last < start + self.width and self.slots[last]:
+            if self.slots[last] == id:
+                slot = last
+            last += 1
+        # Keep slots packed by moving the last subscriber into the hole.
+        last -= 1
+        self.slots[slot] = self.slots[last]
+        self.slots[last] = 0
+        # Pull a spilled subscriber back into the array if there is one.
+        if overflow:
+            self.slots[last] = overflow.pop()
+            if not overflow:
+                del self.overflow[index]
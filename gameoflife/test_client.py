@@ -0,0 +1,80 @@
+from django.test import SimpleTestCase
+
+from .client import Cell, Scheduler, get_neighbors
+
+
+class CellTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cell = Cell(1, 1, False, get_neighbors(1, 1, 3, False))
+
+    def receive(self, step, alive):
+        results = []
+        for index, neighbor in enumerate(sorted(self.cell.neighbors)):
+            results.append(self.cell.receive(step, *neighbor,
+                                             state=index < alive))
+        return results
+
+    def test_waits_for_all_neighbors(self):
+        self.assertEqual(self.receive(0, 3), [False] * 7 + [True])
+        self.assertEqual(self.cell.step, 1)
+
+    def test_birth_and_survival(self):
+        self.receive(0, 3)
+        self.assertTrue(self.cell.state)
+        self.receive(1, 2)
+        self.assertTrue(self.cell.state)
+        self.receive(2, 4)
+        self.assertFalse(self.cell.state)
+        self.assertEqual(self.cell.step, 3)
+
+    def test_neighbors_run_one_step_ahead(self):
+        neighbors = sorted(self.cell.neighbors)
+        self.cell.receive(1, *neighbors[0], state=True)
+        self.receive(0, 3)
+        self.assertEqual(self.cell.step, 1)
+        # The update for step 1 received early is kept.
+        self.assertTrue(self.cell.states[1][self.cell.neighbors[neighbors[0]]])
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100
+
+    def time(self):
+        return self.now
+
+
+class SchedulerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_deadlines_spread_over_interval(self):
+        scheduler = Scheduler(2, 4, 4, self.clock)
+        self.assertEqual([scheduler.delay(index, 0) for index in range(4)],
+                         [0, 0.125, 0.25, 0.375])
+        self.assertEqual(scheduler.delay(0, 3), 1.5)
+
+    def test_no_drift(self):
+        scheduler = Scheduler(2, 1, 1, self.clock)
+        # Step 1 took longer than expected: step 2 is still due at 1s.
+        self.clock.now += 0.7
+        self.assertAlmostEqual(scheduler.delay(0, 2), 0.3)
+        self.assertLess(scheduler.delay(0, 1), 0)
+
+    def test_max_speed(self):
+        for speed in (0, float('inf')):
+            scheduler = Scheduler(speed, 1, 1, self.clock)
+            self.assertEqual(scheduler.delay(0, 1000), 0)
+
+    def test_achieved_speed(self):
+        scheduler = Scheduler(0, 2, 4, self.clock)
+        self.assertEqual((scheduler.steps, scheduler.duration), (0, 0))
+        for step in range(4):
+            self.clock.now += 0.25
+            scheduler.sent()
+            scheduler.sent()
+        self.assertEqual(scheduler.steps, 3)
+        self.assertEqual(scheduler.duration, 0.75)
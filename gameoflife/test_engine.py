@@ -0,0 +1,75 @@
+import random
+import unittest
+
+from django.test import SimpleTestCase
+
+from . import engine
+from .engine import Engine, encode_states
+
+
+def parse(rows):
+    return [[char == 'x' for char in row] for row in rows]
+
+
+class EngineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.numpy = engine.numpy
+
+    def tearDown(self):
+        engine.numpy = self.numpy
+
+    def check_blinker(self):
+        game = Engine(3, False, encode_states(parse(['...', 'xxx', '...'])))
+        self.assertEqual(game.bitmap(), encode_states(parse(['...', 'xxx', '...'])))
+        self.assertEqual(list(game.changes), [3, 4, 5])
+        game.advance()
+        self.assertEqual(game.step, 1)
+        self.assertEqual(game.bitmap(), encode_states(parse(['.x.', '.x.', '.x.'])))
+        self.assertEqual(list(game.changes), [1, 3, 5, 7])
+        self.assertEqual(game.delta(), b'\0\0\0\1\0\0\0\3\0\0\0\5\0\0\0\7')
+
+    def check_glider(self, wrap):
+        rows = ['.x....', '..x...', 'xxx...', '......', '......', '......']
+        game = Engine(6, wrap, encode_states(parse(rows)))
+        # After 4 steps, the glider moved by one cell down and right.
+        for _ in range(4):
+            game.advance()
+        shifted = ['......', '..x...', '...x..', '.xxx..', '......', '......']
+        self.assertEqual(game.bitmap(), encode_states(parse(shifted)))
+        # After 24 steps, it's back to its initial position if the grid wraps.
+        for _ in range(20):
+            game.advance()
+        if wrap:
+            self.assertEqual(game.bitmap(), encode_states(parse(rows)))
+        else:
+            self.assertNotEqual(game.bitmap(), encode_states(parse(rows)))
+
+    def test_python(self):
+        engine.numpy = None
+        self.check_blinker()
+        self.check_glider(True)
+        self.check_glider(False)
+
+    @unittest.skipIf(engine.numpy is None, "NumPy isn't installed")
+    def test_numpy(self):
+        self.check_blinker()
+        self.check_glider(True)
+        self.check_glider(False)
+
+    @unittest.skipIf(engine.numpy is None, "NumPy isn't installed")
+    def test_numpy_matches_python(self):
+        for size in (1, 2, 8):
+            for wrap in (True, False):
+                bitmap = encode_states([[random.random() < 0.4
+                                         for _ in range(size)]
+                                        for _ in range(size)])
+                vectorized = Engine(size, wrap, bitmap)
+                engine.numpy = None
+                reference = Engine(size, wrap, bitmap)
+                engine.numpy = self.numpy
+                for _ in range(4):
+                    vectorized.advance()
+                    reference.advance()
+                    self.assertEqual(vectorized.delta(), reference.delta())
+                self.assertEqual(vectorized.bitmap(), reference.bitmap())
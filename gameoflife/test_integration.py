@@ -27,3 +27,5 @@ class IntegrationTests(SeleniumTestCase):
 
         call_command('gameoflife', size=5, speed=100, steps=5,
                                    pattern='gameoflife/patterns/blinker')
+
+        call_command('gameoflife', size=5, speed=100, steps=5, fmt='binary')
@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase
+
+from .protocol import decode_hello
+
+
+class HelloTests(SimpleTestCase):
+
+    def test_valid(self):
+        self.assertEqual(decode_hello('{"cells": [0, 3], "wrap": true}', 2),
+                         ([0, 3], True))
+
+    def test_invalid(self):
+        for msg in [
+            'not json',
+            '[0, 1]',
+            '{"wrap": true}',
+            '{"cells": [], "wrap": true}',
+            '{"cells": [4], "wrap": true}',
+            '{"cells": [-1], "wrap": true}',
+            '{"cells": ["0"], "wrap": true}',
+            '{"cells": [true], "wrap": true}',
+            '{"cells": [1, 1], "wrap": true}',
+            '{"cells": [1]}',
+            '{"cells": [1], "wrap": 1}',
+        ]:
+            with self.assertRaises(ValueError, msg=msg):
+                decode_hello(msg, 2)
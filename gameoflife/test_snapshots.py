@@ -0,0 +1,41 @@
+from django.test import SimpleTestCase
+
+from .snapshots import Snapshots
+
+
+class SnapshotsTests(SimpleTestCase):
+
+    def test_snapshots(self):
+        snapshots = Snapshots(3)
+        # Blinker, horizontal then vertical.
+        step0 = [(0, 1, 0, 1), (0, 1, 1, 1), (0, 1, 2, 1)]
+        step1 = [(1, 0, 1, 1), (1, 1, 1, 1), (1, 2, 1, 1)]
+        for step, cells in ((0, step0), (1, step1)):
+            alive = {(row, col) for _, row, col, _ in cells}
+            for row in range(3):
+                for col in range(3):
+                    result = snapshots.update(step, row, col, (row, col) in alive)
+            self.assertIsNotNone(result)
+
+        self.assertEqual(snapshots.step, 1)
+        # 010 010 010 -> 0100 1001 0...
+        self.assertEqual(snapshots.bitmap, b'\x49\x00')
+        self.assertEqual(result, (1, b'\x49\x00', [1, 3, 5, 7]))
+
+    def test_incomplete_step(self):
+        snapshots = Snapshots(2)
+        self.assertIsNone(snapshots.update(0, 0, 0, 1))
+        self.assertIsNone(snapshots.update(1, 0, 0, 0))
+        self.assertIsNone(snapshots.update(0, 0, 1, 0))
+        self.assertIsNone(snapshots.update(0, 1, 0, 0))
+        self.assertEqual(snapshots.update(0, 1, 1, 0), (0, b'\x80', [0]))
+
+    def test_changes_since_last_snapshot(self):
+        snapshots = Snapshots(2)
+        # Collecting starts in the middle of step 5, which never completes.
+        self.assertIsNone(snapshots.update(5, 0, 0, 1))
+        for row, col, state in [(0, 0, 1), (0, 1, 0), (1, 0, 0), (1, 1, 0)]:
+            result = snapshots.update(6, row, col, state)
+        # Cell 0 changed since the empty grid that watchers start from.
+        self.assertEqual(result, (6, b'\x80', [0]))
+        self.assertEqual(snapshots.pending, {})
@@ -0,0 +1,53 @@
+from django.test import SimpleTestCase
+
+from .subscriptions import SubscriptionIndex
+
+
+class SubscriptionIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = SubscriptionIndex(4, width=2)
+        self.conns = [self.index.connect(object()) for _ in range(3)]
+
+    def subscribers(self, row, col):
+        return {conn.id for conn in self.index.subscribers(row, col)}
+
+    def test_subscribe(self):
+        conn1, conn2, _ = self.conns
+        self.index.subscribe(conn1, 1, 2)
+        self.index.subscribe(conn2, 1, 2)
+        self.index.subscribe(conn2, 1, 2)
+        self.assertEqual(self.subscribers(1, 2), {conn1.id, conn2.id})
+        self.assertEqual(self.subscribers(2, 1), set())
+
+    def test_unsubscribe(self):
+        conn1, conn2, _ = self.conns
+        self.index.subscribe(conn1, 1, 2)
+        self.index.subscribe(conn2, 1, 2)
+        self.index.unsubscribe(conn1, 1, 2)
+        self.assertEqual(self.subscribers(1, 2), {conn2.id})
+
+    def test_overflow(self):
+        for conn in self.conns:
+            self.index.subscribe(conn, 3, 3)
+        self.assertEqual(self.subscribers(3, 3), {conn.id for conn in self.conns})
+        self.index.unsubscribe(self.conns[0], 3, 3)
+        self.assertEqual(self.subscribers(3, 3), {self.conns[1].id, self.conns[2].id})
+        self.assertEqual(self.index.overflow, {})
+
+    def test_disconnect(self):
+        conn1, conn2, _ = self.conns
+        self.index.subscribe(conn1, 0, 0)
+        self.index.subscribe(conn1, 0, 1)
+        self.index.subscribe(conn2, 0, 1)
+        self.index.disconnect(conn1)
+        self.assertEqual(self.subscribers(0, 0), set())
+        self.assertEqual(self.subscribers(0, 1), {conn2.id})
+        self.assertNotIn(conn1.id, self.index.connections)
+
+    def test_clear(self):
+        conn1, _, _ = self.conns
+        self.index.subscribe(conn1, 0, 0)
+        self.index.clear()
+        self.assertEqual(self.subscribers(0, 0), set())
+        self.assertEqual(self.index.connections, {})
@@ -4,6 +4,10 @@ from django.conf.urls import patterns, url
 urlpatterns = patterns('gameoflife.views',
     url(r'^$', 'watch'),
     url(r'^watcher/$', 'watcher'),
+    url(r'^watcher/(?P<fmt>text|binary)/$', 'watcher'),
+    url(r'^watcher/(?P<mode>bitmap|delta)/$', 'watcher'),
     url(r'^reset/$', 'reset'),
+    url(r'^engine/$', 'engine'),
     url(r'^worker/$', 'worker'),
+    url(r'^worker/(?P<fmt>text|binary)/$', 'worker'),
 )
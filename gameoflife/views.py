@@ -1,98 +1,363 @@
-import itertools
+import json
+import uuid
 
 import asyncio
 
 from django.conf import settings
 from django.shortcuts import render
 
-from c10ktools.http import websocket
+from c10ktools.bus import get_bus
+from c10ktools.http import Broadcaster, encode_frame, websocket
+from c10ktools.http.broadcast import COALESCE, DISCONNECT
 
-# Server-wide state used by the watchers
-global_subscribers = set()
+from .client import get_neighbors
+from .engine import Engine
+from .protocol import (
+    DELTA, FORMATS, SNAPSHOT, decode_hello, decode_update, encode_bitmap,
+    encode_delta, encode_update)
+from .snapshots import Snapshots
+from .subscriptions import SubscriptionIndex
+
+# Topics on the message bus shared by server processes. Each process
+# subscribes to the cells its workers are interested in, and to all cells
+# while it has watchers.
+RESET = 'gameoflife.reset'
+CELL = 'gameoflife.cell.'
+# Snapshots computed by an engine: a bitmap followed by a delta.
+ENGINE = 'gameoflife.engine'
+
+# Engines only compute snapshots: close watchers of updates of cells.
+ENGINE_ONLY = "Engine games require the bitmap or delta mode"
+
+# Grids larger than this are drawn on a canvas rather than with a table.
+MAX_TABLE_SIZE = 128
+
+# Grid state, kept in sync between processes through the bus
+bus = None
 size = 32
+generation = None
+resets = {}
+
+# Process-wide state used by the workers
+connected = 0
+subscribers = SubscriptionIndex(size)
+cell_topics = set()
+
+# Process-wide state used by the watchers, by wire format or snapshot mode
+global_subscribers = {fmt: set() for fmt in FORMATS}
+snapshot_subscribers = {'bitmap': set(), 'delta': set()}
+snapshots = Snapshots(size)
+# Last step of an engine relayed to the watchers, None outside engine games.
+engine_step = None
+
+# Workers can't skip a step: disconnect those that fall too far behind.
+# Watchers only care about the latest state of each cell: replace stale
+# updates of a cell with newer ones instead.
+# Deltas are useless once one is missing: treat them like workers.
+relay = Broadcaster(max_queue=64, policy=DISCONNECT)
+broadcast = Broadcaster(max_queue=1024, policy=COALESCE)
+deltas = Broadcaster(max_queue=64, policy=DISCONNECT)
+
+
+def attach():
+    """Connect this process to the bus, if it isn't connected yet."""
+    global bus
+    if bus is None:
+        bus = get_bus()
+        bus.subscribe(RESET, on_reset)
+    return bus
+
 
 def watch(request):
+    attach()
     context = {
+        'canvas': size > MAX_TABLE_SIZE,
         'size': size,
         'sizelist': list(range(size)),
     }
     return render(request, 'gameoflife/watch.html', context)
 
 
-@websocket
-def watcher(ws):
+# Updates and snapshots are repetitive: compress them for browsers.
+@websocket(compress=True)
+def watcher(ws, fmt='text', mode=None):
+    attach()
     debug("Watcher connected")
-    global_subscribers.add(ws)
-    # Block until the client goes away
-    yield from ws.recv()
-    global_subscribers.remove(ws)
+    if mode is None and engine_step is not None:
+        yield from ws.close(1008, ENGINE_ONLY)
+        return
+    if not watching():
+        start_watching()
+    if mode is None:
+        # Receive one update per cell per step.
+        watchers = global_subscribers[fmt]
+    else:
+        # Receive one snapshot per step. Start from the latest bitmap, which
+        # the next delta is relative to.
+        watchers = snapshot_subscribers[mode]
+        keyframe = encode_bitmap(snapshots.step, snapshots.bitmap)
+        (deltas if mode == 'delta' else broadcast).send([ws], keyframe)
+    watchers.add(ws)
+    # Block until the client goes away, or the heartbeat reaps the connection.
+    while (yield from ws.recv()) is not None:
+        pass
+    watchers.remove(ws)
+    broadcast.discard(ws)
+    deltas.discard(ws)
+    if not watching():
+        stop_watching()
     debug("Watcher disconnected")
 
 
 @websocket
-# Server-wide state
 def reset(ws):
-    global size, expected, connected, subscribed, sub_latch, run_latch, subscribers
-    size = int((yield from ws.recv()))
-    expected = size * size
-    connected = 0
-    subscribed = 0
-    sub_latch = asyncio.Future()
-    run_latch = asyncio.Future()
-    subscribers = [[set() for col in range(size)] for row in range(size)]
+    new_size = int((yield from ws.recv()))
+    yield from reset_grid(new_size)
 
 
 @websocket
-def worker(ws):
-    global connected, subscribed
-
-    # Wait until all clients are connected.
-    connected += 1
-    if connected == expected:
-        debug("{:5} workers connected".format(connected))
-        debug("Telling workers to subscribe")
-        sub_latch.set_result(None)
-    elif connected % 100 == 0:
-        debug("{:5} workers connected".format(connected))
-    yield from sub_latch
-    yield from ws.send('sub')
-
-    # Subscribe to updates sent by neighbors.
-    subscriptions = set()
-    while True:
-        msg = yield from ws.recv()
-        if msg == 'sub':
+def engine(ws):
+    """Compute the game on the server instead of with one worker per cell."""
+    config = json.loads((yield from ws.recv()))
+    bitmap = (yield from ws.recv()) if config.get('pattern') else None
+    yield from reset_grid(config['size'])
+    game = Engine(config['size'], config['wrap'], bitmap)
+    steps = config.get('steps')
+    interval = 1 / config['speed'] if config.get('speed') else 0
+    debug("Engine running")
+
+    loop = asyncio.get_event_loop()
+    begin = deadline = loop.time()
+    while ws.open:
+        # Publish both snapshots at once so new watchers can't miss a delta.
+        bus.publish(ENGINE, encode_bitmap(game.step, game.bitmap()) +
+                    SNAPSHOT.pack(DELTA, game.step) + game.delta())
+        if steps is not None and game.step >= steps:
             break
-        row, col = msg.split()
-        row, col = int(row), int(col)
-        subscriptions.add((row, col))
-        subscribers[row][col].add(ws)
-
-    # Wait until all clients are subscribed.
-    subscribed += 1
-    if subscribed == expected:
-        debug("{:5} workers subscribed".format(subscribed))
-        debug("Telling workers to run")
-        run_latch.set_result(None)
-    elif subscribed % 100 == 0:
-        debug("{:5} workers subscribed".format(subscribed))
-    yield from run_latch
+        # Don't block the event loop while computing large grids.
+        yield from loop.run_in_executor(None, game.advance)
+        deadline += interval
+        yield from asyncio.sleep(max(deadline - loop.time(), 0))
+
+    duration = loop.time() - begin
+    debug("Engine stopped after {} steps in {:.3f}s".format(
+        game.step, duration))
+    if ws.open:
+        yield from ws.send(json.dumps(
+            {'steps': game.step, 'duration': duration}))
+
+
+@websocket
+def worker(ws, fmt='text'):
+    """Relay updates for one or several cells sharing a connection."""
+    global connected
+    attach()
+    expected = size * size
+
+    # Subscribe to updates of the neighbors of the worker's cells.
+    hello = yield from ws.recv()
+    if hello is None:
+        return
+    if not isinstance(hello, str):
+        yield from ws.close(1003, "Expected a text message")
+        return
+    try:
+        cells, wrap = decode_hello(hello, size)
+    except ValueError as exc:
+        yield from ws.close(1008, str(exc)[:120])
+        return
+    index = subscribers
+    connection = index.connect(ws, fmt)
+    for neighbor in get_neighborhood(cells, wrap):
+        subscribe(index, connection, *divmod(neighbor, size))
+
+    # Wait until all clients are subscribed. The barrier counts cells.
+    previous, connected = connected, connected + len(cells)
+    if connected // 100 > previous // 100 or connected == expected:
+        debug("{:5} workers ready".format(connected))
+    yield from bus.barrier('gameoflife.ready', expected, len(cells),
+                           generation)
     yield from ws.send('run')
 
-    # Relay state updates to subscribers.
+    # Publish state updates to subscribers.
     while True:
         msg = yield from ws.recv()
         if msg is None:
             break
-        step, row, col, state = msg.split()
-        for subscriber in itertools.chain(
-                subscribers[int(row)][int(col)], global_subscribers):
-            if subscriber.open:
-                yield from subscriber.send(msg)
+        _, row, col, _ = decode_update(msg)
+        bus.publish(CELL + str(row * size + col), msg)
 
     # Unsubscribe from updates.
-    for row, col in subscriptions:
-        subscribers[row][col].remove(ws)
+    unsubscribe(index, connection)
+    relay.discard(ws)
+
+
+@asyncio.coroutine
+def reset_grid(new_size):
+    new_generation = uuid.uuid4().hex
+    resets[new_generation] = asyncio.Future()
+    attach().publish(RESET, '{} {}'.format(new_size, new_generation),
+                     retain=True)
+    # Wait until the reset went through the bus. Other processes get it at
+    # the same time.
+    try:
+        yield from resets[new_generation]
+    finally:
+        del resets[new_generation]
+
+
+def on_reset(topic, msg):
+    global size, generation, connected, subscribers, snapshots, engine_step
+    new_size, generation = msg.split()
+    size = int(new_size)
+    connected = 0
+    for cell_topic in cell_topics:
+        bus.unsubscribe(cell_topic, on_update)
+    cell_topics.clear()
+    subscribers = SubscriptionIndex(size)
+    snapshots = Snapshots(size)
+    engine_step = None
+    # Deltas of the new game are relative to an empty grid.
+    send_keyframe()
+    debug("Grid reset to {}x{}".format(size, size))
+    if generation in resets:
+        resets[generation].set_result(None)
+
+
+def get_neighborhood(cells, wrap):
+    """Return the neighbors of a group of cells outside of the group."""
+    group = set(cells)
+    neighborhood = set()
+    for cell in cells:
+        for row, col in get_neighbors(*divmod(cell, size), size=size,
+                                      wrap=wrap):
+            neighborhood.add(row * size + col)
+    return neighborhood - group
+
+
+def subscribe(index, connection, row, col):
+    topic = CELL + str(row * size + col)
+    if index is subscribers and topic not in cell_topics:
+        cell_topics.add(topic)
+        bus.subscribe(topic, on_update)
+    index.subscribe(connection, row, col)
+
+
+def unsubscribe(index, connection):
+    cells = connection.cells
+    index.disconnect(connection)
+    if index is not subscribers:
+        return
+    for cell in cells:
+        if next(index.subscribers(*divmod(cell, size)), None) is None:
+            topic = CELL + str(cell)
+            cell_topics.discard(topic)
+            bus.unsubscribe(topic, on_update)
+
+
+def on_update(topic, msg):
+    """Relay an update of a cell to the workers subscribed to it."""
+    update = decode_update(msg)
+    workers = {fmt: [] for fmt in FORMATS}
+    for connection in subscribers.subscribers(update[1], update[2]):
+        workers[connection.fmt].append(connection.ws)
+    for fmt in FORMATS:
+        if workers[fmt]:
+            relay.send_frame(workers[fmt], get_frame(msg, update, fmt))
+
+
+def on_watch(topic, msg):
+    """Relay an update of any cell to the watchers."""
+    if topic == ENGINE:
+        on_engine(msg)
+        return
+    if not topic.startswith(CELL):
+        return
+    update = decode_update(msg)
+    cell = update[1] * size + update[2]
+    for fmt in FORMATS:
+        if global_subscribers[fmt]:
+            broadcast.send_frame(global_subscribers[fmt],
+                                 get_frame(msg, update, fmt), cell)
+
+    snapshot = snapshots.update(*update)
+    if snapshot is not None:
+        step, bitmap, changes = snapshot
+        if snapshot_subscribers['bitmap']:
+            broadcast.send(snapshot_subscribers['bitmap'],
+                           encode_bitmap(step, bitmap))
+        if snapshot_subscribers['delta']:
+            deltas.send(snapshot_subscribers['delta'],
+                        encode_delta(step, changes))
+
+
+def on_engine(msg):
+    """Relay snapshots computed by an engine to the watchers."""
+    global engine_step
+    split = SNAPSHOT.size + (size * size + 7) // 8
+    bitmap, delta = msg[:split], msg[split:]
+    step = SNAPSHOT.unpack_from(bitmap)[1]
+    # The delta is relative to the previous step, or to an empty grid at step
+    # 0. If this process didn't relay the previous step, for instance because
+    # it just started watching, watchers don't have it: send the bitmap.
+    if step != 0 and (engine_step is None or step != engine_step + 1):
+        delta = bitmap
+    engine_step = step
+    # Keep the bitmap for watchers joining later.
+    snapshots.step, snapshots.bitmap = step, bitmap[SNAPSHOT.size:]
+    if snapshot_subscribers['bitmap']:
+        broadcast.send(snapshot_subscribers['bitmap'], bitmap)
+    if snapshot_subscribers['delta']:
+        deltas.send(snapshot_subscribers['delta'], delta)
+    for fmt in FORMATS:
+        for ws in global_subscribers[fmt]:
+            if ws.open:
+                asyncio.async(ws.close(1008, ENGINE_ONLY))
+
+
+def send_keyframe():
+    """Send the latest bitmap to all snapshot watchers."""
+    keyframe = encode_bitmap(snapshots.step, snapshots.bitmap)
+    if snapshot_subscribers['bitmap']:
+        broadcast.send(snapshot_subscribers['bitmap'], keyframe)
+    if snapshot_subscribers['delta']:
+        deltas.send(snapshot_subscribers['delta'], keyframe)
+
+
+def watching():
+    return (any(global_subscribers.values()) or
+            any(snapshot_subscribers.values()))
+
+
+def start_watching():
+    global snapshots
+    # Snapshots built while nobody was watching may be missing updates.
+    snapshots = Snapshots(size)
+    bus.subscribe('*', on_watch)
+
+
+def stop_watching():
+    global engine_step
+    bus.unsubscribe('*', on_watch)
+    engine_step = None
+
+
+# Frames for the last relayed message, shared by on_update and on_watch.
+last_message = None
+last_frames = {}
+
+
+def get_frame(msg, update, fmt):
+    """Return a frame for msg in fmt, encoding it only once."""
+    global last_message, last_frames
+    if msg is not last_message:
+        last_message, last_frames = msg, {}
+    frame = last_frames.get(fmt)
+    if frame is None:
+        if isinstance(msg, bytes) != (fmt == 'binary'):
+            msg = encode_update(*update, fmt=fmt)
+        frame = last_frames[fmt] = encode_frame(msg)
+    return frame
 
 
 def debug(message):